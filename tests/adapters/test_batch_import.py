@@ -1,6 +1,11 @@
+import gzip
+import lzma
 import pathlib
 from toolsaf.common.address import HWAddress, IPAddress
 from toolsaf.adapters.batch_import import BatchData, BatchImporter, FileMetaInfo, LabelFilter
+from toolsaf.adapters.capture_filter import CaptureFilter
+from toolsaf.adapters.capture_sampling import CaptureSampling
+from toolsaf.common.property import Properties
 from toolsaf.core.inspector import Inspector
 from tests.test_model import Setup, simple_setup_1
 
@@ -35,10 +40,71 @@ def test_import_batch_a_yes():
     assert len(conn) == 1
 
 
+def test_import_batch_capture_filter(tmp_path: pathlib.Path):
+    batch = tmp_path / "pcap-dns"
+    batch.mkdir()
+    (batch / "dns.pcap").write_bytes(pathlib.Path("tests/samples/pcap/dns.pcap").read_bytes())
+    (batch / "00meta.json").write_text('{"file_type": "capture", "capture_filter": "udp"}')
+    su = Setup_1()
+    BatchImporter(Inspector(su.get_system())).import_batch(tmp_path)
+    assert len(su.get_system().get_connections(relevant_only=False)) == 1
+
+    su = Setup_1()
+    bi = BatchImporter(Inspector(su.get_system()), capture_filter=CaptureFilter("not port 53"))
+    bi.import_batch(tmp_path)
+    assert len(su.get_system().get_connections(relevant_only=False)) == 0
+
+
+def test_import_batch_sampling(tmp_path: pathlib.Path):
+    batch = tmp_path / "pcap-dns"
+    batch.mkdir()
+    (batch / "dns.pcap").write_bytes(pathlib.Path("tests/samples/pcap/dns.pcap").read_bytes())
+    (batch / "00meta.json").write_text('{"file_type": "capture"}')
+    su = Setup_1()
+    bi = BatchImporter(Inspector(su.get_system()), sampling=CaptureSampling("packets=1"))
+    bi.import_batch(tmp_path)
+    assert len(su.get_system().get_connections(relevant_only=False)) == 1
+    partial = su.get_system().properties[Properties.PARTIAL.append_key("pcap-dns")]
+    assert partial.explanation == "PCAP reader: 1 of 1 packets used (packets=1), rest of capture not read"
+
+
+def test_import_batch_merge_files(tmp_path: pathlib.Path):
+    batch = tmp_path / "pcap-dns"
+    batch.mkdir()
+    for name in ["dns-1.pcap", "dns-2.pcap"]:
+        (batch / name).write_bytes(pathlib.Path("tests/samples/pcap/dns.pcap").read_bytes())
+    (batch / "00meta.json").write_text('{"file_type": "capture", "merge_files": true}')
+    su = Setup_1()
+    bi = BatchImporter(Inspector(su.get_system()))
+    bi.import_batch(tmp_path)
+    assert len(su.get_system().get_connections(relevant_only=False)) == 1
+    assert sorted(ev.base_ref for ev in bi.evidence["pcap-dns"]) == [
+        (batch / "dns-1.pcap").as_posix(), (batch / "dns-2.pcap").as_posix()]
+
+
+def test_import_batch_compressed(tmp_path: pathlib.Path):
+    batch = tmp_path / "pcap-dns"
+    batch.mkdir()
+    data = pathlib.Path("tests/samples/pcap/dns.pcap").read_bytes()
+    (batch / "dns-1.pcap.gz").write_bytes(gzip.compress(data))
+    (batch / "dns-2.pcap.xz").write_bytes(lzma.compress(data))
+    (batch / "00meta.json").write_text('{"file_type": "capture"}')
+    su = Setup_1()
+    bi = BatchImporter(Inspector(su.get_system()))
+    bi.import_batch(tmp_path)
+    assert len(su.get_system().get_connections(relevant_only=False)) == 1
+    assert sorted(ev.base_ref for ev in bi.evidence["pcap-dns"]) == [
+        (batch / "dns-1.pcap.gz").as_posix(), (batch / "dns-2.pcap.xz").as_posix()]
+
+
 def test_parse_from_json():
     json_data = {
         "file_type": "capture",
         "include": True,
+        "capture_filter": "not port 22",
+        "merge_files": True,
+        "sampling": "end=+10m,flows=10",
+        "options": {"decoder": "framing"},
         "addresses": {
             "1.2.3.4": "Device",
             "1:2:3:4:5:6|hw": "Device_2"
@@ -52,6 +118,10 @@ def test_parse_from_json():
     assert result.label == "pcap-x"
     assert result.file_type == "capture"
     assert result.default_include is True
+    assert result.capture_filter and result.capture_filter.expression == "not port 22"
+    assert result.options == {"decoder": "framing"}
+    assert result.merge_files
+    assert result.sampling and result.sampling.end_offset == 600 and result.sampling.flow_rate == 10
     assert len(result.source.address_map) == 2
     assert result.source.address_map[IPAddress.new("1.2.3.4")] == system.get_entity("Device 1")
     assert result.source.address_map[HWAddress.new("1:2:3:4:5:6")] == system.get_entity("Device 2")
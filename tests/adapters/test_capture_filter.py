@@ -0,0 +1,78 @@
+import struct
+
+import pytest
+
+from toolsaf.adapters.capture_filter import CaptureFilter
+
+
+def _frame(ether_type: int, payload: bytes) -> bytes:
+    return bytes.fromhex("1a0000000002" "1a0000000001") + struct.pack("!H", ether_type) + payload
+
+
+def _ipv4(protocol: int, payload: bytes, source: str = "10.0.0.1", target: str = "192.168.1.2") -> bytes:
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 1, 0, 64, protocol, 0,
+                       bytes(int(b) for b in source.split(".")), bytes(int(b) for b in target.split("."))) + payload
+
+
+TCP = _frame(0x0800, _ipv4(6, struct.pack("!HH", 40000, 443) + b"\x00" * 16))
+UDP = _frame(0x0800, _ipv4(17, struct.pack("!HHHH", 5353, 53, 8, 0), source="192.168.1.2", target="10.0.0.1"))
+ICMP = _frame(0x0800, _ipv4(1, b"\x08\x00\x00\x00"))
+IPV6 = _frame(0x86dd, struct.pack("!IHBB", 0x60000000, 8, 17, 64) + b"\xfd" + b"\x00" * 14 + b"\x01"
+              + b"\xfd" + b"\x00" * 14 + b"\x02" + struct.pack("!HHHH", 1000, 22, 8, 0))
+ARP = _frame(0x0806, b"\x00" * 28)
+
+FRAMES = {"tcp": TCP, "udp": UDP, "icmp": ICMP, "ipv6": IPV6, "arp": ARP}
+
+
+def _matches(expression: str) -> list:
+    f = CaptureFilter(expression)
+    return [n for n, d in FRAMES.items() if f.match(d, 0, len(d))]
+
+
+def test_capture_filter_protocols():
+    assert _matches("tcp") == ["tcp"]
+    assert _matches("udp") == ["udp", "ipv6"]
+    assert _matches("ip") == ["tcp", "udp", "icmp"]
+    assert _matches("ip6 or arp") == ["ipv6", "arp"]
+    assert _matches("proto 1") == ["icmp"]
+    assert _matches("not ip") == ["ipv6", "arp"]
+
+
+def test_capture_filter_addresses():
+    assert _matches("host 10.0.0.1") == ["tcp", "udp", "icmp"]
+    assert _matches("src host 10.0.0.1") == ["tcp", "icmp"]
+    assert _matches("dst net 10.0.0.0/8") == ["udp"]
+    assert _matches("net fd00::/8") == ["ipv6"]
+    assert _matches("host fd00::2") == ["ipv6"]
+    assert _matches("ether src 1a:0:0:0:0:1") == list(FRAMES)
+    assert _matches("ether dst host 1a:0:0:0:0:1") == []
+
+
+def test_capture_filter_ports():
+    assert _matches("port 53") == ["udp"]
+    assert _matches("tcp port 53 || tcp dst port 443") == ["tcp"]
+    assert _matches("src portrange 1000-6000") == ["udp", "ipv6"]
+    assert _matches("!(port 22 or port 443) && (udp or icmp)") == ["udp", "icmp"]
+
+
+def test_capture_filter_precedence():
+    # 'and' and 'or' have equal precedence and are left-associative, as in pcap-filter
+    assert _matches("tcp or udp and port 53") == ["udp"]
+    assert _matches("icmp or tcp and port 53") == []
+    assert _matches("udp and port 53 or icmp") == ["udp", "icmp"]
+    assert _matches("tcp or (udp and port 53)") == ["tcp", "udp"]
+
+
+def test_capture_filter_errors():
+    for exp in ["", "host", "host 1.2.3", "port 70000", "portrange 10-1", "ether host 1:2", "tcp and (udp",
+                "bad", "tcp udp"]:
+        with pytest.raises(ValueError):
+            CaptureFilter(exp)
+
+
+def test_capture_filter_combine():
+    assert CaptureFilter.combine(None, None) is None
+    f = CaptureFilter("tcp")
+    assert CaptureFilter.combine(f, None) is f
+    c = CaptureFilter.combine(f, CaptureFilter("port 80 or port 443"))
+    assert c and c.expression == "(tcp) and (port 80 or port 443)"
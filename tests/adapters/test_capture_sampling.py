@@ -0,0 +1,69 @@
+import struct
+
+import pytest
+
+from toolsaf.adapters.capture_sampling import CaptureSampling, packet_flow
+
+
+def _frame(source_port: int, flags: int = 0x10) -> bytes:
+    tcp = struct.pack("!HHIIBBHHH", source_port, 443, 0, 0, 0x50, flags, 0, 0, 0)
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp), 1, 0, 64, 6, 0,
+                     bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2]))
+    return bytes.fromhex("1a0000000002" "1a0000000001") + struct.pack("!H", 0x0800) + ip + tcp
+
+
+def _accepted(sampling: CaptureSampling, packets: list) -> list:
+    sampling.reset()
+    return [i for i, (ts, d) in enumerate(packets) if sampling.accept(ts, lambda d=d: packet_flow(d, 0, len(d)))]
+
+
+def test_sampling_time_window():
+    packets = [(1000 + i, _frame(40000)) for i in range(10)]
+    assert _accepted(CaptureSampling("start=+2,end=+5"), packets) == [2, 3, 4]
+    assert _accepted(CaptureSampling("end=+1m"), packets) == list(range(10))
+    assert _accepted(CaptureSampling("start=1970-01-01T00:16:48"), packets) == [8, 9]
+    assert _accepted(CaptureSampling("start=1970-01-01T02:16:48+02:00"), packets) == [8, 9]
+
+
+def test_sampling_packet_limit():
+    sampling = CaptureSampling("packets=3")
+    assert _accepted(sampling, [(1000 + i, _frame(40000)) for i in range(10)]) == [0, 1, 2]
+    assert sampling.finished
+    assert sampling.get_explanation() == "3 of 3 packets used (packets=3), rest of capture not read"
+
+    # only packets inside the time window are counted, reading stops after the end
+    sampling = CaptureSampling("start=+2,end=+6,packets=3")
+    assert _accepted(sampling, [(1000 + i, _frame(40000)) for i in range(10)]) == [2, 3, 4]
+    assert sampling.get_explanation() == "3 of 5 packets used (start=+2,end=+6,packets=3), rest of capture not read"
+    sampling = CaptureSampling("end=+2")
+    assert _accepted(sampling, [(1000 + i, _frame(40000)) for i in range(10)]) == [0, 1]
+    assert sampling.finished and sampling.packets == 3
+
+
+def test_sampling_flows():
+    packets = [(1000 + i, _frame(40000 + i % 20)) for i in range(200)]
+    sampling = CaptureSampling("flows=10")
+    accepted = _accepted(sampling, packets)
+    # first packet of each flow is accepted, then all packets of the sampled flows
+    assert accepted[:20] == list(range(20))
+    sampled = {i % 20 for i in accepted[20:]}
+    assert 0 < len(sampled) < 20
+    assert accepted == sorted(i for i in range(200) if i < 20 or i % 20 in sampled)
+    assert _accepted(sampling, packets) == accepted  # deterministic
+
+    # TCP SYN is always accepted
+    port = next(p for p in range(20) if p not in sampled)
+    packets.append((1200, _frame(40000 + port, flags=0x02)))
+    assert _accepted(sampling, packets)[-1] == 200
+
+    # seen flows are bounded
+    sampling.flow_limit = 5
+    assert _accepted(sampling, packets)[:20] == list(range(20))
+    assert len(sampling.flows) == 5
+
+
+def test_sampling_errors():
+    with pytest.raises(ValueError, match="Bad capture sampling 'first=10'"):
+        CaptureSampling("first=10")
+    with pytest.raises(ValueError, match="Bad capture sampling 'start=yesterday'"):
+        CaptureSampling("start=yesterday")
@@ -0,0 +1,36 @@
+import struct
+
+import pytest
+
+from toolsaf.adapters.dns_decoder import decode_message, decode_name
+
+
+def _message(questions: bytes, records: bytes, counts=(1, 2, 0, 0)) -> bytes:
+    return struct.pack("!HHHHHH", 1, 0x8400, *counts) + questions + records
+
+
+QUESTION = b"\x07example\x05local\x00" + b"\x00\x01\x00\x01"
+A_RECORD = b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, 120, 4) + bytes([10, 0, 0, 1])
+AAAA_RECORD = b"\x04host\xc0\x0c" + struct.pack("!HHIH", 28, 1, 120, 16) + bytes(15) + b"\x01"
+TXT_RECORD = b"\xc0\x0c" + struct.pack("!HHIH", 16, 1, 120, 4) + b"\x03abc"
+
+
+def test_decode_message():
+    names, addresses = decode_message(_message(QUESTION, A_RECORD + TXT_RECORD + AAAA_RECORD, (1, 2, 0, 1)))
+    assert names == ["example.local"]
+    assert addresses == [("example.local", bytes([10, 0, 0, 1])), ("host.example.local", bytes(15) + b"\x01")]
+
+
+def test_decode_name():
+    data = b"\x00" * 12 + b"\x01a\x00" + b"\x01b\xc0\x0c" + b"\xc0\x0f"
+    assert decode_name(data, 12) == ("a", 15)
+    assert decode_name(data, 15) == ("b.a", 19)
+    assert decode_name(data, 19) == ("b.a", 21)
+
+
+def test_decode_errors():
+    for data in [b"\x00" * 11, _message(QUESTION, A_RECORD[:-1]), _message(QUESTION[:-1], b"", (1, 0, 0, 0)),
+                 _message(b"\xc0\x0c", b"", (1, 0, 0, 0)), _message(b"\x07exam", b"", (1, 0, 0, 0)),
+                 _message(b"\x01a\xc0\x0e", b"", (1, 0, 0, 0))]:
+        with pytest.raises(ValueError):
+            decode_message(data)
@@ -1,11 +1,23 @@
+from datetime import datetime, timezone
 import pathlib
+import struct
+from typing import List, Optional, Tuple
+
+import pytest
+
 from toolsaf.core.inspector import Inspector
 
 from toolsaf.core.model import IoTSystem
-from toolsaf.adapters.pcap_reader import PCAPReader
+from toolsaf.adapters.capture_filter import CaptureFilter
+from toolsaf.adapters.capture_sampling import CaptureSampling
+from toolsaf.adapters.pcap_reader import FLOW_DECODE, FLOW_NONE, PacketColumns, PCAPReader
 from toolsaf.core.event_logger import EventLogger
-from toolsaf.common.traffic import IPFlow, EvidenceSource, Flow
+from toolsaf.common.traffic import IPFlow, EvidenceSource, Flow, TrafficVolume
+from toolsaf.common.property import Properties
+from toolsaf.core.event_interface import PropertyEvent
 from toolsaf.common.address import IPAddress
+from toolsaf.builder_backend import SystemBackend
+from toolsaf.main import TCP, UDP
 from tests.test_model import Setup
 
 
@@ -74,3 +86,247 @@ def test_process_file():
 
         conn = _connections(backend_2.entity)
         assert (app.entity, backend_2.entity, "TCP:8883") in conn
+
+
+def _packet(ether_type: int, payload: bytes) -> bytes:
+    return bytes.fromhex("1a0000000002" "1a0000000001") + struct.pack("!H", ether_type) + payload
+
+
+def _ipv4(protocol: int, payload: bytes, flags: int = 0, header: bytes = b"") -> bytes:
+    ihl = 5 + len(header) // 4
+    return struct.pack("!BBHHHBBH4s4s", 0x40 | ihl, 0, ihl * 4 + len(payload), 1, flags, 64, protocol, 0,
+                       bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2])) + header + payload
+
+
+def _write_pcap(path: pathlib.Path, packets: List[bytes], timestamps: Optional[List[int]] = None) -> None:
+    data = struct.pack("<IHHIIII", 0xa1b2c3d4, 2, 4, 0, 0, 0xffff, 1)
+    for i, p in enumerate(packets):
+        data += struct.pack("<IIII", timestamps[i] if timestamps else 1000 + i, 0, len(p), len(p)) + p
+    path.write_bytes(data)
+
+
+def _test_packets() -> List[bytes]:
+    tcp_syn = struct.pack("!HHIIBBHHH", 1100, 80, 0, 0, 0x50, 0x02, 0, 0, 0)
+    tcp_ack = struct.pack("!HHIIBBHHH", 1100, 80, 0, 0, 0x50, 0x10, 0, 0, 0)
+    packets = [
+        _packet(0x0800, _ipv4(6, tcp_syn)),
+        _packet(0x0800, _ipv4(6, tcp_ack)),
+        _packet(0x0800, _ipv4(6, tcp_syn, header=b"\x01" * 4)),
+        _packet(0x0800, _ipv4(0x11, struct.pack("!HHHH", 1200, 1234, 10, 0) + b"ab")),
+        _packet(0x0800, _ipv4(1, b"\x08\x00\x00\x00")),
+        _packet(0x0800, _ipv4(0x11, struct.pack("!HHHH", 1201, 1234, 16, 0), flags=0x2000)),  # fragment
+        _packet(0x0800, _ipv4(0x11, b"\x00" * 8, flags=1)),
+        _packet(0x0806, b"\x00" * 28),
+        _packet(0x8100, b"\x00" * 28),
+        _packet(0x86dd, b"\x60" + b"\x00" * 39),
+    ]
+    return packets
+
+
+def _read_pcap(pcap_file: pathlib.Path, decoder: str, capture_filter: Optional[CaptureFilter] = None,
+               sampling: Optional[CaptureSampling] = None) -> Tuple[PCAPReader, List[Tuple[str, str]]]:
+    m = EventLogger(Inspector(IoTSystem()))
+    reader = PCAPReader(m.get_system())
+    reader.set_options({"decoder": decoder, "traffic_volumes": False})
+    reader.capture_filter = capture_filter
+    reader.sampling = sampling
+    with pcap_file.open("rb") as f:
+        reader.process_file(f, pcap_file.name, m, EvidenceSource("pcap"))
+    return reader, [(lo.event.evidence.get_reference(), lo.event.get_value_string()) for lo in m.logs if lo.entity]
+
+
+def test_decoders(tmp_path: pathlib.Path):
+    pcap_file = tmp_path / "test.pcap"
+    _write_pcap(pcap_file, _test_packets())
+
+    results, counts = [], []
+    for decoder in ["framing", "mmap", "columnar"]:
+        reader, logs = _read_pcap(pcap_file, decoder)
+        results.append(logs)
+        counts.append(reader.seen_flows)
+    assert results[0] == results[1] == results[2]
+    assert [r[0] for r in results[1]] == [":1", ":4", ":5", ":7", ":8", ":9"]
+    # repeated SYN not sent again, but counted
+    assert max(counts[1].values()) == 2
+
+    data = memoryview(pcap_file.read_bytes())
+    columns = PacketColumns.scan(data, 24, len(data))
+    assert list(columns.flows) == [0, FLOW_NONE, 0, 1, 2, FLOW_DECODE, FLOW_DECODE, 3, 4, FLOW_NONE]
+    assert list(columns.counts) == [2, 1, 1, 1, 1]
+
+
+def test_decoders_capture_filter(tmp_path: pathlib.Path):
+    pcap_file = tmp_path / "test.pcap"
+    _write_pcap(pcap_file, _test_packets())
+
+    capture_filter = CaptureFilter("not udp and not ether dst 1a:0:0:0:0:2 or tcp dst port 80")
+    results = [_read_pcap(pcap_file, d, capture_filter)[1] for d in ["framing", "mmap", "columnar"]]
+    assert results[0] == results[1] == results[2]
+    assert [r[0] for r in results[1]] == [":1"]
+
+
+def test_decoders_sampling(tmp_path: pathlib.Path):
+    pcap_file = tmp_path / "test.pcap"
+    _write_pcap(pcap_file, _test_packets())
+
+    results = [_read_pcap(pcap_file, d, sampling=CaptureSampling("start=+1,packets=8"))[1]
+               for d in ["framing", "mmap", "columnar"]]
+    assert results[0] == results[1] == results[2]
+    # the first packet is outside the time window, so the repeated SYN is the first one sent
+    assert [r[0] for r in results[1]] == [":3", ":4", ":5", ":7", ":8", ":9", ""]
+    assert results[1][-1][1] == \
+        "default:partial:pcap: pcap: 8 of 9 packets used (start=+1,packets=8), rest of capture not read"
+
+
+def test_parallel_scan():
+    pcap_file = pathlib.Path("tests/samples/pcap/deltaco-setup.pcap")
+    data = memoryview(pcap_file.read_bytes())
+    columns = PacketColumns.scan(data, 24, len(data))
+    bounds = PacketColumns.split(data, 24, len(data), 100000)
+    assert len(bounds) == 17
+    merged = PacketColumns.merge(PacketColumns.scan(data, s, e) for s, e in zip(bounds[:-1], bounds[1:]))
+    assert merged.offsets == columns.offsets
+    assert merged.flows == columns.flows
+    assert merged.counts == columns.counts
+    assert merged.keys == columns.keys
+
+    results = []
+    for workers in [1, 3]:
+        m = EventLogger(Inspector(IoTSystem()))
+        reader = PCAPReader(m.get_system())
+        reader.set_options({"decoder": "columnar", "workers": workers})
+        reader.chunk_size = 100000
+        with pcap_file.open("rb") as f:
+            reader.process_file(f, pcap_file.name, m, EvidenceSource("pcap"))
+        results.append([(lo.event.evidence.get_reference(), lo.event.get_value_string()) for lo in m.logs])
+    assert results[0] == results[1]
+
+
+def test_merged_files(tmp_path: pathlib.Path):
+    files = []
+    for i, timestamps in enumerate([[1000, 1003, 1004], [1001, 1002, 1005]]):
+        files.append(tmp_path / f"test-{i}.pcap")
+        packets = [_packet(0x0800, _ipv4(17, struct.pack("!HHHH", 2000 + t, 53, 8, 0))) for t in timestamps]
+        _write_pcap(files[-1], packets, timestamps)
+
+    m = EventLogger(Inspector(IoTSystem()))
+    reader = PCAPReader(m.get_system())
+    sources = [EvidenceSource("pcap", base_ref=f.as_posix()) for f in files]
+    with files[0].open("rb") as f0, files[1].open("rb") as f1:
+        reader.process_merged_files([(f0, files[0].name, sources[0]), (f1, files[1].name, sources[1])], m)
+    logs = [(lo.event.evidence.get_reference(), lo.event.get_value_string().split(" ")[2]) for lo in m.logs
+            if isinstance(lo.event, IPFlow)]
+    assert [(ref[len(str(tmp_path)) + 1:], ip) for ref, ip in logs] == [
+        ("test-0.pcap:1", "10.0.0.1:3000"), ("test-1.pcap:1", "10.0.0.1:3001"), ("test-1.pcap:2", "10.0.0.1:3002"),
+        ("test-0.pcap:2", "10.0.0.1:3003"), ("test-0.pcap:3", "10.0.0.1:3004"), ("test-1.pcap:3", "10.0.0.1:3005")]
+
+
+def test_traffic_volumes(tmp_path: pathlib.Path):
+    def tcp(flags: int, reply: bool = False, payload: bytes = b"") -> bytes:
+        ports = (80, 1100) if reply else (1100, 80)
+        frame = _packet(0x0800, _ipv4(6, struct.pack("!HHIIBBHHH", *ports, 0, 0, 0x50, flags, 0, 0, 0) + payload))
+        if not reply:
+            return frame
+        # swap HW and IP addresses
+        return frame[6:12] + frame[0:6] + frame[12:26] + frame[30:34] + frame[26:30] + frame[34:]
+
+    packets = [tcp(0x02), tcp(0x12, reply=True), tcp(0x10), tcp(0x10, payload=b"x" * 100),
+               tcp(0x10, reply=True, payload=b"y" * 1000),
+               _packet(0x0800, _ipv4(17, struct.pack("!HHHH", 1200, 5000, 8, 0)))]
+    pcap_file = tmp_path / "test.pcap"
+    _write_pcap(pcap_file, packets)
+
+    def setup() -> EventLogger:
+        sb = SystemBackend()
+        device, backend = sb.device().ip("10.0.0.1"), sb.backend().ip("10.0.0.2")
+        device >> backend / TCP(port=80)
+        device >> backend / UDP(port=5000)
+        return EventLogger(Inspector(sb.system))
+
+    m = setup()
+    reader = PCAPReader(m.get_system())
+    with pcap_file.open("rb") as f:
+        reader.process_file(f, pcap_file.name, m, EvidenceSource("pcap"))
+    volumes = {c.target.name: Properties.TRAFFIC.get(c.properties) for c in m.get_system().get_connections()}
+    assert volumes == {
+        "TCP:80": TrafficVolume(5, 54 * 5 + 1100, datetime.fromtimestamp(1000, timezone.utc),
+                                datetime.fromtimestamp(1004, timezone.utc)),
+        "UDP:5000": TrafficVolume(1, 42, datetime.fromtimestamp(1005, timezone.utc),
+                                  datetime.fromtimestamp(1005, timezone.utc)),
+    }
+    assert [lo.event.evidence.source.name for lo in m.logs if isinstance(lo.event, PropertyEvent)] == ["pcap"] * 2
+
+    m = setup()
+    reader = PCAPReader(m.get_system())
+    reader.set_options({"traffic_volumes": False})
+    with pcap_file.open("rb") as f:
+        reader.process_file(f, pcap_file.name, m, EvidenceSource("pcap"))
+    assert all(Properties.TRAFFIC not in c.properties for c in m.get_system().get_connections())
+
+
+def test_traffic_volumes_known_sessions():
+    pcap_file = pathlib.Path("tests/samples/pcap/test.pcap")
+    m = EventLogger(Inspector(IoTSystem()))
+    reader = PCAPReader(m.get_system())
+    totals = []
+    for i in range(2):
+        with pcap_file.open("rb") as f:
+            reader.process_file(f, pcap_file.name, m, EvidenceSource(f"pcap-{i}"))
+        volumes = [Properties.TRAFFIC.get(c.properties) for c in m.get_system().get_connections(relevant_only=False)]
+        volumes = [v for v in volumes if v]
+        totals.append((len(volumes), sum(v.packets for v in volumes), sum(v.bytes for v in volumes)))
+    # the second read has only known sessions, but their traffic is added
+    assert totals[0][:2] == (9, 832)
+    assert totals[1] == (9, 2 * 832, 2 * totals[0][2])
+
+
+
+
+def test_traffic_volumes_decoders():
+    pcap_file = pathlib.Path("tests/samples/pcap/test.pcap")
+    results = []
+    for options in [{"decoder": "mmap"}, {"decoder": "columnar"}, {"decoder": "mmap", "workers": 2}]:
+        m = EventLogger(Inspector(IoTSystem()))
+        reader = PCAPReader(m.get_system())
+        reader.set_options(options)
+        reader.chunk_size = 100000  # scanned in parallel chunks with workers
+        with pcap_file.open("rb") as f:
+            reader.process_file(f, pcap_file.name, m, EvidenceSource("pcap"))
+        results.append({c.long_name(): Properties.TRAFFIC.get(c.properties)
+                        for c in m.get_system().get_connections(relevant_only=False)})
+    assert sum(v.packets for v in results[0].values() if v) == 832
+    assert results[0] == results[1] == results[2]
+
+
+def test_traffic_volumes_merged(tmp_path: pathlib.Path):
+    files = [tmp_path / f"test-{i}.pcap" for i in range(2)]
+    for f in files:
+        f.write_bytes(pathlib.Path("tests/samples/pcap/test.pcap").read_bytes())
+    m = EventLogger(Inspector(IoTSystem()))
+    reader = PCAPReader(m.get_system())
+    sources = [EvidenceSource("pcap", base_ref=f.as_posix()) for f in files]
+    with files[0].open("rb") as f0, files[1].open("rb") as f1:
+        reader.process_merged_files([(f0, files[0].name, sources[0]), (f1, files[1].name, sources[1])], m)
+    # volume events of the second file add to the volumes of the first one
+    packets = [sum(lo.event.key_value[1].packets for lo in m.logs if isinstance(lo.event, PropertyEvent)
+                   and lo.event.key_value[0] == Properties.TRAFFIC and lo.event.evidence.source == s)
+               for s in sources]
+    assert packets == [832, 2 * 832]
+
+
+def test_decoders_truncated(tmp_path: pathlib.Path):
+    pcap_file = tmp_path / "test.pcap"
+    packets = _test_packets()
+    _write_pcap(pcap_file, packets[:3] + [packets[7]] * 2)  # no UDP, which would send pending flows
+    pcap_file.write_bytes(pcap_file.read_bytes()[:-10])
+
+    hosts = []
+    for decoder in ["framing", "mmap", "columnar"]:
+        m = EventLogger(Inspector(IoTSystem()))
+        reader = PCAPReader(m.get_system())
+        reader.set_options({"decoder": decoder})
+        with pytest.raises(EOFError), pcap_file.open("rb") as f:
+            reader.process_file(f, pcap_file.name, m, EvidenceSource("pcap"))
+        hosts.append(sorted(h.name for h in m.get_system().get_hosts()))
+    # flows before the truncated record are not lost
+    assert hosts[0] and hosts[0] == hosts[1] == hosts[2]
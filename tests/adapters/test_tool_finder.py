@@ -55,3 +55,11 @@ def test_by_file_type(file_type, exp):
 def test_by_file_type_exception():
     with pytest.raises(ValueError):
         TOOL_FINDER.by_file_type("not-found")
+
+
+def test_create_tool_by_extension():
+    tool_dep = TOOL_FINDER.by_file_type("capture")
+    for ext in [".pcap", "pcap", ".PCAP", ".pcap.gz", ".pcap.zst", ".pcap.XZ"]:
+        assert isinstance(tool_dep.create_tool(Setup().get_system(), ext), PCAPReader)
+    for ext in [".json", ".gz", ".json.gz"]:
+        assert tool_dep.create_tool(Setup().get_system(), ext) is None
@@ -1,10 +1,12 @@
 from datetime import datetime, timezone
 from pathlib import Path
 
+from toolsaf.adapters.capture_sampling import CaptureSampling
 from toolsaf.adapters.tshark_reader import TSharkReader
 from toolsaf.main import BLEAdvertisement
 from toolsaf.common.verdict import Verdict
 from toolsaf.common.address import HWAddress
+from toolsaf.common.property import Properties
 from toolsaf.common.traffic import EvidenceSource
 from tests.test_model import Setup
 
@@ -43,3 +45,17 @@ def test_process_file():
         assert HWAddress("bb:bb:bb:bb:bb:bb") in connections[2].source.addresses
         assert connections[2].target.name == "BLE Ad:1"
         assert connections[2].get_verdict({}) == Verdict.INCON
+
+
+def test_process_file_sampling():
+    setup = Setup()
+    reader = TSharkReader(setup.get_system())
+    reader.sampling = CaptureSampling("packets=1")
+    source = EvidenceSource("tshark", "test")
+
+    with Path("tests/samples/tshark/capture.json").open("rb") as f:
+        reader.process_file(f, "", setup.get_inspector(), source)
+
+    assert len(setup.get_system().connections) == 1
+    partial = setup.get_system().properties[Properties.PARTIAL.append_key("test")]
+    assert partial.explanation == "tshark: 1 of 1 packets used (packets=1), rest of capture not read"
@@ -1,10 +1,10 @@
 """Test connection matching logic"""
 
 from toolsaf.builder_backend import SystemBackend
-from toolsaf.common.address import EndpointAddress
+from toolsaf.common.address import AddressAtNetwork, EndpointAddress, IPAddress, Protocol
 from toolsaf.common.traffic import IPFlow
 from toolsaf.core.matcher_engine import FlowMatcher, MatcherEngine
-from toolsaf.main import TCP
+from toolsaf.main import TCP, UDP
 
 
 def test_connection_basics():
@@ -122,3 +122,76 @@ def test_connection_no_match():
     assert conn == (None, dev11_2010.entity)
     assert fm.get_host_addresses() == (
         None, EndpointAddress.tcp("55.44.33.22", 2010))
+
+
+def test_wildcard_index():
+    sb = SystemBackend()
+    dev0 = sb.device("Dev0").ip("12.0.0.1")
+    dev1 = sb.device("Dev1")  # no address -> wildcard
+    any0 = sb.any("Any0")
+    mc_1900 = any0 / UDP(port=1900).multicast("239.255.255.250")
+    mc_range = any0 / UDP().port_range(5000, 5010).multicast("239.255.255.*")
+    engine = MatcherEngine(sb.system)
+    engine.add_host(dev0.entity)
+    engine.add_host(dev1.entity)
+    engine.add_host(any0.entity)
+
+    clues = [c.entity for c in engine.get_wildcards(Protocol.UDP, 1900)]
+    assert clues == [dev1.entity, any0.entity, mc_1900.entity, mc_range.entity]
+    clues = [c.entity for c in engine.get_wildcards(Protocol.UDP, 1901)]
+    assert clues == [dev1.entity, any0.entity, mc_range.entity]
+    assert engine.get_wildcards(Protocol.UDP, 1900) is engine.get_wildcards(Protocol.UDP, 1900)  # merged once
+    engine.remove_wildcard(engine.endpoints[dev1.entity])
+    clues = [c.entity for c in engine.get_wildcards(Protocol.UDP, 1900)]
+    assert clues == [any0.entity, mc_1900.entity, mc_range.entity]
+    assert dev0.entity not in [c.entity for c in engine.iterate_wildcards()]
+
+    flow = IPFlow.UDP("a:0:0:0:0:1", "12.0.0.1", 20123) >> ("1:0:5e:7f:ff:fa", "239.255.255.250", 1900)
+    fm = FlowMatcher(engine, flow)
+    conn = fm.get_connection()
+    assert conn == (dev0.entity, mc_1900.entity)
+
+
+def test_equal_weight_connections():
+    sb = SystemBackend()
+    engine = MatcherEngine(sb.system)
+
+    dev0 = sb.device("Dev0").ip("12.0.0.1")
+    dev1 = sb.device("Dev1")  # no address -> wildcard
+    dev2 = sb.device("Dev2")
+    dev0_dev1 = engine.add_connection((dev0 >> dev1 / TCP(port=1234)).connection)
+    engine.add_connection((dev0 >> dev2 / TCP(port=1234)).connection)
+
+    flow = IPFlow.TCP("a:0:0:0:0:1", "12.0.0.1", 20123) >> ("a:0:0:0:0:2", "12.0.0.2", 1234)
+    fm = FlowMatcher(engine, flow)
+    sizes = len(fm.sources.connections), len(fm.targets.connections)
+    assert fm.get_connection() == dev0_dev1  # first added wins
+    # resolving does not add values to the states
+    assert (len(fm.sources.connections), len(fm.targets.connections)) == sizes
+
+
+def test_multicast_wildcards():
+    sb = SystemBackend()
+    dev0 = sb.device("Dev0").ip("12.0.0.1")
+    any0 = sb.any("Any0")
+    ssdp = any0 / UDP(port=1900).multicast("239.255.255.250")
+    other = sb.any("Any1") / UDP(port=1900).multicast("239.255.255.251")
+    mc_range = any0 / UDP().port_range(1900, 1910).multicast("239.255.0.*")
+    engine = MatcherEngine(sb.system)
+    engine.add_host(dev0.entity)
+    engine.add_host(any0.entity)
+    engine.add_host(other.entity.get_parent_host())
+
+    net = sb.system.get_default_network()
+    address = AddressAtNetwork(IPAddress.new("239.255.255.250"), net)
+    clues = [c.entity for c in engine.get_multicast_wildcards(address, Protocol.UDP, 1900)]
+    assert clues == [any0.entity, ssdp.entity, other.entity.get_parent_host()]
+    address = AddressAtNetwork(IPAddress.new("239.255.0.1"), net)
+    clues = [c.entity for c in engine.get_multicast_wildcards(address, Protocol.UDP, 1900)]
+    assert clues == [any0.entity, mc_range.entity, other.entity.get_parent_host()]
+    assert (address, Protocol.UDP, 1900) in engine.multicast_wildcards
+
+    flow = IPFlow.UDP("a:0:0:0:0:1", "12.0.0.1", 20123) >> ("1:0:5e:7f:ff:fa", "239.255.255.250", 1900)
+    assert FlowMatcher(engine, flow).get_connection() == (dev0.entity, ssdp.entity)
+    flow = IPFlow.UDP("a:0:0:0:0:1", "12.0.0.1", 20123) >> ("1:0:5e:7f:ff:fb", "239.255.255.251", 1900)
+    assert FlowMatcher(engine, flow).get_connection() == (dev0.entity, other.entity)
@@ -2,8 +2,10 @@ from toolsaf.common.address import Addresses, IPAddress
 from toolsaf.builder_backend import SystemBackend
 from toolsaf.core.matcher import SystemMatcher
 from toolsaf.core.model import EvidenceNetworkSource
-from toolsaf.common.traffic import Evidence, IPFlow
+from toolsaf.common.traffic import Evidence, EvidenceSource, IPFlow
 from toolsaf.common.basics import ExternalActivity, Status
+from toolsaf.common.property import Properties
+from toolsaf.main import TCP
 
 
 def test_source_ip():
@@ -105,3 +107,154 @@ def test_subnet():
     conn = m.connection(flow)
     assert conn.target == dev1.entity
     # assert Addresses.get_prioritized(dev0.entity.addresses).is_global()
+
+
+def test_lazy_address_change():
+    sb = SystemBackend()
+    dev0 = sb.device().hw("1:0:0:0:0:1")
+    m = SystemMatcher(sb.system)
+    engine = m.get_context(EvidenceNetworkSource("Source A")).engine
+    generation = engine.generation
+
+    # address learned, not yet reconciled
+    sb.system.learn_ip_address(dev0.entity, IPAddress.new("192.168.0.10"))
+    assert dev0.entity in engine.dirty_hosts
+    assert engine.generation > generation
+
+    # reconciled when matching next flow
+    flow = IPFlow.UDP("1:0:0:0:0:3", "192.168.0.10", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    flow = flow.new_evidence(Evidence(EvidenceNetworkSource("Source B")))
+    con = m.connection(flow)
+    assert not engine.dirty_hosts
+    assert con.source == dev0.entity
+
+
+
+def test_learned_address_overrides_mapping():
+    sb = SystemBackend()
+    dev0 = sb.device().hw("1:0:0:0:0:1")
+    dev1 = sb.device().hw("1:0:0:0:0:4")
+    m = SystemMatcher(sb.system)
+    src = EvidenceNetworkSource("Source A")
+    src.address_map[IPAddress.new("192.168.0.10")] = dev0.entity
+    flow = IPFlow.UDP("1:0:0:0:0:3", "192.168.0.10", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    assert m.connection(flow.new_evidence(Evidence(src))).source == dev0.entity
+    assert m.engine and len(m.engine.overlays) == 1
+
+    # address learned later overrides the source mapping
+    sb.system.learn_ip_address(dev1.entity, IPAddress.new("192.168.0.10"))
+    flow = IPFlow.UDP("1:0:0:0:0:3", "192.168.0.10", 1101) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    assert m.connection(flow.new_evidence(Evidence(src))).source == dev1.entity
+    assert not m.engine.overlays
+
+
+def test_batch_connections():
+    sb = SystemBackend()
+    dev0 = sb.device().ip("192.168.0.1")
+    dev1 = sb.device().ip("192.168.0.2")
+    c0 = dev0 >> dev1 / TCP(port=1234)
+    m = SystemMatcher(sb.system)
+
+    flow0 = IPFlow.TCP("1:0:0:0:0:1", "192.168.0.1", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    flow1 = IPFlow.TCP("1:0:0:0:0:2", "192.168.0.2", 1234) >> ("1:0:0:0:0:1", "192.168.0.1", 1100)
+    flow2 = IPFlow.TCP("1:0:0:0:0:1", "192.168.0.1", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    flow2.properties[Properties.MITM] = True  # same matching key as the first flow
+    flow3 = IPFlow.UDP("1:0:0:0:0:1", "192.168.0.1", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1235)
+    rs = list(m.connections([flow0, flow1, flow2, flow3]))
+    assert [r[0] for r in rs[:3]] == [c0.connection] * 3
+    assert [r[3] for r in rs] == [False, True, False, False]
+    assert rs[3][0].status == Status.UNEXPECTED
+    assert m.get_context().observed[flow2].connection == c0.connection  # differs by properties, observed as well
+
+
+def test_unknown_service_observed_flows():
+    sb = SystemBackend()
+    sb.device().ip("192.168.0.1")
+    sb.device().ip("192.168.0.2")
+    m = SystemMatcher(sb.system)
+    flow0 = IPFlow.UDP("1:0:0:0:0:1", "192.168.0.1", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    flow1 = IPFlow.UDP("1:0:0:0:0:1", "192.168.0.1", 1101) >> ("1:0:0:0:0:2", "192.168.0.2", 1235)
+    conn = m.connection(flow0)
+    assert m.connection(flow1) == conn
+
+    # reply creates service, the other flow moved to a new connection
+    reply = IPFlow.UDP("1:0:0:0:0:2", "192.168.0.2", 1234) >> ("1:0:0:0:0:1", "192.168.0.1", 1100)
+    assert m.connection(reply) == conn
+    assert conn.target.is_service()
+    ctx = m.get_context()
+    new_conn = ctx.observed[flow1].connection
+    assert new_conn != conn
+    assert list(ctx.observed_flows[conn]) == [flow0, reply]
+    assert list(ctx.observed_flows[new_conn]) == [flow1]
+
+
+def test_match_memo():
+    sb = SystemBackend()
+    dev0 = sb.device().ip("192.168.0.1")
+    dev1 = sb.device().ip("192.168.0.2")
+    c0 = dev0 >> dev1 / TCP(port=1234)
+    m = SystemMatcher(sb.system)
+
+    flow = IPFlow.TCP("1:0:0:0:0:1", "192.168.0.1", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    assert m.connection(flow.new_evidence(Evidence(EvidenceSource("Source A")))) == c0.connection
+    match = m.get_memo(frozenset(), flow)
+    assert match and match.connection == c0.connection
+
+    # other source uses the memoized match, unless it has different address mappings
+    assert m.connection(flow.new_evidence(Evidence(EvidenceSource("Source B")))) == c0.connection
+    src = EvidenceNetworkSource("Source C")
+    src.address_map[IPAddress.new("192.168.0.3")] = dev1.entity
+    assert m.get_memo(m.get_context(src).fingerprint, flow) is None
+
+    # model change invalidates
+    sb.system.learn_ip_address(dev0.entity, IPAddress.new("192.168.0.10"))
+    assert m.get_memo(frozenset(), flow) is None
+    assert not m.memo
+
+    # status change invalidates, as matching weights depend on status
+    assert m.connection(flow.new_evidence(Evidence(EvidenceSource("Source D")))) == c0.connection
+    assert m.get_memo(frozenset(), flow)
+    dev1.entity.status = Status.EXTERNAL
+    assert m.get_memo(frozenset(), flow) is None
+
+
+def test_observed_limit():
+    sb = SystemBackend()
+    dev0 = sb.device().ip("192.168.0.1")
+    dev1 = sb.device().ip("192.168.0.2")
+    c0 = dev0 >> dev1 / TCP(port=1234)
+    m = SystemMatcher(sb.system)
+    m.observed_limit = 2
+    flows = [IPFlow.TCP("1:0:0:0:0:1", "192.168.0.1", p) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+             for p in (1100, 1101, 1102)]
+    assert [m.connection(f) for f in flows] == [c0.connection] * 3
+    ctx = m.get_context()
+    assert list(ctx.observed) == flows[1:]  # oldest forgotten
+    assert list(ctx.observed_flows[c0.connection]) == flows[1:]
+    assert m.connection(flows[0]) == c0.connection  # matched again
+    assert list(ctx.observed) == [flows[2], flows[0]]
+
+
+def test_observed_limit_unknown_service():
+    sb = SystemBackend()
+    dev0 = sb.device().ip("192.168.0.1")
+    dev1 = sb.device().ip("192.168.0.2")
+    c0 = dev0 >> dev1 / TCP(port=80)
+    m = SystemMatcher(sb.system)
+    m.observed_limit = 1
+    flow0 = IPFlow.UDP("1:0:0:0:0:1", "192.168.0.1", 1100) >> ("1:0:0:0:0:2", "192.168.0.2", 1234)
+    flow1 = IPFlow.UDP("1:0:0:0:0:1", "192.168.0.1", 1101) >> ("1:0:0:0:0:2", "192.168.0.2", 1235)
+    conn = m.connection(flow0)
+    assert m.connection(flow1) == conn
+    for port in (1102, 1103):
+        flow = IPFlow.TCP("1:0:0:0:0:1", "192.168.0.1", port) >> ("1:0:0:0:0:2", "192.168.0.2", 80)
+        assert m.connection(flow) == c0.connection
+    ctx = m.get_context()
+    assert list(ctx.observed) == [flow0, flow1]  # flows to host without service are not forgotten
+
+    # reply creates service, the other flow still moved to a new connection
+    reply = IPFlow.UDP("1:0:0:0:0:2", "192.168.0.2", 1234) >> ("1:0:0:0:0:1", "192.168.0.1", 1100)
+    assert m.connection(reply) == conn
+    assert conn.target.is_service()
+    assert ctx.observed[flow1].connection not in {conn, c0.connection}
+    assert list(ctx.observed) == [flow1]  # now flows of the service can be forgotten
@@ -3,7 +3,8 @@
 from toolsaf.builder_backend import SystemBackend
 from toolsaf.common.basics import ExternalActivity, Status
 from toolsaf.common.traffic import IPFlow
-from toolsaf.core.address_ranges import PortRange
+from toolsaf.common.address import Protocol
+from toolsaf.core.address_ranges import PortRange, PortRangeIndex
 from toolsaf.core.matcher import SystemMatcher
 from toolsaf.core.matcher_engine import MatcherEngine
 from toolsaf.main import UDP, TCP
@@ -90,3 +91,22 @@ def test_port_range_repr_and_eq():
     pr3 = PortRange.parse_port_range("1000-2000")
     assert pr1 == pr2
     assert pr1 != pr3
+
+
+def test_port_range_index():
+    index: PortRangeIndex[str] = PortRangeIndex()
+    index.add(Protocol.UDP, PortRange.parse_port_range("1000-2000,2500"), "a")
+    index.add(Protocol.UDP, PortRange.parse_port_range("2200-2499,3000"), "b")
+    index.add(Protocol.UDP, PortRange.parse_port_range("1500-1600"), "c")  # overlaps with 'a'
+    index.add(Protocol.TCP, PortRange.parse_port_range("80,1000-1500"), "d")
+
+    assert list(index.find(Protocol.UDP, 999)) == []
+    assert list(index.find(Protocol.UDP, 1000)) == ["a"]
+    assert list(index.find(Protocol.UDP, 1550)) == ["a", "c"]
+    assert list(index.find(Protocol.UDP, 2100)) == []
+    assert list(index.find(Protocol.UDP, 2300)) == ["b"]
+    assert list(index.find(Protocol.UDP, 2500)) == ["a"]
+    assert list(index.find(Protocol.UDP, 3000)) == ["b"]
+    assert list(index.find(Protocol.TCP, 80)) == ["d"]
+    assert list(index.find(Protocol.TCP, 2500)) == []
+    assert index.find(Protocol.ICMP, 80) == ()
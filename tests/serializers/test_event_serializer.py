@@ -1,16 +1,17 @@
 from datetime import datetime, timezone
 from typing import TypeVar
-from toolsaf.main import DNS
+from toolsaf.main import DNS, TCP
 from toolsaf.common.address import EndpointAddress, IPAddress, Protocol, EntityTag, DNSName
 from toolsaf.core.serializer.event_serializer import EventSerializer
 from toolsaf.common.traffic import (
     Evidence, EvidenceSource, EthernetFlow, IPFlow, BLEAdvertisementFlow,
-    HostScan, ServiceScan, HWAddress, IPAddress
+    HostScan, ServiceScan, HWAddress, IPAddress, TrafficVolume
 )
 from toolsaf.core.event_interface import PropertyAddressEvent, PropertyEvent
 from toolsaf.core.model import IoTSystem, EvidenceNetworkSource
 from toolsaf.core.services import NameEvent
-from toolsaf.common.property import PropertyKey, PropertyVerdictValue, PropertySetValue
+from toolsaf.common.basics import Status
+from toolsaf.common.property import Properties, PropertyKey, PropertyVerdictValue, PropertySetValue
 from toolsaf.common.verdict import Verdict
 from tests.test_model import Setup
 
@@ -334,6 +335,29 @@ def test_property_event():
     assert new_event.key_value == event.key_value
 
 
+def test_property_event_traffic_volume():
+    setup = Setup()
+    system = setup.get_system()
+    device = setup.system.device("Test Device")
+    connection = (device >> setup.system.backend("Test Backend") / TCP(443)).connection
+    connection.status = Status.EXTERNAL  # not relevant, but still found
+
+    volume = TrafficVolume(10, 1500, datetime(2024, 1, 1, tzinfo=timezone.utc),
+                           datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc))
+    event = PropertyEvent(Evidence(SOURCE), connection, (Properties.TRAFFIC, volume))
+    assert _get_serialized_event(event, system) == {
+        "type": "property-event",
+        "source_id": "id1",
+        "address": "source=Test_Device&target=Test_Backend/tcp:443",
+        "key": "default:traffic",
+        "value": {"traffic": {"packets": 10, "bytes": 1500, "first": "2024-01-01T00:00:00+00:00",
+                              "last": "2024-01-01T00:01:00+00:00"}}
+    }
+    new_event = _get_deserialized_object(event, system)
+    assert new_event.entity == connection
+    assert new_event.key_value == event.key_value
+
+
 def test_name_event():
     setup = Setup()
     services = setup.system.any("Services")
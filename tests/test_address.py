@@ -1,10 +1,11 @@
 from typing import Optional
-from ipaddress import IPv4Network
+from ipaddress import IPv4Network, IPv6Network
 from toolsaf.common.address import (
     Addresses, DNSName, EndpointAddress, EntityTag, HWAddress, HWAddresses, PseudoAddress,
     IPAddress, IPAddresses, Network, Protocol, AddressSequence, AddressSegment, AnyAddress
 )
 from toolsaf.common.traffic import Protocol
+from toolsaf.core.address_ranges import NetworkClassifier
 from toolsaf.main import HTTP, TCP, BLEAdvertisement
 from tests.test_model import Setup
 
@@ -122,6 +123,28 @@ def test_ip_network_matching():
     assert nw.is_local(IPAddress.new("22.33.33.4"))
 
 
+def test_network_classifier():
+    nw0 = Network("net0", ip_network=IPv4Network("22.33.0.0/16"))
+    nw1 = Network("net1", ip_network=IPv4Network("0.0.0.0/0"))
+    nw2 = Network("net2", ip_network=IPv6Network("fd00::/8"))
+    nw3 = Network("net3", ip_network=IPv4Network("22.33.4.0/24"))
+    nw4 = Network("net4")
+    networks = [nw0, nw1, nw2, nw3, nw4]
+    cl = NetworkClassifier(networks, cache_size=2)
+    for ad in [
+        IPAddress.new("22.33.4.5"), IPAddress.new("22.33.3.4"), IPAddress.new("22.2.3.4"), IPAddress.new("fd01::1"),
+        IPAddress.new("fe01::1"), IPAddress.new("224.0.0.251"), IPAddress.new("0.0.0.0"),
+        HWAddress.new("1:0:0:0:0:1"), EndpointAddress.ip("22.33.4.5", Protocol.TCP, 80), IPAddress.new("22.33.4.5"),
+    ]:
+        assert list(cl.get_local_networks(ad)) == [nw for nw in networks if nw.is_local(ad)], f"{ad}"
+    assert len(cl.cache) == 2
+
+    assert cl.is_valid_for(networks)
+    nw4.ip_network = IPv4Network("10.0.0.0/8")
+    assert not cl.is_valid_for(networks)
+    assert not cl.is_valid_for(networks[:3])
+
+
 def _segment(address: AnyAddress, segment_type: Optional[str]=None) -> AddressSegment:
     return AddressSegment(address, segment_type)
 
@@ -6,10 +6,12 @@ from toolsaf.common.address import EntityTag, IPAddress, DNSName, Protocol
 from toolsaf.common.verdict import Verdict
 from toolsaf.builder_backend import SystemBackend
 from toolsaf.core.inspector import Inspector
+from toolsaf.core.event_logger import EventLogger
+from toolsaf.core.services import NameEvent
 from toolsaf.main import DNS
 from toolsaf.core.matcher import SystemMatcher
 from toolsaf.adapters.pcap_reader import PCAPReader
-from toolsaf.common.traffic import IPFlow
+from toolsaf.common.traffic import EvidenceSource, IPFlow
 from toolsaf.common.basics import Status
 
 
@@ -494,3 +496,35 @@ def test_dns_large_pcap2():
     assert "fe80::b52e:fb6c:dd94:7767" in hs
     assert "play.google.com" in hs
 
+
+
+def test_dns_pcap_bounded_names():
+    results = []
+    for limit in [0x1000, 4]:
+        sb = SystemBackend()
+        sb.any() / DNS
+        reader = PCAPReader(sb.system)
+        reader.dns_name_limit = limit
+        pcap_file = pathlib.Path("tests/samples/pcap/dns-large-set.pcap")
+        with pcap_file.open("rb") as f:
+            reader.process_file(f, pcap_file.name, Inspector(sb.system), EvidenceSource(pcap_file.name))
+        assert len(reader.dns_names) <= limit
+        results.append(sorted((h.name, sorted(str(a) for a in h.addresses)) for h in sb.system.get_hosts()))
+    assert results[0] == results[1]
+
+
+def test_dns_pcap_decoders():
+    results = []
+    for decoder in ["framing", "mmap", "columnar"]:
+        sb = SystemBackend()
+        sb.any() / DNS
+        m = EventLogger(Inspector(sb.system))
+        reader = PCAPReader(sb.system)
+        reader.set_options({"decoder": decoder})
+        pcap_file = pathlib.Path("tests/samples/pcap/dns-large-set2.pcap")  # repeated DNS flows
+        with pcap_file.open("rb") as f:
+            reader.process_file(f, pcap_file.name, m, EvidenceSource(pcap_file.name))
+        results.append([(lo.event.evidence.get_reference(), lo.event.get_value_string()) for lo in m.logs
+                        if isinstance(lo.event, NameEvent)])
+    assert len(results[0]) == 73
+    assert results[0] == results[1] == results[2]
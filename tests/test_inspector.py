@@ -197,6 +197,11 @@ def test_multicast_many_listeners():
     assert bc13.connection.status_verdict() == (Status.EXPECTED, Verdict.INCON)
     assert bc20.connection.status_verdict() == (Status.EXPECTED, Verdict.INCON)
 
+    # listeners indexed by source and multicast target
+    listeners = i.matcher.get_engine().get_multicast_listeners(dev1.entity, IPAddress.new("255.255.255.255"))
+    assert list(listeners) == [bc10.connection, bc11.connection, bc12.connection, bc20.connection]
+    assert not list(i.matcher.get_engine().get_multicast_listeners(dev1.entity, IPAddress.new("224.0.0.251")))
+
 
 def test_multicast_many_addresses():
     sb = SystemBackend()
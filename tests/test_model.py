@@ -1,6 +1,7 @@
 from toolsaf.common.address import EndpointAddress, EntityTag, Protocol, DNSName, IPAddress, HWAddress, AddressSequence, Addresses
 from toolsaf.core.inspector import Inspector
 from toolsaf.core.model import Host, IoTSystem
+from toolsaf.common.property import Properties, PropertyVerdictValue
 from toolsaf.common.verdict import Verdict
 from toolsaf.builder_backend import SystemBackend
 from toolsaf.main import TCP, UDP, SSH, DHCP, BLEAdvertisement
@@ -549,3 +550,126 @@ def test_find_entity():
     connection = (backend >> ble_ad).connection
     seq = Addresses.parse_system_address("source=Test_Backend&target=Test_Device/ble:3")
     assert system.system.find_entity(seq) == connection
+
+
+def test_hosts_by_address():
+    system = IoTSystem()
+    ip1, ip2, name = IPAddress.new("1.0.0.1"), IPAddress.new("1.0.0.2"), DNSName("target.org")
+    h1 = system.get_endpoint(ip1)
+    h2 = system.get_endpoint(ip2)
+    assert system.get_hosts_by_address(ip1) == [h1]
+
+    h, changes = system.learn_named_address(name, ip1)
+    assert (h, changes) == (h1, True)
+    assert system.get_hosts_by_address(name) == [h1]
+    assert system.find_endpoint(name) == h1
+
+    system.learn_ip_address(h2, ip1)
+    assert system.get_hosts_by_address(ip1) == [h2]
+    assert ip1 not in h1.addresses
+
+    h2.addresses = {name}
+    assert system.get_hosts_by_address(name) == [h1, h2]
+    assert system.get_hosts_by_address(ip1) == []
+    assert system.find_endpoint(ip2) is None
+    h1.addresses.clear()
+    assert system.find_endpoint(name) == h2
+
+    # removed hosts are not found, added ones are
+    system.children.remove(h2)
+    assert system.get_hosts_by_address(name) == []
+    system.children.append(h2)
+    assert system.get_hosts_by_address(name) == [h2]
+
+
+def test_connection_registry():
+    system = IoTSystem()
+    ip1, ip2, ip3 = IPAddress.new("1.0.0.1"), IPAddress.new("1.0.0.2"), IPAddress.new("1.0.0.3")
+    h1, h2, h3 = system.get_endpoint(ip1), system.get_endpoint(ip2), system.get_endpoint(ip3)
+    c1 = system.new_connection((h1, ip1), (h2, ip2))
+    assert system.get_connections(relevant_only=False) == [c1]
+    c2 = system.new_connection((h2, ip2), (h3, ip3))
+    h3.connections.append(c2)
+    assert system.get_connections(relevant_only=False) == [c1, c2]
+    assert h1.find_connection(h2) == c1
+    assert h1.find_connection(h3) is None
+    assert system.connection_registry.get_by_source(h2) == [c2]
+
+    s3 = h3.get_endpoint(EndpointAddress(ip3, Protocol.TCP, 80))
+    system.connection_registry.retarget(c2, s3)
+    assert system.connection_registry.get_by_target(h3) == []
+    assert h2.find_connection(s3) == c2
+
+    h2.connections.remove(c2)
+    h3.connections.clear()
+    assert system.get_connections(relevant_only=False) == [c1]
+    assert h2.find_connection(s3) is None
+
+
+def test_maintained_verdict():
+    system = IoTSystem()
+    ip1, ip2 = IPAddress.new("1.0.0.1"), IPAddress.new("1.0.0.2")
+    h1, h2 = system.get_endpoint(ip1), system.get_endpoint(ip2)
+    s2 = h2.get_endpoint(EndpointAddress(ip2, Protocol.TCP, 80))
+    assert system.get_verdict({}) == Verdict.INCON
+    assert system.verdict_value is not None
+
+    s2.set_property(Properties.EXPECTED.verdict(Verdict.FAIL))
+    assert system.verdict_value is None and h1.verdict_value is not None
+    assert h2.get_verdict({}) == Verdict.FAIL
+    assert system.get_verdict({}) == Verdict.FAIL
+
+    s2.set_property(Properties.EXPECTED.verdict(Verdict.FAIL))
+    assert system.verdict_value is not None  # no change
+
+    c = system.new_connection((h1, ip1), (s2, EndpointAddress(ip2, Protocol.TCP, 80)))
+    assert system.verdict_value is None
+    s2.properties.clear()
+    c.set_property(Properties.EXPECTED.verdict(Verdict.PASS))
+    c.status = Status.PLACEHOLDER
+    assert h1.get_verdict({}) == Verdict.INCON  # placeholder connection is not relevant
+    c.status = Status.EXPECTED
+    assert h1.get_verdict({}) == Verdict.PASS
+
+
+def test_maintained_verdict_changes():
+    sb = SystemBackend()
+    device = sb.device().ip("192.168.0.1")
+    service = (sb.backend().ip("192.168.0.2") / TCP(port=80)).entity
+    system, h = sb.system, device.entity
+    assert h.get_verdict({}) == Verdict.INCON
+    assert system.get_verdict({}) == Verdict.INCON
+
+    # assigned properties
+    h.properties = {Properties.MITM: PropertyVerdictValue(Verdict.FAIL)}
+    assert h.get_verdict({}) == Verdict.FAIL
+    assert system.get_verdict({}) == Verdict.FAIL
+    h.properties.pop(Properties.MITM)
+    assert system.get_verdict({}) == Verdict.INCON
+
+    # property updates
+    Properties.MITM.update(service.properties, PropertyVerdictValue(Verdict.FAIL))
+    assert service.get_parent_host().get_verdict({}) == Verdict.FAIL
+    assert system.get_verdict({}) == Verdict.FAIL
+    Properties.MITM.update(service.properties, PropertyVerdictValue(Verdict.IGNORE))
+    assert system.get_verdict({}) == Verdict.INCON
+
+
+def test_find_entity_connection_relevance():
+    sb = SystemBackend()
+    device = sb.device("Test Device").ip("1.2.3.4")
+    backend = sb.backend("Test Backend").ip("1.2.3.5")
+    service = (backend / TCP(22)).entity
+    system = sb.system
+    seq = Addresses.parse_system_address("source=Test_Device&target=Test_Backend/tcp:22")
+
+    external = system.new_connection((device.entity, IPAddress.new("1.2.3.4")),
+                                     (service, EndpointAddress.ip("1.2.3.5", Protocol.TCP, 22)))
+    external.status = Status.EXTERNAL
+    assert system.find_entity(seq) == external  # not relevant, but the only one
+    external.status = Status.PLACEHOLDER
+    assert system.find_entity(seq) is None  # placeholders are never found
+
+    external.status = Status.EXTERNAL
+    connection = (device >> backend / TCP(22)).connection
+    assert system.find_entity(seq) == connection  # relevant connections first
@@ -223,6 +223,20 @@ def test_print_text():
         "                    │  Test\n"
 
 
+def test_print_partial_notes():
+    setup = Setup()
+    report = Report(EventLogger(setup.get_inspector()))
+    report.yellow = "Y"
+    report.reset = "R"
+    writer = _mock_writer()
+    report._print_partial_notes(writer)
+    assert writer.output == []
+
+    Properties.PARTIAL.append_key("pcap").put_verdict(setup.get_system().properties, explanation="10 of 100 packets")
+    report._print_partial_notes(writer)
+    assert writer.output == ["YPartial results:    10 of 100 packetsR\n"]
+
+
 def test_get_sub_structure():
     report = Report(EventLogger(Setup().get_inspector()))
     report._get_sources = MagicMock(return_value=[1, 2])
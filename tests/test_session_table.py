@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+from toolsaf.builder_backend import SystemBackend
+from toolsaf.common.traffic import IPFlow
+from toolsaf.core.inspector import Inspector
+from toolsaf.core.session_table import SessionTable
+from toolsaf.main import TCP
+
+
+def _setup() -> SystemBackend:
+    sb = SystemBackend()
+    sb.device().ip("192.168.0.1") >> sb.backend().ip("192.168.0.2") / TCP(port=443)
+    return sb
+
+
+def _flow(port: int, second: int = 0, reply: bool = False) -> IPFlow:
+    if reply:
+        flow = IPFlow.TCP("1:0:0:0:0:2", "192.168.0.2", 443) >> ("1:0:0:0:0:1", "192.168.0.1", port)
+    else:
+        flow = IPFlow.TCP("1:0:0:0:0:1", "192.168.0.1", port) >> ("1:0:0:0:0:2", "192.168.0.2", 443)
+    flow.timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=second)
+    return flow
+
+
+def test_session_table_default():
+    i = Inspector(_setup().system)
+    assert i.connection(_flow(50000))
+    assert i.connection(_flow(50000)) is None
+    assert i.connection(_flow(50001))  # new direction, new port
+    assert i.connection(_flow(50000, reply=True))
+    assert len(i.sessions) == 3
+
+
+def test_session_table_limit():
+    i = Inspector(_setup().system)
+    i.sessions = SessionTable(limit=2)
+    assert i.connection(_flow(50000))
+    assert i.connection(_flow(50001))
+    assert i.connection(_flow(50000)) is None
+    assert i.connection(_flow(50002))
+    assert i.connection(_flow(50000)) is None  # refreshed, so not evicted
+    assert i.connection(_flow(50001))  # evicted
+    assert len(i.sessions) == 2 and i.sessions.evicted == 2
+
+
+def test_session_table_timeout():
+    i = Inspector(_setup().system)
+    i.sessions = SessionTable(timeout=timedelta(seconds=60))
+    assert i.connection(_flow(50000, second=0))
+    assert i.connection(_flow(50000, second=50)) is None
+    assert i.connection(_flow(50001, second=100))
+    assert i.connection(_flow(50000, second=105)) is None  # refreshed at 50
+    assert i.connection(_flow(50001, second=200))  # idle for 100 seconds
+    assert len(i.sessions) == 1
+
+
+def test_session_table_ephemeral_ports():
+    i = Inspector(_setup().system)
+    i.sessions = SessionTable(ephemeral_ports=49152)
+    assert i.connection(_flow(50000))
+    assert i.connection(_flow(50001)) is None  # same session with normalized port
+    assert i.connection(_flow(50001, reply=True))
+    assert i.connection(_flow(50002, reply=True)) is None
+    assert i.connection(_flow(40000))  # not ephemeral port
+    assert len(i.sessions) == 3
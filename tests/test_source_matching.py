@@ -43,3 +43,21 @@ def test_null_address_matching():
         (IPFlow.TCP("00:00:00:00:00:00", "192.168.11.2", 10000) >> ("00:00:00:00:00:00", "10.10.10.12", 80)))
     assert c2.source.long_name() == "192.168.11.2"  # Null address is not real
     assert c2.target == ser2.entity
+
+
+def test_shared_engine_with_source_mappings():
+    sb = SystemBackend()
+    dev1 = sb.device().hw("a:0:0:0:0:1")
+    m = SystemMatcher(sb.system)
+
+    e1 = Evidence(EvidenceNetworkSource("test-1", address_map={HWAddress.new("a:0:0:0:1:1"): dev1.entity}))
+    e2 = Evidence(EvidenceNetworkSource("test-2"))
+
+    c1 = m.connection(
+        (IPFlow.UDP("a:0:0:0:1:1", "192.168.11.2", 2000) >> ("a:0:0:0:0:2", "192.168.20.10", 1001)).set_evidence(e1))
+    c2 = m.connection(
+        (IPFlow.UDP("a:0:0:0:1:1", "192.168.11.2", 2000) >> ("a:0:0:0:0:2", "192.168.20.10", 1001)).set_evidence(e2))
+
+    assert m.get_context(e1.source).engine is m.get_context(e2.source).engine
+    assert c1.source == dev1.entity
+    assert c2.source != dev1.entity
@@ -1,5 +1,6 @@
 """Batch tool-data import"""
 
+from contextlib import ExitStack
 from datetime import datetime, timezone
 import json
 import logging
@@ -11,6 +12,9 @@ from toolsaf.common.address import Addresses, AnyAddress
 from toolsaf.common.basics import ExternalActivity
 from toolsaf.core.event_interface import EventInterface
 from toolsaf.core.model import Addressable, EvidenceNetworkSource, IoTSystem, NetworkNode
+from toolsaf.adapters.capture_filter import CaptureFilter
+from toolsaf.adapters.capture_sampling import CaptureSampling
+from toolsaf.adapters.compression import decompress, split_compression
 from toolsaf.adapters.tool_finder import ToolDepiction, TOOL_FINDER
 from toolsaf.common.traffic import EvidenceSource
 
@@ -18,10 +22,13 @@ from toolsaf.common.traffic import EvidenceSource
 class BatchImporter:
     """Batch importer for importing a batch of files from a directory."""
     def __init__(self, interface: EventInterface, label_filter: Optional['LabelFilter'] = None,
-                 load_baseline: bool=False) -> None:
+                 load_baseline: bool=False, capture_filter: Optional[CaptureFilter] = None,
+                 sampling: Optional[CaptureSampling] = None) -> None:
         self.interface = interface
         self.system = interface.get_system()
         self.label_filter = label_filter or LabelFilter()
+        self.capture_filter = capture_filter  # filter for all captured packets
+        self.sampling = sampling  # sampling for all captures, unless metafile sets its own
         self.logger = logging.getLogger("batch_importer")
         self.load_baseline = load_baseline  # True to load baseline, false to check it
         self.meta_file_count = 0
@@ -104,16 +111,22 @@ class BatchImporter:
             if not info.label:
                 self.logger.info("skipping all files as no 00meta.json")
 
+            if info.merge_files and info.label and not all_files:
+                # process the files merged by the tool
+                merged = [f for f in proc_list if f.is_file() and
+                          (info.default_include or info.label in self.label_filter.included)]
+                self._do_process_merged(merged, b_data, tool_dep, skip_processing)
+
             # recursively scan the directory
             for a_file in proc_list:
                 if info and a_file.is_file():
-                    if all_files or not info.label:
+                    if all_files or not info.label or info.merge_files:
                         continue
                     # process the files individually
                     if not info.default_include and info.label not in self.label_filter.included:
                         self.logger.debug("skipping (default=False) %s", a_file.as_posix())
                         continue # skip file if not explicitly included
-                    with a_file.open("rb") as f:
+                    with decompress(a_file.open("rb"), split_compression(a_file.name)[1]) as f:
                         self._do_process(f, a_file, b_data, tool_dep, skip_processing)
                 else:
                     self._import_batch(a_file, b_data)
@@ -125,8 +138,8 @@ class BatchImporter:
         if not skip_processing:
             self.logger.info("processing (%s) %s", info.label, file_path.as_posix())
 
-        file_name = file_path.name
-        file_ext = file_path.suffix.lower()
+        file_name = split_compression(file_path.name)[0]
+        file_ext = pathlib.PurePath(file_name).suffix.lower()
         reader = tool.create_tool(self.system, "" if info.from_pipe else file_ext)
 
         try:
@@ -142,6 +155,9 @@ class BatchImporter:
                     self.logger.info("skipping (%s) %s", info.label, file_path.as_posix())
                     return
                 reader.load_baseline = info.load_baseline or self.load_baseline
+                reader.set_options(info.options)
+                reader.capture_filter = CaptureFilter.combine(self.capture_filter, info.capture_filter)
+                reader.sampling = info.sampling or self.sampling
                 reader.process_file(stream, file_name, self.interface, ev)
                 data.sources.append(ev)
                 return
@@ -150,6 +166,46 @@ class BatchImporter:
             raise ValueError(f"Error in {file_name}") from e
         self.logger.info("skipping unsupported '%s' type %s", file_name, info.file_type)
 
+    def _do_process_merged(self, files: List[pathlib.Path], data: 'BatchData', tool: ToolDepiction,
+                           skip_processing: bool) -> None:
+        """Process files merged by one tool per file extension"""
+        info = data.meta_info
+        by_extension: Dict[str, List[pathlib.Path]] = {}
+        for fn in files:
+            by_extension.setdefault(pathlib.PurePath(split_compression(fn.name)[0]).suffix.lower(), []).append(fn)
+        for file_ext, ext_files in by_extension.items():
+            reader = tool.create_tool(self.system, file_ext)
+            if not reader:
+                self.logger.info("skipping unsupported '%s' files type %s", file_ext, info.file_type)
+                continue
+            reader.load_baseline = info.load_baseline or self.load_baseline
+            reader.set_options(info.options)
+            reader.capture_filter = CaptureFilter.combine(self.capture_filter, info.capture_filter)
+            reader.sampling = info.sampling or self.sampling
+            sources = []
+            for fn in ext_files:
+                ev = info.source.rename(
+                    name=reader.tool.name, base_ref=fn.as_posix(), label=info.label,
+                    description=info.description, location=info.location
+                )
+                ev.timestamp = datetime.fromtimestamp(fn.stat().st_mtime, tz=timezone.utc)
+                self.evidence.setdefault(info.label, []).append(ev)
+                sources.append(ev)
+            if skip_processing:
+                self.logger.info("skipping (%s) %d files", info.label, len(ext_files))
+                continue
+            self.logger.info("processing (%s) %d files merged", info.label, len(ext_files))
+            with ExitStack() as stack:
+                streams = []
+                for fn, ev in zip(ext_files, sources):
+                    name, compression = split_compression(fn.name)
+                    streams.append((stack.enter_context(decompress(fn.open("rb"), compression)), name, ev))
+                try:
+                    reader.process_merged_files(streams, self.interface)
+                except Exception as e:
+                    raise ValueError(f"Error in {', '.join(fn.name for fn in ext_files)}") from e
+            data.sources.extend(sources)
+
     def _do_process_files(self, files: List[pathlib.Path], data: 'BatchData', tool: ToolDepiction,
                           skip_processing: bool) -> None:
         """Process files"""
@@ -158,6 +214,9 @@ class BatchImporter:
         if not reader:
             return
         reader.load_baseline = info.load_baseline or self.load_baseline
+        reader.set_options(info.options)
+        reader.capture_filter = CaptureFilter.combine(self.capture_filter, info.capture_filter)
+        reader.sampling = info.sampling or self.sampling
 
         if skip_processing:
             self.logger.info("skipping (%s) data files", info.label)
@@ -174,13 +233,14 @@ class BatchImporter:
                 description=info.description, location=info.location
             )
             self.evidence.setdefault(info.label, []).append(ev)
-            with fn.open("rb") as f:
+            file_name, compression = split_compression(fn.name)
+            with decompress(fn.open("rb"), compression) as f:
                 # tool-specific code can override, if knows better
                 ev.timestamp = datetime.fromtimestamp(fn.stat().st_mtime, tz=timezone.utc)
-                done = reader.process_file(f, fn.name, self.interface, ev)
+                done = reader.process_file(f, file_name, self.interface, ev)
             if done:
                 data.sources.append(ev)
-                unmapped.remove(fn.name)
+                unmapped.remove(file_name)
             else:
                 self.logger.info("unprocessed (%s) file %s", info.label, fn.as_posix())
         if unmapped:
@@ -200,6 +260,10 @@ class FileMetaInfo:
         self.from_pipe = False
         self.load_baseline = False
         self.default_include = True
+        self.merge_files = False
+        self.options: Dict[str, Any] = {}  # tool-specific options
+        self.capture_filter: Optional[CaptureFilter] = None
+        self.sampling: Optional[CaptureSampling] = None
         self.source = EvidenceNetworkSource(file_type)
         if parent:
             self.source.address_map.update(parent.source.address_map)
@@ -254,6 +318,12 @@ class BatchData:
         info.load_baseline = bool(json_data.get("load_baseline", False))
         info.file_load_order = json_data.get("file_order", [])
         info.default_include = bool(json_data.get("include", True))
+        info.merge_files = bool(json_data.get("merge_files", False))
+        info.options.update(json_data.get("options", {}))
+        if json_data.get("capture_filter"):
+            info.capture_filter = CaptureFilter(json_data["capture_filter"])
+        if json_data.get("sampling"):
+            info.sampling = CaptureSampling(json_data["sampling"])
 
         data = cls(info)
 
@@ -0,0 +1,228 @@
+"""Capture filter expressions for packet data"""
+
+from ipaddress import ip_address, ip_network
+import re
+import struct
+from typing import Callable, List, NoReturn, Optional, Tuple
+
+# Packet fields for filtering: ethernet type, HW source, HW destination, IP protocol,
+# IP source, IP destination, source port, destination port
+PacketFields = Tuple[int, bytes, bytes, int, bytes, bytes, int, int]
+
+Predicate = Callable[[PacketFields], bool]
+
+ETHERNET_HEADER = struct.Struct("!6s6sH")
+IPV4_HEADER = struct.Struct("!B5xHxB2x4s4s")
+IPV6_HEADER = struct.Struct("!6xBx16s16s")
+PORTS = struct.Struct("!HH")
+
+# IP protocol numbers for protocol names
+IP_PROTOCOLS = {
+    "tcp": 6,
+    "udp": 17,
+    "icmp": 1,
+    "icmp6": 58,
+}
+
+# Ethernet types for protocol names
+ETHERNET_TYPES = {
+    "ip": 0x0800,
+    "ip6": 0x86dd,
+    "arp": 0x0806,
+}
+
+TOKENS = re.compile(r"\(|\)|&&|\|\||!|[^\s()!]+")
+
+
+def packet_fields(buffer: bytes | memoryview, offset: int, length: int) -> PacketFields:
+    """Decode the fields used by filters from raw Ethernet frame"""
+    if length < ETHERNET_HEADER.size:
+        return -1, b"", b"", -1, b"", b"", -1, -1
+    hw_dst, hw_src, eth_type = ETHERNET_HEADER.unpack_from(buffer, offset)
+    ip_offset = offset + ETHERNET_HEADER.size
+    ip_length = length - ETHERNET_HEADER.size
+    if eth_type == 0x0800 and ip_length >= IPV4_HEADER.size:
+        v_ihl, fragment, proto, ip_src, ip_dst = IPV4_HEADER.unpack_from(buffer, ip_offset)
+        pl_offset = (v_ihl & 0xf) * 4
+        if fragment & 0x1fff:
+            pl_offset = ip_length  # no ports in later fragments
+    elif eth_type == 0x86dd and ip_length >= IPV6_HEADER.size:
+        proto, ip_src, ip_dst = IPV6_HEADER.unpack_from(buffer, ip_offset)
+        pl_offset = IPV6_HEADER.size
+    else:
+        return eth_type, hw_src, hw_dst, -1, b"", b"", -1, -1
+    if proto in {6, 17} and pl_offset + PORTS.size <= ip_length:
+        s_port, d_port = PORTS.unpack_from(buffer, ip_offset + pl_offset)
+    else:
+        s_port = d_port = -1
+    return eth_type, hw_src, hw_dst, proto, ip_src, ip_dst, s_port, d_port
+
+
+class CaptureFilter:
+    """Capture filter, a subset of BPF filter expressions, compiled once into a predicate"""
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.tokens = TOKENS.findall(expression)
+        self.index = 0
+        if not self.tokens:
+            raise ValueError(f"Empty capture filter '{expression}'")
+        self.predicate = self._parse_expression()
+        if self.index < len(self.tokens):
+            self._error(f"unexpected '{self.tokens[self.index]}'")
+
+    @classmethod
+    def combine(cls, *filters: Optional['CaptureFilter']) -> Optional['CaptureFilter']:
+        """Combine filters, so that all must match. None if no filters"""
+        fs = [f for f in filters if f]
+        if len(fs) < 2:
+            return fs[0] if fs else None
+        return cls(" and ".join(f"({f.expression})" for f in fs))
+
+    def match(self, buffer: bytes | memoryview, offset: int, length: int) -> bool:
+        """Match raw Ethernet frame"""
+        return self.predicate(packet_fields(buffer, offset, length))
+
+    def _error(self, message: str) -> NoReturn:
+        raise ValueError(f"Bad capture filter '{self.expression}': {message}")
+
+    def _peek(self) -> str:
+        return self.tokens[self.index] if self.index < len(self.tokens) else ""
+
+    def _next(self, expected: str = "") -> str:
+        t = self._peek()
+        if not t:
+            self._error(f"expected {expected or 'more'} at end")
+        self.index += 1
+        return t
+
+    def _parse_expression(self) -> Predicate:
+        """Parse 'and' and 'or', which have equal precedence and are left-associative as in pcap-filter"""
+        pred = self._parse_not()
+        while self._peek() in {"and", "&&", "or", "||"}:
+            is_and = self._next() in {"and", "&&"}
+            preds = [pred, self._parse_not()]
+            while self._peek() in ({"and", "&&"} if is_and else {"or", "||"}):
+                self.index += 1
+                preds.append(self._parse_not())
+            pred = self._all(preds) if is_and else self._any(preds)
+        return pred
+
+    @classmethod
+    def _all(cls, preds: List[Predicate]) -> Predicate:
+        return lambda f: all(p(f) for p in preds)
+
+    @classmethod
+    def _any(cls, preds: List[Predicate]) -> Predicate:
+        return lambda f: any(p(f) for p in preds)
+
+    def _parse_not(self) -> Predicate:
+        t = self._peek()
+        if t in {"not", "!"}:
+            self.index += 1
+            pred = self._parse_not()
+            return lambda f: not pred(f)
+        if t == "(":
+            self.index += 1
+            pred = self._parse_expression()
+            if self._next("')'") != ")":
+                self._error("expected ')'")
+            return pred
+        return self._parse_primitive()
+
+    def _parse_direction(self) -> Tuple[bool, bool]:
+        """Parse optional direction, return flags for source and destination"""
+        t = self._peek()
+        if t == "src":
+            self.index += 1
+            return True, False
+        if t == "dst":
+            self.index += 1
+            return False, True
+        return True, True
+
+    def _parse_primitive(self) -> Predicate:
+        t = self._peek()
+        if t == "ether":
+            self.index += 1
+            src, dst = self._parse_direction()
+            if self._peek() == "host":
+                self.index += 1
+            return self._hw_host(self._next("HW address"), src, dst)
+        if t in IP_PROTOCOLS:
+            self.index += 1
+            proto = IP_PROTOCOLS[t]
+            pred: Predicate = lambda f: f[3] == proto
+            if self._peek() in {"src", "dst", "port", "portrange"}:
+                port_pred = self._parse_primitive()
+                return lambda f: pred(f) and port_pred(f)
+            return pred
+        if t in ETHERNET_TYPES:
+            self.index += 1
+            eth_type = ETHERNET_TYPES[t]
+            return lambda f: f[0] == eth_type
+        if t == "proto":
+            self.index += 1
+            number = self._number(self._next("protocol number"))
+            return lambda f: f[3] == number
+        src, dst = self._parse_direction()
+        kind = self._next("host, net, port, or portrange")
+        value = self._next(f"value for {kind}")
+        if kind == "host":
+            return self._ip_host(value, src, dst)
+        if kind == "net":
+            return self._ip_net(value, src, dst)
+        if kind == "port":
+            port = self._number(value)
+            return self._port_range(port, port, src, dst)
+        if kind == "portrange":
+            low, _, high = value.partition("-")
+            return self._port_range(self._number(low), self._number(high or low), src, dst)
+        self._error(f"unknown primitive '{kind}'")
+
+    def _number(self, value: str) -> int:
+        try:
+            return int(value, 0)
+        except ValueError:
+            self._error(f"bad number '{value}'")
+
+    def _hw_host(self, value: str, src: bool, dst: bool) -> Predicate:
+        """Match HW address"""
+        try:
+            address = bytes(int(p, 16) for p in value.split(":"))
+        except ValueError:
+            address = b""
+        if len(address) != 6:
+            self._error(f"bad HW address '{value}'")
+        return lambda f: (src and f[1] == address) or (dst and f[2] == address)
+
+    def _ip_host(self, value: str, src: bool, dst: bool) -> Predicate:
+        """Match IP address"""
+        try:
+            address = ip_address(value).packed
+        except ValueError:
+            self._error(f"bad IP address '{value}'")
+        return lambda f: (src and f[4] == address) or (dst and f[5] == address)
+
+    def _ip_net(self, value: str, src: bool, dst: bool) -> Predicate:
+        """Match IP network"""
+        try:
+            network = ip_network(value)
+        except ValueError:
+            self._error(f"bad IP network '{value}'")
+        size = network.max_prefixlen // 8
+        shift = network.max_prefixlen - network.prefixlen
+        prefix = int(network.network_address) >> shift
+
+        def in_net(ip: bytes) -> bool:
+            return len(ip) == size and int.from_bytes(ip, "big") >> shift == prefix
+
+        return lambda f: (src and in_net(f[4])) or (dst and in_net(f[5]))
+
+    def _port_range(self, low: int, high: int, src: bool, dst: bool) -> Predicate:
+        """Match port range"""
+        if low < 0 or high > 0xffff or low > high:
+            self._error(f"bad port range {low}-{high}")
+        return lambda f: (src and low <= f[6] <= high) or (dst and low <= f[7] <= high)
+
+    def __repr__(self) -> str:
+        return self.expression
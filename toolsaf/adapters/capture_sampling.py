@@ -0,0 +1,117 @@
+"""Capture sampling for a quick look at large captures"""
+
+from datetime import datetime, timezone
+import re
+import zlib
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from toolsaf.adapters.capture_filter import packet_fields
+
+# Relative time from capture start, e.g. '+90', '+30s', '+10m', or '+2h'
+RELATIVE_TIME = re.compile(r"\+(\d+(?:\.\d*)?)([smh]?)")
+TIME_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
+def packet_flow(buffer: bytes | memoryview, offset: int, length: int) -> Tuple[Hashable, bool]:
+    """Get directional flow key for raw Ethernet frame and flag for TCP SYN"""
+    fields = packet_fields(buffer, offset, length)
+    if fields[3] != 6:
+        return fields, False
+    ip_offset = offset + 14
+    header_length = (buffer[ip_offset] & 0xf) * 4 if fields[0] == 0x0800 else 40
+    flags_offset = ip_offset + header_length + 13
+    return fields, flags_offset < offset + length and bool(buffer[flags_offset] & 0x02)
+
+
+class CaptureSampling:
+    """Capture sampling by time window, packet limit, and 1-in-N flow sampling.
+    Syntax is comma-separated 'start=<time>', 'end=<time>', 'packets=<N>', and 'flows=<N>'"""
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.start: Optional[float] = None  # absolute start time
+        self.end: Optional[float] = None    # absolute end time
+        self.start_offset: Optional[float] = None  # start relative to capture start
+        self.end_offset: Optional[float] = None    # end relative to capture start
+        self.packet_limit = 0
+        self.flow_rate = 0  # one in flow_rate flows is sampled, others only at start
+        for item in expression.split(","):
+            key, _, value = item.strip().partition("=")
+            try:
+                if key == "start":
+                    self.start, self.start_offset = self._parse_time(value)
+                elif key == "end":
+                    self.end, self.end_offset = self._parse_time(value)
+                elif key == "packets":
+                    self.packet_limit = int(value)
+                elif key == "flows":
+                    self.flow_rate = int(value)
+                else:
+                    raise ValueError(f"unknown '{key}'")
+            except ValueError as e:
+                raise ValueError(f"Bad capture sampling '{expression}': {e}") from e
+        # state for the current capture
+        self.capture_start: Optional[float] = None
+        self.packets = 0   # packets checked
+        self.window_packets = 0  # packets inside the time window
+        self.accepted = 0  # packets accepted
+        self.finished = False  # packet limit or end reached, no more packets accepted
+        self.flows: Dict[Hashable, bool] = {}  # seen flows, True if sampled
+        self.flow_limit = 0x10000  # maximum number of seen flows, the oldest are forgotten
+
+    @classmethod
+    def _parse_time(cls, value: str) -> Tuple[Optional[float], Optional[float]]:
+        """Parse absolute time or time relative to capture start"""
+        m = RELATIVE_TIME.fullmatch(value)
+        if m:
+            return None, float(m.group(1)) * TIME_UNITS[m.group(2)]
+        t = datetime.fromisoformat(value)
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        return t.timestamp(), None
+
+    def reset(self) -> None:
+        """Reset sampling for a new capture"""
+        self.capture_start = None
+        self.packets = self.window_packets = self.accepted = 0
+        self.finished = False
+        self.flows.clear()
+
+    def accept(self, timestamp: float, flow: Callable[[], Tuple[Hashable, bool]]) -> bool:
+        """Check if packet is accepted, flow gives the flow key and flag to always accept packet"""
+        if self.finished:
+            return False
+        if self.capture_start is None:
+            self.capture_start = timestamp
+        self.packets += 1
+        if self.start is not None and timestamp < self.start or \
+                self.start_offset is not None and timestamp < self.capture_start + self.start_offset:
+            return False
+        if self.end is not None and timestamp >= self.end or \
+                self.end_offset is not None and timestamp >= self.capture_start + self.end_offset:
+            self.finished = True  # past the end, packets are in time order
+            return False
+        self.window_packets += 1
+        if self.packet_limit and self.window_packets >= self.packet_limit:
+            self.finished = True
+        if self.flow_rate > 1:
+            key, always = flow()
+            sampled = self.flows.get(key)
+            if sampled is None:
+                # first packet of a flow is always accepted
+                self.flows[key] = zlib.crc32(repr(key).encode()) % self.flow_rate == 0
+                if len(self.flows) > self.flow_limit:
+                    del self.flows[next(iter(self.flows))]
+            elif not sampled and not always:
+                return False
+        self.accepted += 1
+        return True
+
+    def get_explanation(self) -> str:
+        """Explain which part of the capture was used"""
+        s = f"{self.accepted} of {self.packets} packets used ({self.expression})"
+        if self.finished:
+            s += ", rest of capture not read"
+        return s
+
+    def __repr__(self) -> str:
+        return self.expression
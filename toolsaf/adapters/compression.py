@@ -0,0 +1,53 @@
+"""Streaming decompression of compressed data files"""
+
+import gzip
+from io import BufferedReader, UnsupportedOperation
+import lzma
+from typing import Any, BinaryIO, Callable, Dict, Tuple
+
+
+def _zstd_reader(stream: BinaryIO) -> Any:
+    try:
+        import zstandard  # type: ignore [import-not-found]  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ValueError("Reading .zst files requires package 'zstandard'") from e
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+# Decompressing readers by compression suffix
+DECOMPRESSORS: Dict[str, Callable[[BinaryIO], Any]] = {
+    ".gz": lambda s: gzip.GzipFile(fileobj=s, mode="rb"),
+    ".xz": lzma.LZMAFile,
+    ".zst": _zstd_reader,
+}
+
+
+class DecompressingReader(BufferedReader):
+    """Buffered reader for decompressed data, which has no file descriptor to map"""
+    def __init__(self, compressed: BufferedReader, compression: str) -> None:
+        super().__init__(DECOMPRESSORS[compression](compressed))
+        self.compressed = compressed
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.compressed.close()
+
+    def fileno(self) -> int:
+        raise UnsupportedOperation("Decompressed data has no file descriptor")
+
+
+def split_compression(file_name: str) -> Tuple[str, str]:
+    """Split compression suffix from file name, e.g. 'a.pcap.gz' -> ('a.pcap', '.gz')"""
+    for suffix in DECOMPRESSORS:
+        if file_name.lower().endswith(suffix):
+            return file_name[:-len(suffix)], suffix
+    return file_name, ""
+
+
+def decompress(stream: BufferedReader, compression: str) -> BufferedReader:
+    """Wrap stream into decompressing reader, if compression suffix is given"""
+    if not compression:
+        return stream
+    return DecompressingReader(stream, compression)
@@ -0,0 +1,71 @@
+"""Decoder for DNS messages"""
+
+import struct
+from typing import List, Tuple
+
+DNS_HEADER = struct.Struct("!4xHHHH")
+DNS_RESOURCE = struct.Struct("!HHIH")
+DNS_QUESTION_SIZE = 4
+
+# Address resource record types with their data lengths, A and AAAA
+ADDRESS_TYPES = {1: 4, 28: 16}
+
+# Limit for compression pointers followed in a name
+POINTER_LIMIT = 64
+
+
+def decode_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """Decode DNS name, return the name and the offset after it"""
+    labels = []
+    end = -1
+    pointer = -1
+    for _ in range(POINTER_LIMIT):
+        while True:
+            if offset >= len(data):
+                raise ValueError(f"DNS name truncated (offset={offset})")
+            length = data[offset]
+            if length == 0 or length >= 0xc0:
+                break
+            labels.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+            offset += 1 + length
+            if offset > len(data):
+                raise ValueError(f"DNS label truncated (offset={offset})")
+        if length == 0:
+            return ".".join(labels), (offset + 1 if end < 0 else end)
+        if offset + 2 > len(data):
+            raise ValueError(f"DNS name truncated (offset={offset})")
+        if end < 0:
+            end = offset + 2
+        previous, pointer = pointer, (length & 0x3f) << 8 | data[offset + 1]
+        if pointer == previous:
+            break
+        offset = pointer
+    raise ValueError(f"DNS compression error (offset={pointer})")
+
+
+def decode_message(data: bytes) -> Tuple[List[str], List[Tuple[str, bytes]]]:
+    """Decode DNS message, return question names and names with raw addresses from A and AAAA records"""
+    if len(data) < 12:
+        raise ValueError("DNS message truncated")
+    questions, answers, authorities, additionals = DNS_HEADER.unpack_from(data, 0)
+    offset = 12
+    names = []
+    for _ in range(questions):
+        name, offset = decode_name(data, offset)
+        offset += DNS_QUESTION_SIZE
+        if offset > len(data):
+            raise ValueError(f"DNS question truncated (offset={offset})")
+        names.append(name)
+    addresses = []
+    for _ in range(answers + authorities + additionals):
+        name, offset = decode_name(data, offset)
+        if offset + DNS_RESOURCE.size > len(data):
+            raise ValueError(f"DNS resource record truncated (offset={offset})")
+        r_type, _, _, r_length = DNS_RESOURCE.unpack_from(data, offset)
+        offset += DNS_RESOURCE.size
+        if offset + r_length > len(data):
+            raise ValueError(f"DNS resource data truncated (offset={offset})")
+        if ADDRESS_TYPES.get(r_type) == r_length:
+            addresses.append((name, data[offset:offset + r_length]))
+        offset += r_length
+    return names, addresses
@@ -1,13 +1,21 @@
 """PCAP tool"""
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime, timezone
-from io import BufferedReader
-from ipaddress import IPv4Address, IPv6Address
+from functools import partial
+from io import BufferedReader, UnsupportedOperation
+from ipaddress import ip_address
+from itertools import repeat
+import array
+import heapq
+import mmap
 import pathlib
-from typing import List, Optional, Dict, Tuple, Any
+import struct
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Sequence, Tuple, Any
 
 from framing.backends import RawFrame
-from framing.frame_types import dns_frames
 from framing.frame_types.ethernet_frames import Ethernet_Payloads, EthernetII
 from framing.frame_types.ipv4_frames import IP_Payloads, IPv4
 from framing.frame_types.ipv6_frames import IPReassembler
@@ -18,11 +26,225 @@ from framing.frames import Frames
 from framing.raw_data import Raw, RawData
 
 from toolsaf.common.address import DNSName, HWAddress, Protocol, IPAddress
-from toolsaf.core.event_interface import EventInterface
+from toolsaf.common.property import Properties
+from toolsaf.core.event_interface import EventInterface, PropertyEvent
 from toolsaf.core.model import Addressable, Connection, IoTSystem
 from toolsaf.core.services import NameEvent, DNSService
+from toolsaf.adapters.capture_filter import CaptureFilter
+from toolsaf.adapters.capture_sampling import packet_flow
+from toolsaf.adapters.dns_decoder import decode_message
 from toolsaf.adapters.tools import SystemWideTool
-from toolsaf.common.traffic import IPFlow, EvidenceSource, Evidence, EthernetFlow
+from toolsaf.common.traffic import Flow, IPFlow, EvidenceSource, Evidence, EthernetFlow, TrafficVolume
+
+
+# Little-endian PCAP magic numbers, for micro- and nanosecond timestamps
+PCAP_MAGIC_NS = b"\x4d\x3c\xb2\xa1"
+PCAP_MAGIC_LE = {b"\xd4\xc3\xb2\xa1", PCAP_MAGIC_NS}
+
+PCAP_HEADER = struct.Struct("<4sHHIIII")
+PCAP_RECORD = struct.Struct("<IIII")
+ETHERNET_HEADER = struct.Struct("!6s6sH")
+IPV4_HEADER = struct.Struct("!BxHxxHxB2x4s4s")
+PORTS = struct.Struct("!HH")
+UDP_LENGTH = struct.Struct("!H")
+IPV4_FIELDS = struct.Struct("!BxHxxHxB")
+TCP_SYN = int(TCPFlag.SYN)
+
+# Special flow identifiers for packet columns
+FLOW_DECODE = -1  # packet must be decoded
+FLOW_NONE = -2    # packet does not produce flows
+
+
+class PacketColumns:
+    """PCAP packet records scanned into columns with flow identifiers"""
+    def __init__(self) -> None:
+        self.offsets = array.array("Q")     # packet data offsets
+        self.lengths = array.array("I")     # captured lengths
+        self.timestamps = array.array("I")  # timestamp seconds
+        self.flows = array.array("i")       # flow identifiers or special values
+        self.keys: Dict[bytes, int] = {}    # flow identifiers by raw flow key
+        self.counts = array.array("I")      # packet counts by flow identifier
+        self.error = ""                     # error which ended the scan
+
+    @classmethod
+    def scan(cls, buffer: memoryview, start: int, end: int,
+             capture_filter: Optional[CaptureFilter] = None) -> 'PacketColumns':
+        """Scan packet records from buffer and identify unique flows from the raw header bytes"""
+        cols = cls()
+        offsets, lengths, timestamps, flows = cols.offsets, cols.lengths, cols.timestamps, cols.flows
+        keys, counts = cols.keys, cols.counts
+        offset = start
+        while offset < end:
+            if offset + PCAP_RECORD.size > end:
+                cols.error = f"Only {end - offset} bytes available for PacketRecord"
+                break
+            ts, _, length, _ = PCAP_RECORD.unpack_from(buffer, offset)
+            offset += PCAP_RECORD.size
+            if offset + length > end:
+                cols.error = f"Only {end - offset + PCAP_RECORD.size} bytes available for PacketRecord"
+                break
+            offsets.append(offset)
+            lengths.append(length)
+            timestamps.append(ts)
+            if capture_filter and not capture_filter.match(buffer, offset, length):
+                key: Optional[bytes] = b""
+            else:
+                key = cls.flow_key(buffer, offset, length)
+            if key is None:
+                flows.append(FLOW_DECODE)
+            elif not key:
+                flows.append(FLOW_NONE)
+            else:
+                flow_id = keys.get(key)
+                if flow_id is None:
+                    flow_id = keys[key] = len(counts)
+                    counts.append(1)
+                else:
+                    counts[flow_id] += 1
+                flows.append(flow_id)
+            offset += length
+        return cols
+
+    @classmethod
+    def split(cls, buffer: memoryview, start: int, end: int, chunk_size: int) -> List[int]:
+        """Split packet records into chunks of about given size, return chunk boundaries"""
+        bounds = [start]
+        offset = start
+        while offset + PCAP_RECORD.size <= end:
+            if offset - bounds[-1] >= chunk_size:
+                bounds.append(offset)
+            _, _, length, _ = PCAP_RECORD.unpack_from(buffer, offset)
+            offset += PCAP_RECORD.size + length
+        bounds.append(end)
+        return bounds
+
+    @classmethod
+    def merge(cls, parts: Iterable['PacketColumns']) -> 'PacketColumns':
+        """Merge columns of consecutive chunks, mapping the flow identifiers"""
+        cols = cls()
+        keys, counts = cols.keys, cols.counts
+        for part in parts:
+            ids = array.array("i")
+            for key, count in zip(part.keys, part.counts):
+                flow_id = keys.get(key)
+                if flow_id is None:
+                    flow_id = keys[key] = len(counts)
+                    counts.append(count)
+                else:
+                    counts[flow_id] += count
+                ids.append(flow_id)
+            cols.offsets.extend(part.offsets)
+            cols.lengths.extend(part.lengths)
+            cols.timestamps.extend(part.timestamps)
+            cols.flows.extend(ids[f] if f >= 0 else f for f in part.flows)
+            cols.error = cols.error or part.error
+        return cols
+
+    @classmethod
+    def flow_key(cls, buffer: memoryview, offset: int, length: int) -> Optional[bytes]:
+        """Get raw flow key for a packet, empty if no flow, or None if the packet must be decoded"""
+        if length < ETHERNET_HEADER.size:
+            return None
+        eth_type = buffer[offset + 12] << 8 | buffer[offset + 13]
+        if eth_type == 0x86dd:
+            return b""  # IPv6 is not processed
+        if eth_type != 0x0800:
+            return buffer[offset:offset + ETHERNET_HEADER.size].tobytes()
+        ip_offset = offset + ETHERNET_HEADER.size
+        if length - ETHERNET_HEADER.size < IPV4_HEADER.size:
+            return None
+        v_ihl, total_length, fragment, proto = IPV4_FIELDS.unpack_from(buffer, ip_offset)
+        header_length = (v_ihl & 0xf) * 4
+        if fragment & 0x3fff or header_length < IPV4_HEADER.size or total_length < header_length \
+                or ETHERNET_HEADER.size + total_length > length:
+            return None
+        pl_offset = ip_offset + header_length
+        pl_length = total_length - header_length
+        if proto == 0x06:
+            if pl_length < 14:
+                return None
+            if not buffer[pl_offset + 13] & TCP_SYN:
+                return b""
+        elif proto == 0x11:
+            if pl_length < 8:
+                return None
+        else:
+            pl_offset = pl_length = 0  # no ports
+        return b"".join((buffer[offset:offset + ETHERNET_HEADER.size], buffer[ip_offset + 9:ip_offset + 10],
+                         buffer[ip_offset + 12:ip_offset + 20], buffer[pl_offset:pl_offset + min(pl_length, 4)]))
+
+
+class FlowVolumes:
+    """Traffic volumes in preallocated arrays by flow slot: packets, bytes, and first and last timestamps"""
+    def __init__(self, size: int = 1024) -> None:
+        self.slots: Dict[Tuple[Any, ...], int] = {}  # slots by flow key
+        self.packets = array.array("Q", bytes(8 * size))
+        self.bytes = array.array("Q", bytes(8 * size))
+        self.first = array.array("I", bytes(4 * size))
+        self.last = array.array("I", bytes(4 * size))
+        self.connections: Dict[int, Connection] = {}  # connections by slot
+        self.timestamp = 0  # timestamp seconds of the current packet
+
+    def add(self, key: Tuple[Any, ...], length: int) -> int:
+        """Add packet to the slot of flow key, return the slot"""
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.slots)
+            if slot == len(self.packets):
+                for a in (self.packets, self.bytes, self.first, self.last):
+                    a.frombytes(bytes(a.itemsize * slot))  # double the size
+            self.first[slot] = self.timestamp
+        self.packets[slot] += 1
+        self.bytes[slot] += length
+        self.last[slot] = self.timestamp
+        return slot
+
+    @classmethod
+    def reverse_key(cls, key: Tuple[Any, ...]) -> Tuple[Any, ...]:
+        """Get flow key for the reverse direction"""
+        if len(key) == 3:
+            return key[1], key[0], key[2]  # HW addresses and ethernet type
+        src, dst, ip_src, ip_dst, s_port, d_port, proto = key
+        return dst, src, ip_dst, ip_src, d_port, s_port, proto
+
+    @classmethod
+    def share_connections(cls, volumes: Sequence['FlowVolumes']) -> None:
+        """Share connections of flow keys between volumes of merged files, flows are sent only once for them"""
+        connections: Dict[Tuple[Any, ...], Connection] = {}
+        for v in volumes:
+            for key, slot in v.slots.items():
+                conn = v.connections.get(slot)
+                if conn:
+                    connections.setdefault(key, conn)
+        for v in volumes:
+            for key, slot in v.slots.items():
+                if slot not in v.connections:
+                    conn = connections.get(key)
+                    if conn:
+                        v.connections[slot] = conn
+
+    def get_volumes(self) -> Dict[Connection, TrafficVolume]:
+        """Get traffic volumes summed by connection, replies are added to the connection of the request"""
+        volumes: Dict[Connection, TrafficVolume] = {}
+        for key, slot in self.slots.items():
+            conn = self.connections.get(slot)
+            if conn is None:
+                conn = self.connections.get(self.slots.get(self.reverse_key(key), -1))
+                if conn is None:
+                    continue
+            v = TrafficVolume(self.packets[slot], self.bytes[slot],
+                              datetime.fromtimestamp(self.first[slot], timezone.utc),
+                              datetime.fromtimestamp(self.last[slot], timezone.utc))
+            old = volumes.get(conn)
+            volumes[conn] = old + v if old else v
+        return volumes
+
+
+def scan_file(file_name: str, start: int, end: int, capture_filter: str) -> PacketColumns:
+    """Scan packet records from a range of PCAP file, run by worker processes"""
+    with open(file_name, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            return PacketColumns.scan(view, start, end, CaptureFilter(capture_filter) if capture_filter else None)
 
 
 class PCAPReader(SystemWideTool):
@@ -38,7 +260,28 @@ class PCAPReader(SystemWideTool):
         self.frame_number = 0
         self.timestamp = datetime.fromtimestamp(0, timezone.utc)
         self.ip_reassembler = IPReassembler()
-        self.dns_names: Dict[Any, str] = {}  # report one just once
+        # recent DNS names by address and question names, to report them just once
+        self.dns_names: OrderedDict[Any, str] = OrderedDict()
+        self.dns_name_limit = 0x1000
+        self.valid_dns_names: Dict[str, bool] = {}
+        self.flow_chunk_size = 1024
+        self.pending_flows: List[Flow] = []  # flows waiting to be sent as chunk
+        # traffic volumes and their slots of pending flows, None and -1 for none
+        self.pending_slots: List[Tuple[Optional[FlowVolumes], int]] = []
+        self.traffic_volumes = True  # collect traffic volumes with native decoder
+        self.volumes: Optional[FlowVolumes] = None
+        self.volume_slot = -1  # traffic volume slot of the current packet
+        # "mmap" for native decoder, "columnar" for native decoder in two stages, "framing" for the generic one
+        self.decoder = "mmap"
+        self.workers = 1  # more than one to scan in parallel, in two stages
+        self.chunk_size = 64 * 1024 * 1024  # size of a file chunk scanned in parallel
+        self.hw_addresses: Dict[bytes, HWAddress] = {}
+        self.ip_addresses: Dict[bytes, IPAddress] = {}
+        # seen flows by raw addresses, ports, and protocol with packet counts
+        self.seen_flows: Dict[Tuple[Any, ...], int] = {}
+        self.seen_flow_limit = 0x10000
+        self.message_flows: Dict[Tuple[Any, ...], Connection] = {}  # seen flows with messages to parse
+        self.seen_generation = 0  # incremented when seen flows cleared
 
     @classmethod
     def inspect(cls, pcap_file: pathlib.Path, interface: EventInterface) -> 'PCAPReader':
@@ -51,10 +294,34 @@ class PCAPReader(SystemWideTool):
             r.process_file(f, pcap_file.name, interface, ev)
         return r
 
+    def set_options(self, options: Dict[str, Any]) -> None:
+        decoder = options.get("decoder", self.decoder)
+        if decoder not in {"mmap", "columnar", "framing"}:
+            raise ValueError(f"Unknown PCAP decoder '{decoder}'")
+        self.decoder = decoder
+        self.workers = int(options.get("workers", self.workers))
+        self.traffic_volumes = bool(options.get("traffic_volumes", self.traffic_volumes))
+        super().set_options({k: v for k, v in options.items() if k not in {"decoder", "workers", "traffic_volumes"}})
+
     def process_file(self, data: BufferedReader, file_name: str, interface: EventInterface,
                      source: EvidenceSource) -> bool:
         self.source = source
         self.interface = interface
+        mapped = self._map_file(data) if self.decoder != "framing" else None
+        if mapped is not None:
+            with mapped:
+                if self.is_native_format(mapped):
+                    with memoryview(mapped) as view:
+                        if self.sampling:
+                            self.parse_buffer(view)  # sampling reads packets in order
+                        elif self.workers > 1 and isinstance(data.name, str):
+                            self.parse_columns(view, self.scan_parallel(data.name, view))
+                        elif self.decoder == "columnar":
+                            columns = PacketColumns.scan(view, PCAP_HEADER.size, len(view), self.capture_filter)
+                            self.parse_columns(view, columns)
+                        else:
+                            self.parse_buffer(view)
+                    return True
         raw_data = Raw.stream(data, request_size=1024 * 1024)
         try:
             self.parse(raw_data)
@@ -62,6 +329,34 @@ class PCAPReader(SystemWideTool):
             raw_data.close()
         return True
 
+    def process_merged_files(self, files: Sequence[Tuple[BufferedReader, str, EvidenceSource]],
+                             interface: EventInterface) -> None:
+        self.interface = interface
+        with ExitStack() as stack:
+            buffers = []
+            for data, file_name, source in files:
+                mapped = self._map_file(data) if self.decoder != "framing" else None
+                if mapped is None or not self.is_native_format(mapped):
+                    if mapped is not None:
+                        mapped.close()
+                    self.logger.info("Cannot merge %s, processing it separately", file_name)
+                    self.process_file(data, file_name, interface, source)
+                    continue
+                stack.enter_context(mapped)
+                buffers.append((stack.enter_context(memoryview(mapped)), source))
+            self.parse_merged(buffers)
+
+    def scan_parallel(self, file_name: str, buffer: memoryview) -> PacketColumns:
+        """Scan packet records in chunks by worker processes"""
+        bounds = PacketColumns.split(buffer, PCAP_HEADER.size, len(buffer), self.chunk_size)
+        if len(bounds) < 3:
+            return PacketColumns.scan(buffer, PCAP_HEADER.size, len(buffer), self.capture_filter)
+        self.logger.info("Scanning %s in %d chunks", file_name, len(bounds) - 1)
+        expression = self.capture_filter.expression if self.capture_filter else ""
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            parts = executor.map(scan_file, repeat(file_name), bounds[:-1], bounds[1:], repeat(expression))
+            return PacketColumns.merge(parts)
+
     def parse(self, raw: RawData) -> int:
         """Parse packets from PCAP data"""
         pcap = PCAPFile(Frames.dissect(raw))
@@ -70,21 +365,418 @@ class PCAPReader(SystemWideTool):
         IP_Payloads.add_to(pcap)
 
         assert self.source, "Source is not set"
+        sampling = self.sampling
+        if sampling:
+            sampling.reset()
         count = 0
-        for rec in PCAPFile.Packet_Records.iterate(pcap):
-            self.frame_number = count + 1
-            try:
-                self.timestamp = datetime.fromtimestamp(PacketRecord.Timestamp[rec], timezone.utc)
-                self.source.timestamp = self.timestamp  # recent
-                PacketRecord.Packet_Data.process_frame(rec, {
-                    EthernetII: self._ethernet_frame
-                })
-            except ValueError as e:
-                # seen with DNS traffic
-                self.logger.warning("Frame %s: %s", self.frame_number, e)
-            count += 1
+        try:
+            for rec in PCAPFile.Packet_Records.iterate(pcap):
+                self.frame_number = count + 1
+                try:
+                    timestamp = PacketRecord.Timestamp[rec]
+                    if sampling and not sampling.accept(timestamp, partial(self._record_flow, rec)):
+                        if sampling.finished:
+                            break
+                        count += 1
+                        continue
+                    self.timestamp = datetime.fromtimestamp(timestamp, timezone.utc)
+                    self.source.timestamp = self.timestamp  # recent
+                    if self._filter_record(rec):
+                        PacketRecord.Packet_Data.process_frame(rec, {
+                            EthernetII: self._ethernet_frame
+                        })
+                except ValueError as e:
+                    # seen with DNS traffic
+                    self.logger.warning("Frame %s: %s", self.frame_number, e)
+                count += 1
+        finally:
+            self.flush_flows()  # also flows before a truncated record
+        if sampling and self.interface:
+            self.send_sampling(self.interface, self.source)
         return count
 
+    @classmethod
+    def _record_header(cls, record: PacketRecord) -> bytes:
+        """Get the start of packet data, enough for the filtered and sampled headers"""
+        data = PacketRecord.Packet_Data.as_raw(record)
+        return bytes(data.as_bytes(0, min(data.byte_length(), 128)))
+
+    def _record_flow(self, record: PacketRecord) -> Tuple[Any, bool]:
+        """Get flow key of packet record for sampling"""
+        header = self._record_header(record)
+        return packet_flow(header, 0, len(header))
+
+    def _filter_record(self, record: PacketRecord) -> bool:
+        """Check if packet record passes the capture filter"""
+        if self.capture_filter is None:
+            return True
+        header = self._record_header(record)
+        return self.capture_filter.match(header, 0, len(header))
+
+    @classmethod
+    def _map_file(cls, data: BufferedReader) -> Optional[mmap.mmap]:
+        """Memory-map the file, if it is a regular non-empty file"""
+        try:
+            return mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, UnsupportedOperation):
+            return None  # e.g. pipe or empty file
+
+    @classmethod
+    def is_native_format(cls, buffer: Any) -> bool:
+        """Check if the native decoder can parse the data, little-endian PCAP with Ethernet link type"""
+        if len(buffer) < PCAP_HEADER.size:
+            return False
+        magic, _, _, _, _, _, link_type = PCAP_HEADER.unpack_from(buffer, 0)
+        return magic in PCAP_MAGIC_LE and link_type == 1
+
+    @classmethod
+    def iterate_records(cls, buffer: memoryview) -> Iterator[Tuple[int, int, int, int]]:
+        """Iterate PCAP records in buffer, yield timestamp seconds and fraction, packet data offset and length"""
+        offset = PCAP_HEADER.size
+        end = len(buffer)
+        while offset < end:
+            if offset + PCAP_RECORD.size > end:
+                raise EOFError(f"Only {end - offset} bytes available for PacketRecord")
+            ts, ts_fraction, cap_length, _ = PCAP_RECORD.unpack_from(buffer, offset)
+            offset += PCAP_RECORD.size
+            if offset + cap_length > end:
+                raise EOFError(f"Only {end - offset + PCAP_RECORD.size} bytes available for PacketRecord")
+            yield ts, ts_fraction, offset, cap_length
+            offset += cap_length
+
+    def parse_buffer(self, buffer: memoryview) -> int:
+        """Parse packets from PCAP data in buffer, decoding the used header fields directly"""
+        assert self.source, "Source is not set"
+        self.clear_seen_flows()
+        self.volumes = volumes = FlowVolumes() if self.traffic_volumes else None
+        sampling = self.sampling
+        if sampling:
+            sampling.reset()
+        count = 0
+        try:
+            for count, (ts, _, offset, length) in enumerate(self.iterate_records(buffer), start=1):
+                if sampling and not sampling.accept(ts, partial(packet_flow, buffer, offset, length)):
+                    if sampling.finished:
+                        break
+                    continue
+                self.frame_number = count
+                self._decode_record(buffer, ts, offset, length)
+        finally:
+            self.flush_flows()  # also flows before a truncated record
+            self.volumes = None
+        if volumes:
+            self._send_volumes(volumes, self.source)
+        if sampling and self.interface:
+            self.send_sampling(self.interface, self.source)
+        return count
+
+    def parse_merged(self, buffers: List[Tuple[memoryview, EvidenceSource]]) -> int:
+        """Parse packets from several PCAP buffers, merged in timestamp order"""
+        self.clear_seen_flows()
+        heap = []
+        for index, (buffer, _) in enumerate(buffers):
+            # timestamp fractions into nanoseconds
+            scale = 1 if buffer[:4] == PCAP_MAGIC_NS else 1000
+            records = ((ts, fraction * scale, offset, length)
+                       for ts, fraction, offset, length in self.iterate_records(buffer))
+            record = next(records, None)
+            if record:
+                heap.append((record[0], record[1], index, 1, record, records))
+        heapq.heapify(heap)
+        volumes = [FlowVolumes() for _ in buffers] if self.traffic_volumes else []
+        sampling = self.sampling
+        if sampling:
+            sampling.reset()
+        count = 0
+        try:
+            while heap:
+                ts, fraction, index, frame, record, records = heap[0]
+                buffer, self.source = buffers[index]
+                if sampling and not sampling.accept(ts, partial(packet_flow, buffer, record[2], record[3])):
+                    if sampling.finished:
+                        break
+                else:
+                    if volumes:
+                        self.volumes = volumes[index]
+                    self.frame_number = frame
+                    self._decode_record(buffer, ts, record[2], record[3])
+                    count += 1
+                record = next(records, None)
+                if record:
+                    heapq.heapreplace(heap, (record[0], record[1], index, frame + 1, record, records))
+                else:
+                    heapq.heappop(heap)
+        finally:
+            self.flush_flows()  # also flows before a truncated record
+            self.volumes = None
+        FlowVolumes.share_connections(volumes)
+        for file_volumes, (_, source) in zip(volumes, buffers):
+            self._send_volumes(file_volumes, source)
+        if sampling and self.interface:
+            for _, source in buffers:
+                self.send_sampling(self.interface, source)
+        return count
+
+    def _decode_record(self, buffer: memoryview, timestamp: int, offset: int, length: int) -> None:
+        """Decode packet record, if it passes the capture filter"""
+        assert self.source, "Source is not set"
+        try:
+            self.timestamp = datetime.fromtimestamp(timestamp, timezone.utc)
+            self.source.timestamp = self.timestamp  # recent
+            if self.volumes:
+                self.volumes.timestamp = timestamp
+            if self.capture_filter is None or self.capture_filter.match(buffer, offset, length):
+                self._decode_ethernet(buffer, offset, length)
+        except ValueError as e:
+            self.logger.warning("Frame %s: %s", self.frame_number, e)
+
+    def parse_columns(self, buffer: memoryview, columns: PacketColumns) -> int:
+        """Parse packets from scanned columns, only decoding the first packets of flows and messages"""
+        assert self.source, "Source is not set"
+        self.clear_seen_flows()
+        self.volumes = volumes = FlowVolumes() if self.traffic_volumes else None
+        generation = self.seen_generation
+        sent = bytearray(len(columns.counts))  # flows sent since seen flows cleared
+        messages = bytearray(len(columns.counts))  # flows with messages
+        offsets, lengths, timestamps = columns.offsets, columns.lengths, columns.timestamps
+        capture_filter = self.capture_filter
+        try:
+            for row, flow_id in enumerate(columns.flows):
+                if volumes:
+                    volumes.timestamp = timestamps[row]
+                if flow_id == FLOW_NONE:
+                    # not a flow start, but may have traffic
+                    if volumes and (capture_filter is None or capture_filter.match(buffer, offsets[row], lengths[row])):
+                        self._count_volume(volumes, buffer, offsets[row], lengths[row])
+                    continue
+                if generation != self.seen_generation:
+                    # seen flows cleared, send the flows again
+                    generation = self.seen_generation
+                    sent = bytearray(len(sent))
+                    messages = bytearray(len(messages))
+                if flow_id >= 0:
+                    if sent[flow_id] and not messages[flow_id]:
+                        if volumes:
+                            self._count_volume(volumes, buffer, offsets[row], lengths[row])
+                        continue
+                    sent[flow_id] = 1
+                self.frame_number = row + 1
+                try:
+                    self.timestamp = datetime.fromtimestamp(timestamps[row], timezone.utc)
+                    self.source.timestamp = self.timestamp
+                    if self._decode_ethernet(buffer, offsets[row], lengths[row]) and flow_id >= 0:
+                        messages[flow_id] = 1
+                except ValueError as e:
+                    self.logger.warning("Frame %s: %s", self.frame_number, e)
+            if timestamps:
+                self.frame_number = len(timestamps)
+                self.timestamp = datetime.fromtimestamp(timestamps[-1], timezone.utc)
+                self.source.timestamp = self.timestamp
+        finally:
+            self.flush_flows()  # also flows before a truncated record
+            self.volumes = None
+        if columns.error:
+            raise EOFError(columns.error)
+        if volumes:
+            self._send_volumes(volumes, self.source)
+        return len(timestamps)
+
+    @classmethod
+    def _count_volume(cls, volumes: FlowVolumes, buffer: memoryview, offset: int, length: int) -> None:
+        """Count packet which is not decoded into traffic volumes, using the flow key of _decode_ethernet"""
+        if length < ETHERNET_HEADER.size:
+            return
+        dst, src, pl_type = ETHERNET_HEADER.unpack_from(buffer, offset)
+        if pl_type == 0x86dd:
+            return
+        if pl_type != 0x0800:
+            volumes.add((src, dst, pl_type), length)
+            return
+        ip_offset = offset + ETHERNET_HEADER.size
+        if length - ETHERNET_HEADER.size < IPV4_HEADER.size:
+            return
+        v_ihl, total_length, fragment, proto, ip_src, ip_dst = IPV4_HEADER.unpack_from(buffer, ip_offset)
+        header_length = (v_ihl & 0xf) * 4
+        if fragment & 0x3fff or header_length < IPV4_HEADER.size or total_length < header_length \
+                or ETHERNET_HEADER.size + total_length > length:
+            return  # decoded by framing, which does not count traffic
+        pl_offset = ip_offset + header_length
+        pl_length = total_length - header_length
+        if proto in (0x06, 0x11):
+            if pl_length < (14 if proto == 0x06 else 8):
+                return
+            s_port, d_port = PORTS.unpack_from(buffer, pl_offset)
+            volumes.add((src, dst, ip_src, ip_dst, s_port, d_port, proto), length)
+        else:
+            volumes.add((src, dst, ip_src, ip_dst, proto, proto, proto), length)
+
+    def _decode_ethernet(self, buffer: memoryview, offset: int, length: int) -> Optional[Connection]:
+        """Decode ethernet frame, fall back to framing for anything unusual. Return connection with messages"""
+        self.volume_slot = -1
+        if length < ETHERNET_HEADER.size:
+            self._framing_ethernet_frame(buffer, offset, length)
+            return None
+        dst, src, pl_type = ETHERNET_HEADER.unpack_from(buffer, offset)
+        if pl_type == 0x86dd:
+            return None  # IPv6 is not processed
+        if pl_type != 0x0800:
+            key: Tuple[Any, ...] = src, dst, pl_type
+            if self.volumes:
+                self.volume_slot = self.volumes.add(key, length)
+            if self._is_seen_flow(key):
+                return None
+            protocol = Protocol.ARP if pl_type == 0x0806 else Protocol.ETHERNET
+            self._push_ethernet_flow(src, dst, -1 if protocol == Protocol.ARP else pl_type, protocol)
+            return None
+        ip_offset = offset + ETHERNET_HEADER.size
+        ip_end = offset + length
+        if ip_end - ip_offset < IPV4_HEADER.size:
+            self._framing_ethernet_frame(buffer, offset, length)
+            return None
+        v_ihl, total_length, fragment, proto, ip_src, ip_dst = IPV4_HEADER.unpack_from(buffer, ip_offset)
+        header_length = (v_ihl & 0xf) * 4
+        if fragment & 0x3fff or header_length < IPV4_HEADER.size or total_length < header_length \
+                or ip_offset + total_length > ip_end:
+            # fragmented or malformed, let the reassembler and framing take care of it
+            self._framing_ethernet_frame(buffer, offset, length)
+            return None
+        pl_offset = ip_offset + header_length
+        pl_length = total_length - header_length
+        if proto == 0x06:
+            if pl_length < 14:
+                self._framing_ethernet_frame(buffer, offset, length)
+                return None
+            s_port, d_port = PORTS.unpack_from(buffer, pl_offset)
+            key = src, dst, ip_src, ip_dst, s_port, d_port, proto
+            if self.volumes:
+                self.volume_slot = self.volumes.add(key, length)
+            if buffer[pl_offset + 13] & TCP_SYN:
+                # SYN marks connection attempt and accepting it
+                if not self._is_seen_flow(key):
+                    self.push_flow(self._ip_flow(src, dst, ip_src, ip_dst, s_port, d_port, Protocol.TCP))
+        elif proto == 0x11:
+            if pl_length < 8:
+                self._framing_ethernet_frame(buffer, offset, length)
+                return None
+            s_port, d_port = PORTS.unpack_from(buffer, pl_offset)
+            key = src, dst, ip_src, ip_dst, s_port, d_port, proto
+            if self.volumes:
+                self.volume_slot = self.volumes.add(key, length)
+
+            def udp_payload() -> bytes:
+                udp_length = min(UDP_LENGTH.unpack_from(buffer, pl_offset + 4)[0], pl_length)
+                return bytes(buffer[pl_offset + 8:pl_offset + udp_length])
+
+            if self._is_seen_flow(key):
+                conn = self.message_flows.get(key)
+                if conn:
+                    self._message(conn, udp_payload)
+                return conn
+            flow = self._ip_flow(src, dst, ip_src, ip_dst, s_port, d_port, Protocol.UDP)
+            conn = self._udp_flow(flow, udp_payload)
+            if conn:
+                self.message_flows[key] = conn
+            return conn
+        else:
+            key = src, dst, ip_src, ip_dst, proto, proto, proto
+            if self.volumes:
+                self.volume_slot = self.volumes.add(key, length)
+            if not self._is_seen_flow(key):
+                self.push_flow(self._ip_flow(src, dst, ip_src, ip_dst, proto, proto, Protocol.IP))
+        return None
+
+    def _send_volumes(self, volumes: FlowVolumes, source: EvidenceSource) -> None:
+        """Send traffic volumes as connection properties"""
+        assert self.interface, "Interface is not set"
+        evidence = Evidence(source)
+        for conn, volume in volumes.get_volumes().items():
+            old = Properties.TRAFFIC.get(conn.properties)
+            if isinstance(old, TrafficVolume):
+                volume = old + volume
+            self.interface.property_update(PropertyEvent(evidence, conn, (Properties.TRAFFIC, volume)))
+
+    def _is_seen_flow(self, key: Tuple[Any, ...]) -> bool:
+        """Count packet of a flow, return True if the flow has been seen before"""
+        count = self.seen_flows.get(key)
+        if count is not None:
+            self.seen_flows[key] = count + 1
+            return True
+        if len(self.seen_flows) >= self.seen_flow_limit:
+            old = next(iter(self.seen_flows))
+            del self.seen_flows[old]
+            self.message_flows.pop(old, None)
+        self.seen_flows[key] = 1
+        return False
+
+    def _framing_ethernet_frame(self, buffer: memoryview, offset: int, length: int) -> None:
+        """Decode ethernet frame using framing"""
+        frame = EthernetII(Frames.dissect(Raw.bytes(bytes(buffer[offset:offset + length]))))
+        Ethernet_Payloads.add_to(frame)
+        IP_Payloads.add_to(frame)
+        self._ethernet_frame(frame)
+
+    def _hw_address(self, data: bytes) -> HWAddress:
+        """Get HW address for raw bytes"""
+        ad = self.hw_addresses.get(data)
+        if ad is None:
+            if len(self.hw_addresses) >= 0x10000:
+                self.hw_addresses.clear()
+            ad = self.hw_addresses[data] = HWAddress(data.hex(":"))
+        return ad
+
+    def _ip_address(self, data: bytes) -> IPAddress:
+        """Get IP address for raw bytes"""
+        ad = self.ip_addresses.get(data)
+        if ad is None:
+            if len(self.ip_addresses) >= 0x10000:
+                self.ip_addresses.clear()
+            ad = self.ip_addresses[data] = IPAddress(ip_address(data))
+        return ad
+
+    def _push_ethernet_flow(self, source: bytes, target: bytes, payload: int, protocol: Protocol) -> None:
+        """Push ethernet flow from decoded header"""
+        assert self.source, "Source is not set"
+        fl = EthernetFlow(Evidence(self.source, f":{self.frame_number}"),
+                          source=self._hw_address(source), target=self._hw_address(target),
+                          payload=payload, protocol=protocol)
+        fl.timestamp = self.timestamp
+        self.push_flow(fl)
+
+    def _ip_flow(self, hw_source: bytes, hw_target: bytes, ip_source: bytes, ip_target: bytes,
+                 source_port: int, target_port: int, protocol: Protocol) -> IPFlow:
+        """Create IP flow from decoded headers"""
+        assert self.source, "Source is not set"
+        flow = IPFlow(Evidence(self.source, f":{self.frame_number}"),
+                      (self._hw_address(hw_source), self._ip_address(ip_source), source_port),
+                      (self._hw_address(hw_target), self._ip_address(ip_target), target_port), protocol)
+        flow.timestamp = self.timestamp
+        return flow
+
+    def clear_seen_flows(self) -> None:
+        """Clear seen flows, so that the next packets are sent again"""
+        self.seen_flows.clear()
+        self.message_flows.clear()
+        self.seen_generation += 1
+
+    def push_flow(self, flow: Flow) -> None:
+        """Push flow to be sent to interface in a chunk"""
+        self.pending_flows.append(flow)
+        self.pending_slots.append((self.volumes, self.volume_slot))
+        if len(self.pending_flows) >= self.flow_chunk_size:
+            self.flush_flows()
+
+    def flush_flows(self) -> None:
+        """Send pending flows to interface"""
+        assert self.interface, "Interface is not set"
+        flows, self.pending_flows = self.pending_flows, []
+        slots, self.pending_slots = self.pending_slots, []
+        if flows:
+            connections = self.interface.matched_connections(flows)
+            # also known sessions have traffic, slots are for the volumes of the file of the flow
+            for (volumes, slot), (conn, _) in zip(slots, connections):
+                if conn and volumes and slot >= 0:
+                    volumes.connections[slot] = conn
+
     def _ethernet_frame(self, frame: EthernetII) -> None:
         """Parse ethernet frame"""
         self.logger.debug("Parse PCAP frame %s", self.frame_number)
@@ -112,13 +804,7 @@ class PCAPReader(SystemWideTool):
                           payload=pl_type,
                           protocol=protocol)
         fl.timestamp = self.timestamp
-        self.interface.connection(fl)
-
-        # We used to track packets
-        # le = EthernetII.data[frame].byte_length()
-        # delta = self.timestamp - fl.timestamp
-        # ts = int(delta.total_seconds() * 1000)
-        # self.interface.flow_data_update(fl, [ts, le])
+        self.push_flow(fl)
 
     def _ipv4_frame(self, ethernet: EthernetII, frame: IPv4) -> None:
         """Parse IPv4 frame"""
@@ -150,77 +836,94 @@ class PCAPReader(SystemWideTool):
         s, d = self.ip_flow_ends(ethernet, ip, UDP.Source_port[frame], UDP.Destination_port[frame])
         flow = IPFlow(Evidence(self.source, f":{self.frame_number}"), s, d, Protocol.UDP)
         flow.timestamp = self.timestamp
-        conn = self.interface.connection(flow)
-        proto = self.system.message_listeners.get(conn.target) if conn else None
-        if proto:
-            assert conn, "connection was None"
-            proc = {
-                Protocol.DNS: lambda: self._dns_message([conn.source, conn.target], frame, conn)
-            }[proto]
-            proc() # type: ignore [no-untyped-call]
-
-        # We used to track packets
-        # le = UDP.Data[frame].byte_length()
-        # delta = self.timestamp - flow.timestamp
-        # ts = int(delta.total_seconds() * 1000)
-        # self.interface.flow_data_update(flow, [ts, le])
-
-    def _dns_message(self, peers: List[Addressable], udp: UDP, connection: Connection) -> None:
-        """Parse DNS message"""
+        data = UDP.Data[frame]
+        self._udp_flow(flow, lambda: data.as_bytes(0, data.byte_length()))
+
+    def _udp_flow(self, flow: IPFlow, udp_payload: Callable[[], bytes]) -> Optional[Connection]:
+        """Send UDP flow and parse message, if the target listens to messages. Return connection with messages"""
+        assert self.interface, "Interface is not set"
+        self.flush_flows()  # connection required for the message
+        matched, _ = self.interface.matched_connections([flow])[0]
+        if matched and self.volumes and self.volume_slot >= 0:
+            self.volumes.connections[self.volume_slot] = matched
+        # also messages of known sessions are parsed, as the native decoder parses them from all packets
+        if matched is None or matched.target not in self.system.message_listeners:
+            return None
+        self._message(matched, udp_payload)
+        return matched
+
+    def _message(self, connection: Connection, udp_payload: Callable[[], bytes]) -> None:
+        """Parse message for a listener"""
+        proto = self.system.message_listeners[connection.target]
+        proc = {
+            Protocol.DNS: lambda: self._dns_message([connection.source, connection.target], udp_payload(), connection)
+        }[proto]
+        proc() # type: ignore [no-untyped-call]
+
+    def _dns_message(self, peers: List[Addressable], payload: bytes, connection: Connection) -> None:
+        """Parse DNS message, send the learned names as one batch"""
         assert self.source, "Source is not set"
         assert self.interface, "Interface is not set"
 
-        rd = UDP.Data[udp]
-        frame = dns_frames.DNSMessage(Frames.dissect(rd))
+        questions, addresses = decode_message(payload)
         evidence = Evidence(self.source, f":{self.frame_number}")
         service = connection.target
         assert isinstance(service, DNSService), f"Unexpected DNS service: {service}"
 
         events = []
-        for rd in dns_frames.DNSMessage.Question.iterate(frame):
-            name = dns_frames.DNSName.string(rd, dns_frames.DNSQuestion.QNAME)
-            if name not in self.dns_names:
-                try:
-                    DNSName.validate(name)
-                except ValueError:
-                    self.logger.warning("Invalid DNS name in question: '%s'", name)
-                    continue
-                self.dns_names[name] = ""
-                events.append(NameEvent(
-                    evidence, service, name=DNSName(name), peers=peers, timestamp=self.timestamp
-                ))
-
-        def learn_name(name: str, ip: IPv4Address | IPv6Address) -> None:
-            old = self.dns_names.get(ip)
-            if old == name:
-                return
+        for name in questions:
+            if self._is_recent_dns_name(name, ""):
+                continue
+            if not self._is_valid_dns_name(name, "question"):
+                continue
+            self._add_dns_name(name, "")
+            events.append(NameEvent(
+                evidence, service, name=DNSName(name), peers=peers, timestamp=self.timestamp
+            ))
+
+        for name, raw_address in addresses:
+            ip = self._ip_address(raw_address)
+            if self._is_recent_dns_name(ip, name):
+                continue
+            if not self._is_valid_dns_name(name, "resource record"):
+                continue
+            self._add_dns_name(ip, name)
+            self.clear_seen_flows()  # address learned, flows may match differently
+            events.append(NameEvent(
+                evidence, service, name=DNSName(name), address=ip, peers=peers, timestamp=self.timestamp
+            ))
+
+        if events:
+            self.interface.names(events)
+
+    def _is_recent_dns_name(self, key: Any, name: str) -> bool:
+        """Check if address or question name is recently reported with the name"""
+        if self.dns_names.get(key) != name:
+            return False
+        self.dns_names.move_to_end(key)
+        return True
+
+    def _add_dns_name(self, key: Any, name: str) -> None:
+        """Add reported address or question name, forget the least recent one when full"""
+        self.dns_names[key] = name
+        self.dns_names.move_to_end(key)
+        if len(self.dns_names) > self.dns_name_limit:
+            self.dns_names.popitem(last=False)
+
+    def _is_valid_dns_name(self, name: str, context: str) -> bool:
+        """Check if DNS name is valid, warn about invalid names once"""
+        valid = self.valid_dns_names.get(name)
+        if valid is None:
             try:
                 DNSName.validate(name)
+                valid = True
             except ValueError:
-                self.logger.warning("Invalid DNS name in resource record: '%s'", name)
-                return
-            self.dns_names[ip] = name
-            n = NameEvent(
-                evidence, service, name=DNSName(name), address=IPAddress(ip), peers=peers, timestamp=self.timestamp
-            )
-            events.append(n)
-
-        rd_frames = []
-        rd_frames.extend(dns_frames.DNSMessage.Answer.iterate(frame))
-        rd_frames.extend(dns_frames.DNSMessage.Authority.iterate(frame))
-        rd_frames.extend(dns_frames.DNSMessage.Additional.iterate(frame))
-        for rd in rd_frames:
-            name = dns_frames.DNSName.string(rd, dns_frames.DNSResource.NAME)
-            proc_rd = {
-                dns_frames.RDATA.A: lambda r:
-                    learn_name(name, r.as_ip_address()),  # pylint: disable=cell-var-from-loop
-                dns_frames.RDATA.AAAA: lambda r:
-                    learn_name(name, r.as_ip_address()),  # pylint: disable=cell-var-from-loop
-            }
-            dns_frames.DNSResource.RDATA.process_frame(rd, proc_rd)
-
-        for e in events:
-            self.interface.name(e)
+                self.logger.warning("Invalid DNS name in %s: '%s'", context, name)
+                valid = False
+            if len(self.valid_dns_names) >= 0x10000:
+                self.valid_dns_names.clear()
+            self.valid_dns_names[name] = valid
+        return valid
 
     def _tcp_frame(self, ethernet: EthernetII, ip: IPv4, frame: TCP) -> None:
         """Parse TCP frame"""
@@ -232,18 +935,7 @@ class PCAPReader(SystemWideTool):
             s, d = self.ip_flow_ends(ethernet, ip, TCP.Source_port[frame], TCP.Destination_port[frame])
             flow = IPFlow(Evidence(self.source, f":{self.frame_number}"), s, d, Protocol.TCP)
             flow.timestamp = self.timestamp
-            self.interface.connection(flow)
-        # We used to track packets
-        # else:
-            # key = self.ip_flow_ends(ethernet, ip, TCP.Source_port[frame], TCP.Destination_port[frame])
-            # flow = self.flows.get(key)
-            # if flow:
-            #     le = TCP.Data[frame].byte_length()
-            #     # NOTE: We could make fewer calls and pack more to the list
-            #     if le > 0:
-            #         delta = self.timestamp - flow.timestamp
-            #         ts = int(delta.total_seconds() * 1000)
-            #         self.interface.flow_data_update(flow, [ts, le])
+            self.push_flow(flow)
 
     def _other_ip_frame(self, ethernet: EthernetII, ip: IPv4) -> None:
         assert self.source, "Source is not set"
@@ -253,13 +945,7 @@ class PCAPReader(SystemWideTool):
         s, d = self.ip_flow_ends(ethernet, ip, proto, proto)
         flow = IPFlow(Evidence(self.source, f":{self.frame_number}"), s, d, Protocol.IP)
         flow.timestamp = self.timestamp
-        self.interface.connection(flow)
-
-        # We used to track packets
-        # le = IPv4.Payload[ip].byte_length()
-        # delta = self.timestamp - flow.timestamp
-        # ts = int(delta.total_seconds() * 1000)
-        # self.interface.flow_data_update(flow, [ts, le])
+        self.push_flow(flow)
 
     def __repr__(self) -> str:
         base_ref = (self.source.base_ref if self.source else "") or "PCAP"
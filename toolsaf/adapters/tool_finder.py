@@ -2,6 +2,7 @@
 from typing import Dict, List, Optional, Type, Union
 from toolsaf.adapters.android_manifest_scan import AndroidManifestScan
 from toolsaf.adapters.censys_scan import CensysScan
+from toolsaf.adapters.compression import split_compression
 from toolsaf.adapters.har_scan import HARScan
 from toolsaf.adapters.certmitm_reader import CertMITMReader
 from toolsaf.adapters.nmap_scan import NMAPScan
@@ -45,8 +46,8 @@ class ToolDepiction:
     def create_tool(self, system: IoTSystem, file_extension: str="") -> Optional[ToolAdapter]:
         """Create tool, optionally by data file extension"""
         if file_extension:
-            file_extension = file_extension.lower()
-            file_extension = file_extension[1:] if file_extension.startswith(".") else file_extension
+            # use the inner suffix of compressed files, e.g. 'pcap' for '.pcap.gz'
+            file_extension = split_compression(file_extension.lower())[0].rpartition(".")[2]
             tc = self.tools.get(file_extension)
         else:
             tc = next(iter(self.tools.values()), None)
@@ -4,13 +4,17 @@ from io import BufferedReader
 import json
 import logging
 from functools import wraps
-from typing import Optional, Dict, Set, Callable, Any
+from typing import Optional, Dict, Sequence, Set, Callable, Any, Tuple
 
+from toolsaf.adapters.capture_filter import CaptureFilter
+from toolsaf.adapters.capture_sampling import CaptureSampling
 from toolsaf.common.address import DNSName, IPAddress, AnyAddress
-from toolsaf.core.event_interface import EventInterface
+from toolsaf.core.event_interface import EventInterface, PropertyEvent
 from toolsaf.core.model import NetworkNode, Addressable, IoTSystem, NodeComponent
 from toolsaf.common.traffic import Evidence, EvidenceSource, Tool, IPFlow
 from toolsaf.common.basics import Status
+from toolsaf.common.property import Properties
+from toolsaf.common.verdict import Verdict
 
 
 class IncorrectBatchFileExcpetion(Exception):
@@ -41,6 +45,13 @@ class ToolAdapter:
         self.logger = logging.getLogger(tool_label)
         self.send_events = True  # True to send events to interface
         self.load_baseline = False  # True to load baseline, false to check it
+        self.capture_filter: Optional[CaptureFilter] = None  # filter for captured packets
+        self.sampling: Optional[CaptureSampling] = None  # sampling of captured packets
+
+    def set_options(self, options: Dict[str, Any]) -> None:
+        """Set tool-specific options, e.g. from metafile"""
+        for key in options:
+            self.logger.warning("Unknown option '%s' for %s", key, self.tool_label)
 
     def process_file(self, data: BufferedReader, file_name: str,
                      interface: EventInterface, source: EvidenceSource) -> bool:
@@ -48,6 +59,20 @@ class ToolAdapter:
         # Read a data file
         raise NotImplementedError(f"In {self.__class__.__name__}")
 
+    def process_merged_files(self, files: Sequence[Tuple[BufferedReader, str, EvidenceSource]],
+                             interface: EventInterface) -> None:
+        """Process several tool result files merged into one, by default one by one"""
+        for data, file_name, source in files:
+            self.process_file(data, file_name, interface, source)
+
+    def send_sampling(self, interface: EventInterface, source: EvidenceSource) -> None:
+        """Tell that results are partial, if captured packets were sampled"""
+        if self.sampling is None:
+            return
+        key = Properties.PARTIAL.append_key(source.label)
+        explanation = f"{source.name}: {self.sampling.get_explanation()}"
+        interface.property_update(PropertyEvent(Evidence(source), self.system, key.verdict(Verdict.INCON, explanation)))
+
     def get_file_by_name(self, name: str) -> str:
         """Get data file by name"""
         assert self.data_file_suffix, "Data file suffix not set"
@@ -230,8 +255,10 @@ class SimpleFlowTool(SystemWideTool):
     def process_file(self, data: BufferedReader, file_name: str, interface: EventInterface,
                      source: EvidenceSource) -> bool:
         raw_json = json.load(data)
+        flows = []
         for raw_flow in raw_json.get("flows", []):
             flow = IPFlow.parse_from_json(raw_flow)
             flow.evidence = Evidence(source)
-            interface.connection(flow)
+            flows.append(flow)
+        interface.connections(flows)
         return True
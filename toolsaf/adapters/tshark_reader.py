@@ -2,10 +2,11 @@
 
 import argparse
 from datetime import datetime, timezone
+from functools import partial
 from io import BufferedReader
 import json
 import pathlib
-from typing import Dict, Optional, Any
+from typing import Dict, Hashable, Optional, Any, Tuple
 
 from toolsaf.common.address import HWAddress
 from toolsaf.core.event_interface import EventInterface
@@ -40,16 +41,30 @@ class TSharkReader(SystemWideTool):
     def parse(self, raw: Dict[Any, Any], interface: EventInterface) -> None:
         """Parse JSON"""
         assert self.source
+        sampling = self.sampling
+        if sampling:
+            sampling.reset()
         ads = set()
         for nr, sf in enumerate(raw):
             fl = sf["_source"]["layers"]
             pf = fl.get("bthci_evt")
             if pf:
-                ev = Evidence(self.source, f":{nr + 1}")
                 r_time = float(fl["frame"]["frame.time_epoch"])
+                if sampling and not sampling.accept(r_time, partial(self._flow_key, pf)):
+                    if sampling.finished:
+                        break
+                    continue
+                ev = Evidence(self.source, f":{nr + 1}")
                 self.source.timestamp = datetime.fromtimestamp(round(r_time), timezone.utc)
                 ad = self.parse_hvc_event(pf, interface, ev)
                 ads.add(ad)
+        if sampling:
+            self.send_sampling(interface, self.source)
+
+    @classmethod
+    def _flow_key(cls, raw: Dict[str, Any]) -> Tuple[Hashable, bool]:
+        """Flow key of HVC event for sampling"""
+        return (raw.get('bthci_evt.bd_addr'), raw.get('bthci_evt.le_advts_event_type')), False
 
     def parse_hvc_event(self, raw: Dict[str, Any], interface: EventInterface, evidence: Evidence) -> HWAddress:
         """Parse HVC event"""
@@ -16,6 +16,8 @@ from toolsaf.common.address import (AddressAtNetwork, Addresses, AnyAddress, DNS
 from toolsaf.common.traffic import EvidenceSource
 from toolsaf.common.basics import ConnectionType, ExternalActivity, HostType, Status
 from toolsaf.adapters.batch_import import BatchImporter, LabelFilter
+from toolsaf.adapters.capture_filter import CaptureFilter
+from toolsaf.adapters.capture_sampling import CaptureSampling
 from toolsaf.core.components import CookieData, Cookies, DataReference, StoredData, OperatingSystem, Software
 from toolsaf.common.property import PropertyVerdictValue
 from toolsaf.core.event_logger import EventLogger
@@ -31,6 +33,7 @@ from toolsaf.main import (ARP, DHCP, DNS, EAPOL, ICMP, NTP, SSH, HTTP, TCP, UDP,
 from toolsaf.core.model import Addressable, Connection, Host, IoTSystem, SensitiveData, Service
 from toolsaf.common.property import Properties, PropertyKey
 from toolsaf.core.inspector import Inspector
+from toolsaf.core.session_table import SessionTable
 from toolsaf.core.result import Report
 from toolsaf.core.components import SoftwareComponent
 from toolsaf.core.services import DHCPService, DNSService
@@ -447,8 +450,8 @@ class ServiceBackend(NodeBackend, ServiceBuilder):
         if self.source_fixer:
             assert isinstance(s, HostBackend)
             s = self.source_fixer(s)
-        for c in s.entity.get_parent_host().connections:
-            if c.source == s.entity and c.target == self.entity:
+        for c in self.system.system.connection_registry.get_by_target(self.entity):
+            if c.source == s.entity:
                 # referring existing connection
                 return ConnectionBackend(c, (s, self))
         c = Connection(s.entity, self.entity)
@@ -1189,6 +1192,14 @@ class SystemBackendRunner(SystemBackend):
                             help="List tools read from batch")
         parser.add_argument("--def-loads", "-L", type=str,
                             help="Comma-separated list of tools to load")
+        parser.add_argument("--capture-filter", "-F", type=CaptureFilter,
+                            help="Filter for captured packets, e.g. 'not port 22'")
+        parser.add_argument("--sampling", type=CaptureSampling,
+                            help="Sample captured packets for quick look, e.g. 'end=+10m,packets=100000,flows=10'")
+        parser.add_argument("--session-limit", type=int, default=0,
+                            help="Limit number of remembered sessions and matched flows")
+        parser.add_argument("--session-ports", type=int, default=0,
+                            help="Client ports from this on are treated as one session, e.g. 49152")
         parser.add_argument("--with-files", "-w", action="store_true", help="Show relevant result files for verdicts")
         parser.add_argument("-s", "--show", type=lambda s: s.split(","), default=[],
                             help="Show additional info in output. Valid values: all, properties, ignored, irrelevant")
@@ -1261,7 +1272,11 @@ class SystemBackendRunner(SystemBackend):
 
         self.finish_()
 
-        event_logger = EventLogger(Inspector(self.system, self.system.ignore_rules))
+        inspector = Inspector(self.system, self.system.ignore_rules)
+        if args.session_limit or args.session_ports:
+            inspector.sessions = SessionTable(limit=args.session_limit, ephemeral_ports=args.session_ports)
+            inspector.matcher.observed_limit = args.session_limit
+        event_logger = EventLogger(inspector)
 
         for event in events:
             if not isinstance(event, EvidenceSource):
@@ -1274,7 +1289,8 @@ class SystemBackendRunner(SystemBackend):
         label_filter = LabelFilter(args.def_loads or "")
 
         # load file batches, if defined
-        batch_import = BatchImporter(event_logger, label_filter=label_filter)
+        batch_import = BatchImporter(event_logger, label_filter=label_filter, capture_filter=args.capture_filter,
+                                     sampling=args.sampling)
         for in_file in args.read or []:
             batch_import.import_batch(Path(in_file))
 
@@ -1,6 +1,6 @@
 """Base entity class and related classes"""
 
-from typing import Dict, Optional, Self, List, Any, Tuple, Iterable, Iterator
+from typing import Dict, Optional, Self, List, Any, Tuple, Iterable, Iterator, SupportsIndex, TypeVar
 
 from toolsaf.common.basics import Status
 from toolsaf.common.verdict import Verdict
@@ -11,10 +11,36 @@ from toolsaf.common.address import AddressSequence, AnyAddress
 
 class Entity:
     """An entity, network node or connection"""
+    verdict_epoch = 0  # changed when status of a model entity changes, as it may change relevance of any entity
+
     def __init__(self) -> None:
         self.concept_name = "other"
-        self.status = Status.UNEXPECTED
-        self.properties: Dict[PropertyKey, Any] = {}
+        self.verdict_parents: List[Entity] = []  # entities which have this entity in their verdict
+        self.verdict_value: Optional[Tuple[int, Verdict]] = None  # cached verdict with verdict epoch
+        self._status = Status.UNEXPECTED
+        self._properties = EntityProperties(self)
+
+    @property
+    def properties(self) -> Dict[PropertyKey, Any]:
+        """Entity properties"""
+        return self._properties
+
+    @properties.setter
+    def properties(self, value: Dict[PropertyKey, Any]) -> None:
+        self._properties = EntityProperties(self)
+        self._properties.update(value)  # invalidates the verdict
+
+    @property
+    def status(self) -> Status:
+        """Entity status"""
+        return self._status
+
+    @status.setter
+    def status(self, value: Status) -> None:
+        if value != self._status:
+            self._status = value
+            if self.verdict_parents:
+                Entity.verdict_epoch += 1
 
     def long_name(self) -> str:
         """Get long name, possibly with spaces"""
@@ -52,17 +78,29 @@ class Entity:
         return ()
 
     def get_verdict(self, cache: Dict['Entity', Verdict]) -> Verdict:
-        """Get aggregate verdict"""
-        v = cache.get(self)
-        if v is None:
-            for c in self.get_children():
-                v = Verdict.aggregate(v, c.get_verdict(cache))
-            for p in self.properties.values():
-                v = Verdict.aggregate(v, p.get_verdict()) if isinstance(p, Verdictable) else v
-            if v == Verdict.PASS:
-                v = self.get_expected_verdict()  # expected has veto
-            cache[self] = v = v or Verdict.INCON
-        return v
+        """Get aggregate verdict, maintained until a property or structure changes"""
+        vv = self.verdict_value
+        if vv is None or vv[0] != Entity.verdict_epoch:
+            vv = self.verdict_value = Entity.verdict_epoch, self.aggregate_verdict(cache)
+        cache[self] = vv[1]
+        return vv[1]
+
+    def aggregate_verdict(self, cache: Dict['Entity', Verdict]) -> Verdict:
+        """Aggregate verdict from children and properties"""
+        vs = {c.get_verdict(cache) for c in self.get_children()}
+        vs.update(p.get_verdict() for p in self.properties.values() if isinstance(p, Verdictable))
+        v = Verdict.aggregate(*vs) if vs else None
+        if v == Verdict.PASS:
+            v = self.get_expected_verdict()  # expected has veto
+        return v or Verdict.INCON
+
+    def invalidate_verdict(self) -> None:
+        """Invalidate cached verdict of this entity and the entities aggregating it"""
+        entities: List[Entity] = [self]
+        while entities:
+            e = entities.pop()
+            e.verdict_value = None
+            entities.extend(e.verdict_parents)
 
     def is_expected(self) -> bool:
         """Is an expected entity?"""
@@ -117,3 +155,107 @@ class Entity:
     def __repr__(self) -> str:
         s = f"{self.status_string()} {self.long_name()}"
         return s
+
+
+class EntityProperties(Dict[PropertyKey, Any]):
+    """Entity properties, which invalidate the entity verdict on change"""
+    def __init__(self, owner: Entity) -> None:
+        super().__init__()
+        self.owner = owner
+
+    def __setitem__(self, key: PropertyKey, value: Any) -> None:
+        if key in self and self[key] == value:
+            return  # no change
+        super().__setitem__(key, value)
+        self.owner.invalidate_verdict()
+
+    def __delitem__(self, key: PropertyKey) -> None:
+        super().__delitem__(key)
+        self.owner.invalidate_verdict()
+
+    def pop(self, *args: Any) -> Any:
+        v = super().pop(*args)
+        self.owner.invalidate_verdict()
+        return v
+
+    def popitem(self) -> Tuple[PropertyKey, Any]:
+        kv = super().popitem()
+        self.owner.invalidate_verdict()
+        return kv
+
+    def setdefault(self, key: PropertyKey, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        super().update(*args, **kwargs)
+        self.owner.invalidate_verdict()
+
+    def clear(self) -> None:
+        super().clear()
+        self.owner.invalidate_verdict()
+
+    def __ior__(self, value: Any) -> Self:  # type: ignore[override,misc]
+        self.update(value)
+        return self
+
+
+EntityT = TypeVar("EntityT", bound=Entity)
+
+
+class EntityList(List[EntityT]):
+    """List of child entities, which invalidates the owner verdict on change"""
+    def __init__(self, owner: Entity) -> None:
+        super().__init__()
+        self.owner = owner
+
+    def added(self, entities: Iterable[EntityT]) -> None:
+        """Entities added to the list"""
+        for e in entities:
+            if self.owner not in e.verdict_parents:
+                e.verdict_parents.append(self.owner)
+        self.owner.invalidate_verdict()
+
+    def removed(self) -> None:
+        """Entities removed from the list"""
+        self.owner.invalidate_verdict()
+
+    def append(self, entity: EntityT) -> None:
+        super().append(entity)
+        self.added((entity,))
+
+    def insert(self, index: SupportsIndex, entity: EntityT) -> None:
+        super().insert(index, entity)
+        self.added((entity,))
+
+    def extend(self, entities: Iterable[EntityT]) -> None:
+        es = list(entities)
+        super().extend(es)
+        self.added(es)
+
+    def __iadd__(self, entities: Iterable[EntityT]) -> Self:  # type: ignore[override,misc]
+        self.extend(entities)
+        return self
+
+    def remove(self, entity: EntityT) -> None:
+        super().remove(entity)
+        self.removed()
+
+    def pop(self, index: SupportsIndex = -1) -> EntityT:
+        e = super().pop(index)
+        self.removed()
+        return e
+
+    def clear(self) -> None:
+        super().clear()
+        self.removed()
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        super().__setitem__(index, value)
+        self.removed()
+        self.added(value if isinstance(index, slice) else (value,))
+
+    def __delitem__(self, index: Any) -> None:
+        super().__delitem__(index)
+        self.removed()
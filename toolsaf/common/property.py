@@ -253,6 +253,8 @@ class Properties:
     DATA_CONFIRMED = PropertyKey("check", "data")    # Presence of data confirmed
     HTTP_REDIRECT = PropertyKey("default", "http-redirect").persistent()  # HTTP redirect detected
     SENSORS = PropertyKey("default", "sensors").persistent()  # Has sensors
+    TRAFFIC = PropertyKey("default", "traffic")  # Traffic volume seen in capture
+    PARTIAL = PropertyKey("default", "partial")  # Only part of the data used, e.g. sampled capture
     MITM = PropertyKey("check", "mitm")              # MITM successful?
     UPDATE_SEEN = PropertyKey("check", "update-seen")  # Update is seen
     REVIEW = PropertyKey("check", "review")          # IXIT etc. review
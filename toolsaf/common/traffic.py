@@ -1,5 +1,6 @@
 """Traffic flow and events"""
 
+from dataclasses import dataclass
 import datetime
 from typing import Any, List, Tuple, Set, Optional, Self, Dict
 
@@ -35,6 +36,22 @@ class EvidenceSource:
         return f"{self.name} {self.base_ref}"
 
 
+@dataclass(frozen=True)
+class TrafficVolume:
+    """Traffic volume of a connection, as property value"""
+    packets: int
+    bytes: int
+    first: datetime.datetime
+    last: datetime.datetime
+
+    def __add__(self, other: 'TrafficVolume') -> 'TrafficVolume':
+        return TrafficVolume(self.packets + other.packets, self.bytes + other.bytes,
+                             min(self.first, other.first), max(self.last, other.last))
+
+    def __repr__(self) -> str:
+        return f"{self.packets} packets, {self.bytes} bytes, {self.first.isoformat()} - {self.last.isoformat()}"
+
+
 class Evidence:
     """Piece of evidence"""
     def __init__(self, source: EvidenceSource, tail_ref: str="") -> None:
@@ -157,6 +174,11 @@ class Flow(Event):
         """Get target top address"""
         raise NotImplementedError()
 
+    def get_matching_key(self) -> Tuple[Any, ...]:
+        """Get key of the values used to match the flow, evidence and properties are not included"""
+        return type(self), self.network, self.protocol, self.stack(False), self.stack(True), \
+            self.port(False), self.port(True)
+
     def __hash__(self) -> int:
         return self.protocol.__hash__() ^ hash(self.properties)
 
@@ -1,17 +1,29 @@
 """Address range matching"""
 
-from ipaddress import IPv4Address
-from typing import List, Optional, Tuple, Any
+import bisect
+from ipaddress import IPv4Address, IPv6Address
+from typing import Dict, Generic, List, Optional, Sequence, Tuple, Any, TypeVar
 from pydantic import GetCoreSchemaHandler
 from pydantic_core import core_schema
 
-from toolsaf.common.address import Addresses, AnyAddress, IPAddress
+from toolsaf.common.address import Addresses, AnyAddress, IPAddress, Network, Protocol
 
 
 class AddressRange:
     """Address range"""
     def __init__(self, parts: List[Tuple[int, int]]) -> None:
         self.parts = parts
+        # compiled: fixed octets by mask and value, other octets by shift and range
+        self.mask = 0
+        self.value = 0
+        self.octet_ranges: List[Tuple[int, int, int]] = []
+        for i, (low, high) in enumerate(parts):
+            shift = 8 * (len(parts) - 1 - i)
+            if low == high:
+                self.mask |= 0xff << shift
+                self.value |= low << shift
+            elif (low, high) != (0, 255):
+                self.octet_ranges.append((shift, low, high))
 
     @classmethod
     def parse_range(cls, specification: str, delimiter: str = ".") -> 'AddressRange':
@@ -50,8 +62,11 @@ class AddressRange:
         """Check if address matches the range"""
         match address:
             case IPAddress() if len(self.parts) == 4 and isinstance(address.data, IPv4Address):
-                for i, octet in enumerate(address.data.packed):
-                    if not self.parts[i][0] <= octet <= self.parts[i][1]:
+                value = int(address.data)
+                if value & self.mask != self.value:
+                    return False
+                for shift, low, high in self.octet_ranges:
+                    if not low <= (value >> shift) & 0xff <= high:
                         return False
                 return True
         return False
@@ -142,6 +157,7 @@ class PortRange:
     def __init__(self, ranges: List[Tuple[int, int]]) -> None:
         # Check that ranges are valid and non-overlapping
         self.ranges = ranges
+        self.starts = [ra[0] for ra in ranges]  # for bisecting
         i = -1
         for ra in ranges:
             start, end = ra
@@ -167,10 +183,8 @@ class PortRange:
 
     def is_match(self, port: int) -> bool:
         """Check if port matches the range"""
-        for ra in self.ranges:
-            if ra[0] <= port <= ra[1]:
-                return True
-        return False
+        i = bisect.bisect_right(self.starts, port) - 1
+        return i >= 0 and port <= self.ranges[i][1]
 
     def get_name(self) -> str:
         """Get name for the port range"""
@@ -234,3 +248,106 @@ class PortRange:
 
 # Null range
 NULL_PORT_RANGE = PortRange([])
+
+
+T = TypeVar("T")
+
+
+class PortRangeIndex(Generic[T]):
+    """Port ranges by protocol sorted into intervals, for finding values by port"""
+    def __init__(self) -> None:
+        self.starts: Dict[Protocol, List[int]] = {}
+        self.intervals: Dict[Protocol, List[Tuple[int, int, int]]] = {}  # start, end, value index
+        self.max_ends: Dict[Protocol, List[int]] = {}  # max. end of intervals up to index
+        self.values: List[T] = []
+
+    def add(self, protocol: Protocol, port_range: PortRange, value: T) -> None:
+        """Add value for port range"""
+        index = len(self.values)
+        self.values.append(value)
+        starts = self.starts.setdefault(protocol, [])
+        intervals = self.intervals.setdefault(protocol, [])
+        for start, end in port_range.ranges:
+            i = bisect.bisect_right(starts, start)
+            starts.insert(i, start)
+            intervals.insert(i, (start, end, index))
+        max_ends = []
+        max_end = -1
+        for _, end, _ in intervals:
+            max_end = max(max_end, end)
+            max_ends.append(max_end)
+        self.max_ends[protocol] = max_ends
+
+    def find(self, protocol: Protocol, port: int) -> Sequence[T]:
+        """Find values with port in range, in the order they were added"""
+        starts = self.starts.get(protocol)
+        if not starts:
+            return ()
+        i = bisect.bisect_right(starts, port) - 1
+        intervals, max_ends = self.intervals[protocol], self.max_ends[protocol]
+        indices = []
+        while i >= 0 and max_ends[i] >= port:
+            # overlapping ranges are all visited
+            if port <= intervals[i][1]:
+                indices.append(intervals[i][2])
+            i -= 1
+        if len(indices) > 1:
+            indices.sort()
+        return [self.values[j] for j in indices]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class NetworkClassifier:
+    """Classify addresses into local networks by network prefixes, with bounded cache of IP addresses"""
+    def __init__(self, networks: List[Network], cache_size: int = 4096) -> None:
+        self.networks = tuple(networks)
+        self.ip_networks = tuple(nw.ip_network for nw in networks)  # to detect changes
+        # network indices by prefix, per IP version and prefix length
+        self.prefixes: Dict[int, List[Tuple[int, Dict[int, List[int]]]]] = {4: [], 6: []}
+        for i, ip_network in enumerate(self.ip_networks):
+            if ip_network is None:
+                continue
+            by_length = self.prefixes[ip_network.version]
+            shift = ip_network.max_prefixlen - ip_network.prefixlen
+            for s, by_prefix in by_length:
+                if s == shift:
+                    break
+            else:
+                by_prefix = {}
+                by_length.append((shift, by_prefix))
+            by_prefix.setdefault(int(ip_network.network_address) >> shift, []).append(i)
+        self.cache_size = cache_size
+        self.cache: Dict[IPv4Address | IPv6Address, Tuple[Network, ...]] = {}
+
+    def is_valid_for(self, networks: List[Network]) -> bool:
+        """Is the classifier valid for the networks, which may have changed?"""
+        if len(networks) != len(self.networks):
+            return False
+        for i, nw in enumerate(networks):
+            if nw is not self.networks[i] or nw.ip_network is not self.ip_networks[i]:
+                return False
+        return True
+
+    def get_local_networks(self, address: AnyAddress) -> Tuple[Network, ...]:
+        """Get networks the address is local for, in the order of the networks"""
+        h = address.get_host()
+        if not isinstance(h, IPAddress):
+            return self.networks
+        data = h.data
+        nws = self.cache.get(data)
+        if nws is None:
+            if h.is_multicast() or h.is_null():
+                nws = self.networks
+            else:
+                value = int(data)
+                indices: List[int] = []
+                for shift, by_prefix in self.prefixes[data.version]:
+                    indices.extend(by_prefix.get(value >> shift, ()))
+                indices.sort()
+                nws = tuple(self.networks[i] for i in indices)
+            if len(self.cache) >= self.cache_size:
+                self.cache.pop(next(iter(self.cache)))  # drop the oldest
+            self.cache[data] = nws
+        return nws
@@ -1,12 +1,12 @@
 """Event interface to consume model events"""
 
-from typing import Dict, List, Optional, Type, Callable, Any, Tuple
+from typing import Dict, List, Optional, Sequence, Type, Callable, Any, Tuple
 
 from toolsaf.common.address import AnyAddress
 from toolsaf.common.verdict import Verdict
 from toolsaf.common.entity import Entity
 from toolsaf.core.model import Connection, Host, IoTSystem, Service
-from toolsaf.common.property import PropertyKey
+from toolsaf.common.property import PropertyKey, PropertySetValue, PropertyVerdictValue
 from toolsaf.core.services import NameEvent
 from toolsaf.common.traffic import ServiceScan, HostScan, Event, Flow, IPFlow, EthernetFlow, BLEAdvertisementFlow, \
     Evidence
@@ -35,10 +35,22 @@ class EventInterface:
         """Inspect the given flow"""
         raise NotImplementedError()
 
+    def connections(self, flows: Sequence[Flow]) -> List[Optional[Connection]]:
+        """Inspect the given flows in order"""
+        return [self.connection(f) for f in flows]
+
+    def matched_connections(self, flows: Sequence[Flow]) -> List[Tuple[Optional[Connection], Optional[Connection]]]:
+        """Inspect the given flows in order, return the matched connections and the results of inspection"""
+        return [(c, c) for c in self.connections(flows)]
+
     def name(self, event: NameEvent) -> Optional[Host]:
         """Learn a name"""
         raise NotImplementedError()
 
+    def names(self, events: Sequence[NameEvent]) -> List[Optional[Host]]:
+        """Learn the given names in order"""
+        return [self.name(e) for e in events]
+
     def property_update(self, update: 'PropertyEvent') -> Optional[Entity]:
         """Update to property value"""
         raise NotImplementedError()
@@ -75,7 +87,10 @@ class PropertyEvent(Event, Verdictable):
         return v.get_verdict() if isinstance(v, Verdictable) else Verdict.INCON
 
     def get_info(self) -> str:
-        return self.key_value[0].get_explanation(self.key_value[1])
+        key, value = self.key_value
+        if isinstance(value, (PropertyVerdictValue, PropertySetValue)):
+            return key.get_explanation(value)
+        return f"{value}"
 
     def get_value_string(self) -> str:
         return f"{self.key_value[0]}: {self.get_info()}"
@@ -2,7 +2,7 @@
 
 from logging import Logger
 import logging
-from typing import Any, List, Set, Tuple, Optional
+from typing import Any, List, Sequence, Set, Tuple, Optional
 from toolsaf.common.verdict import Verdict, Verdictable
 
 from toolsaf.common.entity import Entity
@@ -128,7 +128,20 @@ class EventLogger(EventInterface, ModelListener):
 
     def connection(self, flow: Flow) -> Optional[Connection]:
         lo = self._add(flow)
-        e = self.inspector.connection(flow)
+        return self._log_connection(lo, self.inspector.connection(flow))
+
+    def connections(self, flows: Sequence[Flow]) -> List[Optional[Connection]]:
+        return [c for _, c in self.matched_connections(flows)]
+
+    def matched_connections(self, flows: Sequence[Flow]) -> List[Tuple[Optional[Connection], Optional[Connection]]]:
+        r: List[Tuple[Optional[Connection], Optional[Connection]]] = []
+        for flow, key in zip(flows, self.inspector.matcher.connections(flows)):
+            lo = self._add(flow)
+            r.append((key[0], self._log_connection(lo, self.inspector.inspect_connection(flow, key))))
+        return r
+
+    def _log_connection(self, lo: LoggingEvent, e: Optional[Connection]) -> Optional[Connection]:
+        """Log inspected connection"""
         if e is None:
             return None
         lo.pick_entity_verdict(e)
@@ -1,7 +1,7 @@
 """Model inspector"""
 
 import logging
-from typing import Dict, Optional, Set, List
+from typing import Dict, Optional, Sequence, Set, List, Tuple
 
 from toolsaf.common.address import AnyAddress
 from toolsaf.common.basics import ExternalActivity, Status
@@ -12,6 +12,7 @@ from toolsaf.core.model import IoTSystem, Connection, Service, Host, Addressable
 from toolsaf.core.ignore_rules import IgnoreRules
 from toolsaf.common.property import Properties
 from toolsaf.core.services import NameEvent
+from toolsaf.core.session_table import SessionTable
 from toolsaf.common.traffic import EvidenceSource, ServiceScan, HostScan, Flow
 from toolsaf.common.verdict import Verdict
 
@@ -25,7 +26,7 @@ class Inspector(EventInterface):
         self.ignore_rules = ignore_rules if ignore_rules else IgnoreRules()
         self.logger = logging.getLogger("inspector")
         self.connection_count: Dict[Connection, int] = {}  # count connections
-        self.direction: Dict[Flow, bool] = {}              # direction: false = request, true = reply
+        self.sessions = SessionTable()                      # seen sessions, i.e. flow directions
         self.known_entities: Set[Entity] = set()            # known entities
         self._list_hosts()
 
@@ -52,8 +53,22 @@ class Inspector(EventInterface):
         return self.system
 
     def connection(self, flow: Flow) -> Optional[Connection]:
+        return self.inspect_connection(flow, self.matcher.connection_w_ends(flow))
+
+    def connections(self, flows: Sequence[Flow]) -> List[Optional[Connection]]:
+        matches = self.matcher.connections(flows)
+        return [self.inspect_connection(f, next(matches)) for f in flows]
+
+    def matched_connections(self, flows: Sequence[Flow]) -> List[Tuple[Optional[Connection], Optional[Connection]]]:
+        r: List[Tuple[Optional[Connection], Optional[Connection]]] = []
+        for f, key in zip(flows, self.matcher.connections(flows)):
+            r.append((key[0], self.inspect_connection(f, key)))
+        return r
+
+    def inspect_connection(self, flow: Flow, key: Tuple[Connection, AnyAddress, AnyAddress, bool]) \
+            -> Optional[Connection]:
+        """Inspect flow with matched connection and endpoint addresses"""
         self.logger.debug("inspect flow %s", flow)
-        key = self.matcher.connection_w_ends(flow)
         conn, source_add, target_add, reply = key
         assert conn.status != Status.PLACEHOLDER, f"Received placeholder connection: {conn}"
 
@@ -64,10 +79,7 @@ class Inspector(EventInterface):
         new_conn = conn_c == 1  # new connection?
 
         # detect new sessions
-        conn_dir = self.direction.get(flow)
-        new_direction = conn_dir is None  # new direction?
-        if new_direction:
-            self.direction[flow] = not reply
+        new_direction = self.sessions.is_new(conn, flow, reply)  # new direction?
 
         if not (new_conn or new_direction):
             return None  # old connection, old direction -> discard
@@ -86,16 +98,11 @@ class Inspector(EventInterface):
             if not update_seen_status(target):
                 return False
             host_add = address.get_host()
-            for c in self.system.get_connections():
-                if c.source != source:
-                    continue  # only connections from the same source
-                c_target = c.target
-                if not isinstance(c_target, Service) or not c_target.multicast_target:
-                    continue
-                # found connection with multicast target -> check if it matches
-                if not c_target.multicast_target.is_match(host_add):
+            for c in self.matcher.get_engine().get_multicast_listeners(source, host_add):
+                if not c.is_relevant(ignore_ends=True):
                     continue
-                for target_add in c_target.addresses:
+                # found connection with matching multicast target -> check the endpoint
+                for target_add in c.target.addresses:
                     m_add = target_add.change_host(host_add)
                     if m_add == address:
                         break
@@ -172,6 +179,20 @@ class Inspector(EventInterface):
         return conn
 
     def name(self, event: NameEvent) -> Optional[Host]:
+        h = self._learn_name(event)
+        if h:
+            self.system.call_listeners(lambda ln: ln.address_change(h))
+        return h
+
+    def names(self, events: Sequence[NameEvent]) -> List[Optional[Host]]:
+        hosts = [self._learn_name(e) for e in events]
+        # listeners are called once per changed host
+        for h in dict.fromkeys(h for h in hosts if h):
+            self.system.call_listeners(lambda ln: ln.address_change(h))  # pylint: disable=cell-var-from-loop
+        return hosts
+
+    def _learn_name(self, event: NameEvent) -> Optional[Host]:
+        """Learn a name, return the host or None if nothing changed"""
         address = event.address
         if event.service and event.service.captive_portal \
                 and event.address in event.service.get_parent_host().addresses:
@@ -198,8 +219,6 @@ class Inspector(EventInterface):
         elif not changes:
             # old host and nothing learned -> stop this maddness to save resources
             return None
-        if h:
-            self.system.call_listeners(lambda ln: ln.address_change(h))
         return h
 
     def property_update(self, update: PropertyEvent) -> Optional[Entity]:
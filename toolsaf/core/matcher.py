@@ -1,12 +1,13 @@
 """Match events into system model"""
 
-from typing import Optional, Tuple, Dict
+from typing import Any, FrozenSet, Iterable, Iterator, Optional, Tuple, Dict
 
 from dataclasses import dataclass
 
 from toolsaf.common.address import AnyAddress, EndpointAddress, IPAddress
 from toolsaf.common.basics import ExternalActivity, Status
-from toolsaf.core.matcher_engine import FlowMatcher, MatcherEngine
+from toolsaf.common.entity import Entity
+from toolsaf.core.matcher_engine import FlowMatcher, MatcherEngine, SourceOverlay
 from toolsaf.core.model import IoTSystem, Connection, Host, Addressable, Service, EvidenceNetworkSource, ModelListener
 from toolsaf.common.traffic import NO_EVIDENCE, Flow, EvidenceSource
 from toolsaf.common.verdict import Verdict
@@ -17,11 +18,18 @@ class SystemMatcher(ModelListener):
     def __init__(self, system: IoTSystem) -> None:
         self.system = system
         self.contexts: Dict[EvidenceSource, MatchingContext] = {}
+        self.engine: Optional[MatcherEngine] = None  # shared by all contexts, loaded on demand
+        # matched connections by address mappings and flow matching key, valid for one engine generation
+        self.memo: Dict[Tuple[FrozenSet[Tuple[AnyAddress, Addressable]], Tuple[Any, ...]], ConnectionMatch] = {}
+        self.memo_generation = -1, -1  # engine generation and entity verdict epoch of the memo
+        self.memo_size = 0x10000
+        self.observed_limit = 0  # maximum number of observed flows per context, 0 for no limit
         system.model_listeners.append(self)
 
     def address_change(self, host: Host) -> None:
-        for ctx in self.contexts.values():
-            ctx.engine.update_host(host)
+        if self.engine:
+            # reconciled when the engine is next used for matching
+            self.engine.mark_dirty(host)
 
     def connection(self, flow: Flow) -> Connection:
         """Find the connection matching the given flow"""
@@ -34,12 +42,59 @@ class SystemMatcher(ModelListener):
         m = ctx.get_connection(flow)
         return m.connection, m.source, m.target, m.reply
 
+    def connections(self, flows: Iterable[Flow]) -> Iterator[Tuple[Connection, AnyAddress, AnyAddress, bool]]:
+        """Find the connections matching the given flows, return also endpoint addresses.
+        Results are produced in the flow order. Flows with the same matching key share the memoized match."""
+        contexts: Dict[EvidenceSource, MatchingContext] = {}
+        for flow in flows:
+            source = flow.evidence.source
+            ctx = contexts.get(source)
+            if ctx is None:
+                ctx = contexts[source] = self.get_context(source)
+            # each flow is observed, so that flows differing by properties are recorded and reported
+            m = ctx.get_connection(flow)
+            yield m.connection, m.source, m.target, m.reply
+
     def endpoint(self, address: AnyAddress, source: EvidenceSource) -> Addressable:
         """Find endpoint by address"""
         ctx = self.get_context(source)
         e = ctx.get_endpoint(address)
         return e
 
+    def get_engine(self) -> MatcherEngine:
+        """Get the shared matcher engine, load system model into it on first call"""
+        if self.engine is None:
+            self.engine = MatcherEngine(self.system)
+            for c in self.system.get_connections(relevant_only=False):
+                self.engine.add_connection(c)
+            for h in self.system.get_hosts():
+                self.engine.add_host(h)
+        return self.engine
+
+    def memo_state(self) -> Tuple[int, int]:
+        """Get state of the model for memoized matches, changed by matcher engine updates and status changes"""
+        return self.get_engine().generation, Entity.verdict_epoch
+
+    def get_memo(self, fingerprint: FrozenSet[Tuple[AnyAddress, Addressable]], flow: Flow) \
+            -> Optional['ConnectionMatch']:
+        """Get memoized connection match for flow, if the model has not changed since"""
+        state = self.memo_state()
+        if self.memo_generation != state:
+            self.memo.clear()
+            self.memo_generation = state
+            return None
+        return self.memo.get((fingerprint, flow.get_matching_key()))
+
+    def set_memo(self, fingerprint: FrozenSet[Tuple[AnyAddress, Addressable]], flow: Flow,
+                 match: 'ConnectionMatch', state: Tuple[int, int]) -> None:
+        """Memoize connection match for flow, if the model state is still the one it was matched with"""
+        if state != self.memo_state():
+            return  # model changed after matching, e.g. status of placeholder connection
+        if self.memo_generation != state or len(self.memo) >= self.memo_size:
+            self.memo.clear()
+            self.memo_generation = state
+        self.memo[fingerprint, flow.get_matching_key()] = match
+
     def get_context(self, source: Optional[EvidenceSource] = None) -> 'MatchingContext':
         """Get matching context for source"""
         source = NO_EVIDENCE.source if source is None else source
@@ -67,19 +122,18 @@ class MatchingContext:
     def __init__(self, system: SystemMatcher, source: EvidenceSource) -> None:
         self.system = system
         self.observed: Dict[Flow, ConnectionMatch] = {}
-        self.engine = MatcherEngine(system.system)
-
-        # load system model into matching engine
-        for c in system.system.get_connections(relevant_only=False):
-            self.engine.add_connection(c)
-        for h in system.system.get_hosts():
-            self.engine.add_host(h)
+        self.observed_flows: Dict[Connection, Dict[Flow, None]] = {}  # observed flows by connection, in order
+        self.evictable: Dict[Flow, None] = {}  # observed flows which can be forgotten when over limit, oldest first
+        self.engine = system.get_engine()
 
         # load evidence source -specific address mappings
+        self.overlay = SourceOverlay(self.engine)
         self.source = source if isinstance(source, EvidenceNetworkSource) else None
+        self.fingerprint: FrozenSet[Tuple[AnyAddress, Addressable]] = frozenset()  # identifies address mappings
         if self.source:
             for ad, ent in self.source.address_map.items():
-                self.engine.add_address_mapping(ad, ent)
+                self.overlay.add_address_mapping(ad, ent)
+            self.fingerprint = frozenset(self.source.address_map.items())
 
             # TODO: Activity maps are now ignored. So far, matching work without them
             # assert not self.source.activity_map, "Activity map not supported in matcher engine"
@@ -96,20 +150,32 @@ class MatchingContext:
             # old connection
             return match
 
-        flow_matcher = FlowMatcher(self.engine, flow)
-        conn = flow_matcher.get_connection()
-        source_add, target_add = flow_matcher.get_host_addresses()
-        if isinstance(conn, Connection):
-            assert source_add is not None and target_add is not None
-            match = ConnectionMatch(conn, source_add, target_add, flow_matcher.reverse)
-            if not conn.target.is_service() and flow_matcher.reverse:
+        self.engine.reconcile()
+        memo_state = self.system.memo_state()
+        match = self.system.get_memo(self.fingerprint, flow)
+        if match:
+            # same flow matched with the same model, perhaps by other source
+            conn: Connection | Tuple[Optional[Addressable], Optional[Addressable]] = match.connection
+        else:
+            flow_matcher = FlowMatcher(self.engine, flow, self.overlay)
+            conn = flow_matcher.get_connection()
+            source_add, target_add = flow_matcher.get_host_addresses()
+            if isinstance(conn, Connection):
+                assert source_add is not None and target_add is not None
+                match = ConnectionMatch(conn, source_add, target_add, flow_matcher.reverse)
+        if match:
+            assert isinstance(conn, Connection)
+            source_add, target_add = match.source, match.target
+            if not conn.target.is_service() and match.reply:
                 # Reply to unexpected connection
                 self.create_unknown_service(match)
             if match.connection.status == Status.PLACEHOLDER:
                 # this is an UNEXPECTED connection found after reset
                 self.set_connection_status(match.connection, (conn.source, source_add), (conn.target, target_add))
-            self.observed[flow] = match
+            self.add_observed(flow, match)
+            self.system.set_memo(self.fingerprint, flow, match, memo_state)
         else:
+            assert not isinstance(conn, Connection)
             # no connection, must create new
             source, target = conn
             if source is None:
@@ -121,7 +187,7 @@ class MatchingContext:
             assert source_add is not None and target_add is not None
 
             match = self.new_connection((source, source_add), (target, target_add))
-            self.observed[flow] = match
+            self.add_observed(flow, match)
         connection = match.connection
         if not match.reply:
             self.system.system.connections[match.source, match.target] = connection
@@ -131,9 +197,38 @@ class MatchingContext:
         connection.target.new_connection(connection, flow, target=not match.reply)
         return match
 
+    def add_observed(self, flow: Flow, match: ConnectionMatch) -> None:
+        """Add or update observed flow match"""
+        old = self.observed.get(flow)
+        if old is not None:
+            self.observed_flows[old.connection].pop(flow)
+        self.observed[flow] = match
+        self.observed_flows.setdefault(match.connection, {})[flow] = None
+        if self.system.observed_limit:
+            if match.connection.target.is_service():
+                self.evictable[flow] = None
+            self.evict_observed()
+
+    def evict_observed(self) -> None:
+        """Forget the oldest observed flows over the limit, they are matched again if seen later.
+        Flows to a host without service are kept, as they are moved to new connections when the host replies"""
+        limit = self.system.observed_limit
+        while len(self.observed) > limit and self.evictable:
+            o_flow = next(iter(self.evictable))
+            del self.evictable[o_flow]
+            o_match = self.observed.get(o_flow)
+            if o_match is None or not o_match.connection.target.is_service():
+                continue  # not observed anymore or moved to a connection without service
+            del self.observed[o_flow]
+            flows = self.observed_flows[o_match.connection]
+            del flows[o_flow]
+            if not flows:
+                del self.observed_flows[o_match.connection]
+
     def get_endpoint(self, address: AnyAddress) -> Addressable:
         """Get endpoint by address, create new if not found"""
-        host = self.engine.find_host(address)
+        self.engine.reconcile()
+        host = self.engine.find_host(address, self.overlay)
         net = self.system.system.get_networks_for(address)
         if host:
             if not address.get_protocol_port():
@@ -236,13 +331,14 @@ class MatchingContext:
 
         target_host.connections.append(conn)
         self.engine.remove_connection(conn)  # remove old connection, we put it back with new target
-        conn.target = new_service
+        system.connection_registry.retarget(conn, new_service)
         self.engine.add_connection(conn)
         # create new connection for connections from same the source to the same target host, but different port
         new_c = None
         new_obs: Dict[Flow, ConnectionMatch] = {}
-        for o_flow, o_m in self.observed.items():
-            if o_m.connection == conn and o_m.target != service_address:
+        for o_flow in self.observed_flows.get(conn, ()):
+            o_m = self.observed[o_flow]
+            if o_m.target != service_address:
                 # same connection, but different target service
                 if new_c is None:
                     new_source = conn.source, o_m.source
@@ -254,4 +350,9 @@ class MatchingContext:
                     system.connections[o_m.source, o_m.target] = new_c
                 new_m = ConnectionMatch(new_c, o_m.source, o_m.target, o_m.reply)
                 new_obs[o_flow] = new_m
-        self.observed.update(new_obs)
+        for o_flow, new_m in new_obs.items():
+            self.add_observed(o_flow, new_m)
+        if self.system.observed_limit:
+            # the flows of the connection now have a service
+            self.evictable.update(dict.fromkeys(self.observed_flows.get(conn, ())))
+            self.evict_observed()
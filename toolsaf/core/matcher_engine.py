@@ -1,8 +1,10 @@
 """Connection and endpoint matching"""
 
-from typing import Any, Dict, List, Optional, Set, Tuple, cast
+import itertools
+import weakref
+from typing import Dict, Iterator, List, Optional, Set, Tuple, cast
 
-from toolsaf.core.address_ranges import MulticastTarget, PortRange
+from toolsaf.core.address_ranges import MulticastTarget, PortRange, PortRangeIndex
 from toolsaf.common.address import AddressAtNetwork, Addresses, AnyAddress, EndpointAddress, EntityTag, \
     Network, Protocol
 from toolsaf.common.basics import Status
@@ -16,17 +18,44 @@ class MatcherEngine:
         self.system = system
         self.endpoints: Dict[Addressable, AddressClue] = {}
         self.addresses: Dict[AddressAtNetwork, List[AddressClue]] = {}
-        self.wildcard_hosts: List[AddressClue] = []
+        # wildcard clues, matched by any address
+        self.wildcard_hosts: List[AddressClue] = []                                 # without endpoints
+        self.wildcard_services: Dict[Tuple[Protocol, int], List[AddressClue]] = {}  # by endpoint
+        self.wildcard_ranges: List[AddressClue] = []                                # with port ranges
+        self.wildcard_count = 0
+        # merged wildcard clues by endpoint, when there are many buckets to merge
+        self.merged_wildcards: Dict[Tuple[Protocol, int], List[AddressClue]] = {}
+        # wildcard clues for multicast address, listeners of other multicast targets filtered out
+        self.multicast_wildcards: Dict[Tuple[AddressAtNetwork, Protocol, int], List[AddressClue]] = {}
         self.connections: Dict[Connection, ConnectionClue] = {}
+        # connections to multicast listeners by source and multicast target
+        self.multicast_listeners: Dict[Addressable, Dict[MulticastTarget, List[Connection]]] = {}
+        self.generation = 0  # incremented by changes which may affect matching
+        self.dirty_hosts: Dict[Addressable, None] = {}  # hosts with address changes not yet reconciled
+        # source overlays by mapped address, learned addresses override the mappings
+        self.overlays: Dict[AddressAtNetwork, 'weakref.WeakSet[SourceOverlay]'] = {}
+
+    def mark_dirty(self, host: Addressable) -> None:
+        """Queue address update for host, it is processed on next reconcile"""
+        self.dirty_hosts[host] = None
+        self.generation += 1
+
+    def reconcile(self) -> None:
+        """Process queued host address updates"""
+        if not self.dirty_hosts:
+            return
+        dirty, self.dirty_hosts = self.dirty_hosts, {}
+        for host in dirty:
+            self.update_host(host)
 
-    def find_host(self, address: AnyAddress) -> Optional[Host]:
-        """Find host by address"""
+    def find_host(self, address: AnyAddress, overlay: Optional['SourceOverlay'] = None) -> Optional[Host]:
+        """Find host by address, optionally using source-specific address mappings"""
         host = address.get_host()
         networks = self.system.get_networks_for(host)
         for net in networks:
             addr_net = AddressAtNetwork(host, net)
-            clues = self.addresses.get(addr_net, [])
-            for clue in clues:
+            clues = overlay.get_clues(addr_net) if overlay else self.addresses.get(addr_net)
+            for clue in clues or ():
                 if isinstance(clue.entity, Host):
                     return clue.entity
         return None
@@ -35,20 +64,6 @@ class MatcherEngine:
         """Add host and its services to matching engine"""
         self.add_addressable(host.get_parent_host())
 
-    def add_address_mapping(self, address: AnyAddress, entity: Addressable) -> None:
-        """Add address mapping for entity beyond entity's own addresses"""
-        nets = entity.get_networks_for(address) or [self.system.get_default_network()]
-        for net in nets:
-            net_add = AddressAtNetwork(address, net)
-            clue = self.add_addressable(entity)
-            clue.addresses.add(net_add)
-            # clear old mappings for the address
-            self.addresses[net_add] = [clue]
-
-        if not entity.any_host:
-            # remove from wildcard hosts, if there
-            self.wildcard_hosts = [wc for wc in self.wildcard_hosts if wc.entity != entity or wc.multicast_source]
-
     def update_host(self, host: Addressable) -> None:
         """Notify engine of address update for host"""
         clue = self.endpoints.get(host)
@@ -67,11 +82,13 @@ class MatcherEngine:
                     # new address
                     clue.addresses.add(addr_net)
                     clue.soft_addresses.add(addr_net)
-                    # override old mappings for the address
+                    # override old mappings for the address, also the source-specific ones
                     for old_clue in self.addresses.get(addr_net, ()):
                         if old_clue != clue:
                             old_clue.addresses.remove(addr_net)
                     self.addresses[addr_net] = [clue]
+                    for overlay in self.overlays.pop(addr_net, ()):
+                        overlay.addresses.pop(addr_net, None)
                     additions = True
                 new_set.add(addr_net)
             for addr_net in list(clue.addresses):
@@ -86,7 +103,8 @@ class MatcherEngine:
 
         if additions and not host.any_host and not clue.addresses:
             # remove from wildcard hosts, if there, do not re-add
-            self.wildcard_hosts = [wc for wc in self.wildcard_hosts if wc.entity != host or wc.multicast_source]
+            if not clue.multicast_source:
+                self.remove_wildcard(clue)
 
     def add_connection(self, connection: Connection) -> Connection:
         """Add connection to matching engine"""
@@ -95,6 +113,7 @@ class MatcherEngine:
             return connection  # already added
         clue = ConnectionClue(connection)
         self.connections[connection] = clue
+        self.generation += 1
 
         self.add_addressable(connection.source)
         self.add_addressable(connection.target)
@@ -107,6 +126,10 @@ class MatcherEngine:
         assert target_end is not None, "Endpoint clue missing for connection target"
         target_end.target_for.append(clue)
 
+        target = connection.target
+        if isinstance(target, Service) and target.multicast_target:
+            listeners = self.multicast_listeners.setdefault(connection.source, {})
+            listeners.setdefault(target.multicast_target, []).append(connection)
         return connection
 
     def remove_connection(self, connection: Connection) -> None:
@@ -114,12 +137,25 @@ class MatcherEngine:
         clue = self.connections.pop(connection, None)
         if not clue:
             return  # not found
+        self.generation += 1
         source_end = self.endpoints.get(connection.source)
         if source_end:
             source_end.source_for.remove(clue)
         target_end = self.endpoints.get(connection.target)
         if target_end:
             target_end.target_for.remove(clue)
+        target = connection.target
+        if isinstance(target, Service) and target.multicast_target:
+            listeners = self.multicast_listeners.get(connection.source, {})
+            connections = listeners.get(target.multicast_target)
+            if connections and connection in connections:
+                connections.remove(connection)
+
+    def get_multicast_listeners(self, source: Addressable, address: AnyAddress) -> Iterator[Connection]:
+        """Get connections from source to listeners with multicast target matching the address"""
+        for target, connections in self.multicast_listeners.get(source, {}).items():
+            if target.is_match(address):
+                yield from connections
 
     def add_addressable(self, entity: Addressable) -> 'AddressClue':
         """Add addressable host or service"""
@@ -128,6 +164,7 @@ class MatcherEngine:
             return clue
         clue = AddressClue(entity)
         self.endpoints[entity] = clue
+        self.generation += 1
 
         parent = entity.get_parent_host()
         if parent != entity:
@@ -146,8 +183,6 @@ class MatcherEngine:
             if port_range:
                 # service matching range of ports
                 clue.port_ranges.append(port_range)
-                if parent_clue:  # -> add to parent list of services with port range
-                    parent_clue.services_range.append(clue)
 
         addresses = False
         for add in entity.addresses:
@@ -174,9 +209,14 @@ class MatcherEngine:
                         clue.addresses.add(add_net)
                 addresses = True
 
+        if port_range and parent_clue:
+            # add to parent index of services with port range, by protocols of the endpoints
+            for protocol in {p for p, _ in clue.endpoints}:
+                parent_clue.services_range.add(protocol, port_range, clue)
+
         if entity.any_host or not addresses or clue.multicast_source:
             # no addresses defined, add wildcard clue
-            self.wildcard_hosts.append(clue)
+            self.add_wildcard(clue)
 
         # ensure services are also added
         for c in entity.children:
@@ -185,67 +225,238 @@ class MatcherEngine:
 
         return clue
 
+    def add_wildcard(self, clue: 'AddressClue') -> None:
+        """Add wildcard clue, indexed by its endpoints, if any"""
+        clue.wildcard_order = self.wildcard_count
+        self.wildcard_count += 1
+        self.merged_wildcards.clear()
+        self.multicast_wildcards.clear()
+        if clue.port_ranges:
+            self.wildcard_ranges.append(clue)
+        elif clue.endpoints:
+            for ep_key in clue.endpoints:
+                self.wildcard_services.setdefault(ep_key, []).append(clue)
+        else:
+            self.wildcard_hosts.append(clue)
+
+    def remove_wildcard(self, clue: 'AddressClue') -> None:
+        """Remove wildcard clue, if it is one"""
+        if clue.wildcard_order < 0:
+            return
+        clue.wildcard_order = -1
+        self.merged_wildcards.clear()
+        self.multicast_wildcards.clear()
+        if clue in self.wildcard_ranges:
+            self.wildcard_ranges.remove(clue)
+        elif clue in self.wildcard_hosts:
+            self.wildcard_hosts.remove(clue)
+        for ep_key in clue.endpoints:
+            clues = self.wildcard_services.get(ep_key)
+            if clues and clue in clues:
+                clues.remove(clue)
+                if not clues:
+                    del self.wildcard_services[ep_key]
+
+    def get_wildcards(self, protocol: Protocol, port: int) -> List['AddressClue']:
+        """Get wildcard clues which may match protocol and port, in the order they were added"""
+        key = protocol, port
+        by_endpoint = self.wildcard_services.get(key)
+        if not self.wildcard_ranges:
+            if not by_endpoint:
+                return self.wildcard_hosts
+            if not self.wildcard_hosts:
+                return by_endpoint
+        elif not (self.wildcard_hosts or by_endpoint):
+            return self.wildcard_ranges
+        clues = self.merged_wildcards.get(key)
+        if clues is None:
+            # keep the order, it resolves ties in weights
+            buckets = [b for b in (self.wildcard_hosts, by_endpoint, self.wildcard_ranges) if b]
+            clues = sorted(itertools.chain(*buckets), key=lambda c: c.wildcard_order)
+            if len(self.merged_wildcards) >= 1024:
+                self.merged_wildcards.clear()  # keep bounded
+            self.merged_wildcards[key] = clues
+        return clues
+
+    def get_multicast_wildcards(self, address: AddressAtNetwork, protocol: Protocol, port: int) \
+            -> List['AddressClue']:
+        """Get wildcard clues which may match multicast address, protocol, and port, in the order they were added"""
+        key = address, protocol, port
+        clues = self.multicast_wildcards.get(key)
+        if clues is None:
+            clues = []
+            for clue in self.get_wildcards(protocol, port):
+                target = clue.multicast_source.get(address.network) if clue.multicast_source else None
+                if target is None or target.is_match(address.address):
+                    clues.append(clue)
+            if len(self.multicast_wildcards) >= 1024:
+                self.multicast_wildcards.clear()  # keep bounded
+            self.multicast_wildcards[key] = clues
+        return clues
+
+    def iterate_wildcards(self) -> Iterator['AddressClue']:
+        """Iterate all wildcard clues, in the order they were added"""
+        clues: Dict[AddressClue, None] = dict.fromkeys(self.wildcard_hosts)
+        for bucket in self.wildcard_services.values():
+            clues.update(dict.fromkeys(bucket))
+        clues.update(dict.fromkeys(self.wildcard_ranges))
+        return iter(sorted(clues, key=lambda c: c.wildcard_order))
+
     def __repr__(self) -> str:
         r = []
         for addr, clues in self.addresses.items():
             for clue in clues:
                 r.append(f"{addr} | {clue}")
-        for clue in self.wildcard_hosts:
+        for clue in self.iterate_wildcards():
             r.append(f"| {clue}")
         # for conn in self.connections.values():
         #     r.append(f"{conn}")
         return "\n".join(r)
 
 
-class MatchingState:
-    """Matching state"""
+class SourceOverlay:
+    """Evidence source -specific address mappings on top of the shared matcher engine"""
     def __init__(self, engine: MatcherEngine) -> None:
         self.engine = engine
-        self.values: Dict[Any, StateValue] = {}
+        self.addresses: Dict[AddressAtNetwork, List[AddressClue]] = {}
+        self.mapped: Set[AddressClue] = set()  # clues not used as wildcards with this source
+
+    def add_address_mapping(self, address: AnyAddress, entity: Addressable) -> None:
+        """Add address mapping for entity beyond entity's own addresses"""
+        clue = self.engine.add_addressable(entity)
+        nets = entity.get_networks_for(address) or [self.engine.system.get_default_network()]
+        for net in nets:
+            # mapping overrides the engine addresses, until the address is learned by a host
+            addr_net = AddressAtNetwork(address, net)
+            self.addresses[addr_net] = [clue]
+            overlays = self.engine.overlays.get(addr_net)
+            if overlays is None:
+                overlays = self.engine.overlays[addr_net] = weakref.WeakSet()  # dropped with the overlay
+            overlays.add(self)
+
+        if not entity.any_host and not clue.multicast_source:
+            # do not use as wildcard host, if it is one
+            self.mapped.add(clue)
+
+    def get_clues(self, address: AddressAtNetwork) -> Optional[List['AddressClue']]:
+        """Get address clues, source mappings first"""
+        clues = self.addresses.get(address)
+        if clues is None:
+            clues = self.engine.addresses.get(address)
+        return clues
+
+    def is_known(self, address: AddressAtNetwork) -> bool:
+        """Is the address known by mappings or by the engine?"""
+        return address in self.addresses or address in self.engine.addresses
+
+    def __repr__(self) -> str:
+        r = []
+        for addr, clues in self.addresses.items():
+            for clue in clues:
+                r.append(f"{addr} | {clue}")
+        return "\n".join(r)
 
-    def get(self, item: Any) -> 'StateValue':
-        """Get deduction value for item"""
-        return self.values.setdefault(item, StateValue())
 
-    def get_all_sorted(self) -> List[Tuple[Any, 'StateValue']]:
-        """Get all deduction values sorted by weight"""
-        return sorted(self.values.items(), key=lambda kv: -kv[1].weight)
+class MatchingState:
+    """Matching state"""
+    __slots__ = ("engine", "endpoints", "connections")
+
+    def __init__(self, engine: MatcherEngine) -> None:
+        self.engine = engine
+        self.endpoints: Dict[Addressable, StateValue] = {}
+        self.connections: Dict[Connection, ConnectionValue] = {}
+
+    def get(self, entity: Addressable) -> 'StateValue':
+        """Get deduction value for endpoint, create new if none"""
+        value = self.endpoints.get(entity)
+        if value is None:
+            value = self.endpoints[entity] = StateValue()
+        return value
+
+    def get_connection(self, connection: Connection) -> 'ConnectionValue':
+        """Get deduction value for connection, create new if none"""
+        value = self.connections.get(connection)
+        if value is None:
+            value = self.connections[connection] = ConnectionValue()
+        return value
+
+    def peek_connection(self, connection: Connection) -> 'ConnectionValue':
+        """Get deduction value for connection without creating it, do not modify the returned value"""
+        return self.connections.get(connection, NO_CONNECTION_VALUE)
+
+    def get_max_endpoint_weight(self) -> int:
+        """Get the largest weight of endpoints and connection ends"""
+        w = 0
+        for value in self.endpoints.values():
+            w = max(w, value.weight)
+        for c_value in self.connections.values():
+            w = max(w, c_value.source_weight, c_value.target_weight)
+        return w
 
     def __repr__(self) -> str:
         r = []
-        for key, value in sorted(self.values.items(), key=lambda kv: -kv[1].weight):
+        for key, value in sorted(self.endpoints.items(), key=lambda kv: -kv[1].weight):
             r.append(f"{value.weight:<3} {key} # {value.reference}")
+        for conn, c_value in sorted(self.connections.items(), key=lambda kv: -kv[1].weight):
+            r.append(f"{c_value.weight:<3} {conn} # {c_value.source_reference} {c_value.target_reference}")
         return "\n".join(r)
 
 
 class StateValue:
     """Matching state value"""
+    __slots__ = ("weight", "reference")
+
     def __init__(self) -> None:
         self.weight: int = 0
-        self.reference: Optional[Any] = None
+        self.reference: Optional[AddressAtNetwork] = None
 
     def __repr__(self) -> str:
         return f"{self.weight} # {self.reference}"
 
 
+class ConnectionValue:
+    """Matching state value for connection, weights kept separately for source and target ends"""
+    __slots__ = ("source_weight", "source_reference", "target_weight", "target_reference")
+
+    def __init__(self) -> None:
+        self.source_weight: int = 0
+        self.source_reference: Optional[AddressAtNetwork] = None
+        self.target_weight: int = 0
+        self.target_reference: Optional[AddressAtNetwork] = None
+
+    @property
+    def weight(self) -> int:
+        """Sum weight of the connection ends"""
+        return self.source_weight + self.target_weight
+
+    def __repr__(self) -> str:
+        return f"{self.source_weight}+{self.target_weight} # {self.source_reference} {self.target_reference}"
+
+
+# Shared value for connections without any deduction value
+NO_CONNECTION_VALUE = ConnectionValue()
+
+
 class AddressClue:
     """Address clue"""
     def __init__(self, entity: Addressable) -> None:
         self.entity = entity
         self.port_ranges: List[PortRange] = []
         self.services_by: Dict[Tuple[Protocol, int], AddressClue] = {}  # services by endpoints
-        self.services_range: List[AddressClue] = []                     # services with port ranges
+        self.services_range: PortRangeIndex[AddressClue] = PortRangeIndex()  # services with port ranges
         self.addresses: Set[AddressAtNetwork] = set()      # effective addresses
         self.soft_addresses: Set[AddressAtNetwork] = set() # addresses added/removed as we go
         self.endpoints: Set[Tuple[Protocol, int]] = set()  # only for services
         self.source_for: List[ConnectionClue] = []
         self.target_for: List[ConnectionClue] = []
         self.multicast_source: Dict[Network, MulticastTarget] = {}
+        self.wildcard_order = -1  # order of wildcard clues, -1 when not one
+        self.is_service = isinstance(entity, Service)
 
     def update(self, state: MatchingState, address: AddressAtNetwork, protocol: Protocol, port: int,
                multicast: bool = False, wildcard: bool = False) -> None:
         """Update state observing this host"""
-        is_service = isinstance(self.entity, Service)
+        is_service = self.is_service
         ep_key = (protocol, port)
         for pr in self.port_ranges or ():
             # use lowest port in range for matching
@@ -255,7 +466,7 @@ class AddressClue:
         if self.endpoints and ep_key not in self.endpoints:
             return  # this host/service does not have this endpoint
 
-        multicast_source = self.multicast_source.get(address.network)
+        multicast_source = self.multicast_source.get(address.network) if self.multicast_source else None
         multicast_match = False
         if multicast_source:
             assert is_service, "Multicast source only for services"
@@ -294,10 +505,10 @@ class AddressClue:
         for conn in self.target_for:
             conn.update(state, w, target=address)
         # check services
-        service_clue = self.services_by.get(ep_key)
+        service_clue = self.services_by.get(ep_key) if self.services_by else None
         if service_clue:
             service_clue.update(state, address, protocol, port, multicast, wildcard=wildcard)
-        for service_clue in self.services_range:
+        for service_clue in self.services_range.find(protocol, port) if self.services_range else ():
             service_clue.update(state, address, protocol, port, multicast, wildcard=wildcard)
 
     def __repr__(self) -> str:
@@ -323,14 +534,14 @@ class ConnectionClue:
     def update(self, state: MatchingState, weight: int,
                source: Optional[AddressAtNetwork] = None, target: Optional[AddressAtNetwork] = None) -> None:
         """Update state observing this connection"""
-        end_key = (target is not None, self.connection)
-        value = state.get(end_key)
-        if weight > value.weight:
-            value.weight = weight
-            value.reference = source or target
-        sum_value = state.get(self.connection)
-        ss, ts = state.get((True, self.connection)), state.get((False, self.connection))
-        sum_value.weight = ss.weight + ts.weight
+        value = state.get_connection(self.connection)
+        if target is None:
+            if weight > value.source_weight:
+                value.source_weight = weight
+                value.source_reference = source
+        elif weight > value.target_weight:
+            value.target_weight = weight
+            value.target_reference = target
 
     def __repr__(self) -> str:
         return f"{self.connection.long_name()}"
@@ -338,8 +549,9 @@ class ConnectionClue:
 
 class FlowMatcher:
     """Flow matcher"""
-    def __init__(self, engine: MatcherEngine, flow: Flow) -> None:
+    def __init__(self, engine: MatcherEngine, flow: Flow, overlay: Optional[SourceOverlay] = None) -> None:
         self.engine = engine
+        self.overlay = overlay or SourceOverlay(engine)
         self.system = engine.system
         self.flow = flow
         self.sources = MatchingState(engine)
@@ -351,7 +563,7 @@ class FlowMatcher:
                 # - with external IP, HW is the local router
                 # - with HW matching to endpoint, ignore IP, unless multicast/broadcast
                 is_multicast = flow.source[0].is_multicast()
-                use_ip = (AddressAtNetwork(flow.source[1], net) in engine.addresses or \
+                use_ip = (self.overlay.is_known(AddressAtNetwork(flow.source[1], net)) or \
                     engine.system.is_external(flow.source[1])) or is_multicast
                 use_hw = not use_ip
                 if use_ip:
@@ -364,7 +576,7 @@ class FlowMatcher:
 
                 # update by target
                 is_multicast = flow.target[0].is_multicast()
-                use_ip = (AddressAtNetwork(flow.target[1], net) in engine.addresses or \
+                use_ip = (self.overlay.is_known(AddressAtNetwork(flow.target[1], net)) or \
                     engine.system.is_external(flow.target[1])) or is_multicast
                 use_hw = not use_ip
                 if use_ip:
@@ -389,11 +601,18 @@ class FlowMatcher:
                     multicast: bool = False) -> None:
         """Map address to state"""
         # 1. Map by address
-        clues = self.engine.addresses.get(address)
+        clues = self.overlay.get_clues(address)
         for clue in clues or ():
             clue.update(state, address, protocol, port)
         # 2. Map the wildcard hosts
-        for clue in self.engine.wildcard_hosts:
+        mapped = self.overlay.mapped
+        if multicast:
+            wildcards = self.engine.get_multicast_wildcards(address, protocol, port)
+        else:
+            wildcards = self.engine.get_wildcards(protocol, port)
+        for clue in wildcards:
+            if clue in mapped:
+                continue  # source maps address for the host
             clue.update(state, address, protocol, port, multicast=multicast, wildcard=True)
 
     def get_connection(self) -> Connection | Tuple[Optional[Addressable], Optional[Addressable]]:
@@ -401,51 +620,42 @@ class FlowMatcher:
         if self.connection is not None:
             return self.connection
 
-        source_items = self.sources.get_all_sorted()
-        target_items = self.targets.get_all_sorted()
-
+        # NOTE: Single passes over the states, equal weights resolved by insertion order
         # max. endpoint weight
-        max_endpoint_weight = 0
-        for key, value in source_items:
-            if not isinstance(key, Connection):
-                max_endpoint_weight = value.weight
-                break
-        for key, value in target_items:
-            if not isinstance(key, Connection):
-                if value.weight > max_endpoint_weight:
-                    max_endpoint_weight = value.weight
-                    break
+        max_endpoint_weight = max(self.sources.get_max_endpoint_weight(), self.targets.get_max_endpoint_weight())
 
         # find connection with largest weight
         conn: Optional[Connection] = None
-        conn_weights: Dict[Connection, int] = {}
         ends: Optional[Tuple[AddressAtNetwork, AddressAtNetwork]] = None
         best_weight = 0
+        best_target_weight = 0
         reverse = False
-        # listing by target_items gives preference to target matches, when weights are equal
-        for key, _ in target_items:
-            if not isinstance(key, Connection) or key in conn_weights:
-                continue
+        # listing by target state gives preference to target matches, when weights are equal
+        for c_key, t_value in self.targets.connections.items():
             # request direction
-            sv, tv = self.sources.get((False, key)), self.targets.get((True, key))
-            weight = sv.weight + tv.weight if sv.weight > 0 and tv.weight > 0 else 0
+            sv = self.sources.peek_connection(c_key)
+            weight = sv.source_weight + t_value.target_weight \
+                if sv.source_weight > 0 and t_value.target_weight > 0 else 0
             # reverse direction
-            r_sv, r_tv = self.sources.get((True, key)), self.targets.get((False, key))
-            r_weight = r_sv.weight + r_tv.weight if r_sv.weight > 0 and r_tv.weight > 0 else 0
-            b_weight = conn_weights[key] = max(weight, r_weight)
-            if key.status != Status.EXPECTED and b_weight < max_endpoint_weight:
+            r_weight = sv.target_weight + t_value.source_weight \
+                if sv.target_weight > 0 and t_value.source_weight > 0 else 0
+            b_weight = max(weight, r_weight)
+            if c_key.status != Status.EXPECTED and b_weight < max_endpoint_weight:
                 # best expected connection used despite endpoint weights
                 # - an endpoint may not have any expected connections
                 continue
-            if b_weight <= best_weight:
+            if b_weight < best_weight or b_weight == 0:
                 continue  # not better than current best
+            if b_weight == best_weight and t_value.weight <= best_target_weight:
+                continue  # equally good, but weaker match for target state
             best_weight = b_weight
+            best_target_weight = t_value.weight
             reverse = weight < r_weight
             if not reverse:
-                ends = cast(Tuple[AddressAtNetwork, AddressAtNetwork], (sv.reference, tv.reference))
+                ends = cast(Tuple[AddressAtNetwork, AddressAtNetwork], (sv.source_reference, t_value.target_reference))
             else:
-                ends = cast(Tuple[AddressAtNetwork, AddressAtNetwork], (r_tv.reference, r_sv.reference))
-            conn = key
+                ends = cast(Tuple[AddressAtNetwork, AddressAtNetwork], (t_value.source_reference, sv.target_reference))
+            conn = c_key
 
         if conn:
             self.connection = conn
@@ -460,12 +670,13 @@ class FlowMatcher:
         first_end: Optional[Addressable] = None
         first_addr: Optional[AddressAtNetwork] = None
         best_weight = 0
-        for key, value in source_items + target_items:
-            if not isinstance(key, Addressable) or value.weight <= best_weight:
-                continue
-            first_end = key
-            first_addr = value.reference
-            best_weight = value.weight
+        for state in (self.sources, self.targets):
+            for key, value in state.endpoints.items():
+                if value.weight <= best_weight:
+                    continue
+                first_end = key
+                first_addr = value.reference
+                best_weight = value.weight
 
         if not first_end or not first_addr:
             # no endpoints found
@@ -479,19 +690,20 @@ class FlowMatcher:
         second_end: Optional[Addressable] = None
         second_addr: Optional[AddressAtNetwork] = None
         best_weight = 0
-        for key, value in source_items + target_items:
-            if not isinstance(key, Addressable) or value.weight <= best_weight:
-                continue
-            net_addr = value.reference
-            if not net_addr or not isinstance(net_addr, AddressAtNetwork):
-                continue
-            if (net_addr.address.get_host() in source_set) == is_first_source:
-                continue  # same side as first end
-            if key.get_parent_host() == first_end.get_parent_host():
-                continue  # same host as first end, cannot connect to self
-            second_end = key
-            second_addr = net_addr
-            best_weight = value.weight
+        for state in (self.sources, self.targets):
+            for key, value in state.endpoints.items():
+                if value.weight <= best_weight:
+                    continue
+                net_addr = value.reference
+                if not net_addr:
+                    continue
+                if (net_addr.address.get_host() in source_set) == is_first_source:
+                    continue  # same side as first end
+                if key.get_parent_host() == first_end.get_parent_host():
+                    continue  # same host as first end, cannot connect to self
+                second_end = key
+                second_addr = net_addr
+                best_weight = value.weight
 
         if is_first_source:
             self.end_addresses = (first_addr.address, second_addr.address if second_addr else None)
@@ -3,13 +3,14 @@
 import ipaddress
 import itertools
 import re
-from typing import List, Set, Optional, Tuple, TypeVar, Callable, Dict, Any, Self, Iterable, Iterator, Union
+from typing import AbstractSet, List, Set, Optional, Tuple, TypeVar, Callable, Dict, Any, Self, Iterable, Iterator, \
+    Union
 
-from toolsaf.core.address_ranges import MulticastTarget, PortRange
+from toolsaf.core.address_ranges import MulticastTarget, NetworkClassifier, PortRange
 from toolsaf.common.address import AnyAddress, Addresses, EndpointAddress, EntityTag, Network, Protocol, IPAddress, \
     DNSName, AddressSequence
 from toolsaf.common.basics import ConnectionType, ExternalActivity, HostType, Status
-from toolsaf.common.entity import Entity
+from toolsaf.common.entity import Entity, EntityList
 from toolsaf.common.property import PropertyKey
 from toolsaf.common.traffic import Flow, EvidenceSource
 from toolsaf.common.verdict import Verdict
@@ -79,7 +80,7 @@ class NodeComponent(Entity):
         super().__init__()
         self.entity = entity
         self.name = name
-        self.sub_components: List[NodeComponent] = []
+        self.sub_components: List[NodeComponent] = EntityList(self)
         self.status = Status.EXPECTED
         self.tag = EntityTag.new(name)
 
@@ -108,9 +109,10 @@ class NetworkNode(Entity):
         self.host_type = HostType.GENERIC
         self.description = ""
         self.match_priority = 0
-        self.children: List[Addressable] = []
-        self.components: List[NodeComponent] = []
+        self.children: List[Addressable] = EntityList(self)
+        self.components: List[NodeComponent] = EntityList(self)
         self.networks: List[Network] = []  # empty means 'same as parent'
+        self.network_classifier: Optional[NetworkClassifier] = None  # created on demand
         self.external_activity = ExternalActivity.BANNED
 
     def get_children(self) -> Iterable['Entity']:
@@ -158,11 +160,14 @@ class NetworkNode(Entity):
             return []
         if address.get_ip_address() is None:
             return [self.get_system().get_default_network()]
-        ns = []
-        for nw in self.networks:
-            if nw.is_local(address):
-                ns.append(nw)
-        return ns
+        return list(self.get_network_classifier().get_local_networks(address))
+
+    def get_network_classifier(self) -> NetworkClassifier:
+        """Get classifier for the networks of this node"""
+        c = self.network_classifier
+        if c is None or not c.is_valid_for(self.networks):
+            c = self.network_classifier = NetworkClassifier(self.networks)
+        return c
 
     def get_connections(self, relevant_only: bool=True) -> List[Connection]:
         """Get relevant conneciions, filter out dupes"""
@@ -231,14 +236,114 @@ class NetworkNode(Entity):
         return isinstance(self, Host)
 
 
+class AddressSet(Set[AnyAddress]):
+    """Set of addresses, which tells the owner about added and removed addresses"""
+    def __init__(self, owner: 'Addressable', addresses: Iterable[AnyAddress] = ()) -> None:
+        super().__init__()
+        self.owner = owner
+        self.update(addresses)
+
+    def add(self, element: AnyAddress) -> None:
+        if element not in self:
+            super().add(element)
+            self.owner.address_changed(element, added=True)
+
+    def discard(self, element: object) -> None:
+        if isinstance(element, AnyAddress) and element in self:
+            super().discard(element)
+            self.owner.address_changed(element, added=False)
+
+    def remove(self, element: AnyAddress) -> None:
+        super().remove(element)
+        self.owner.address_changed(element, added=False)
+
+    def pop(self) -> AnyAddress:
+        element = super().pop()
+        self.owner.address_changed(element, added=False)
+        return element
+
+    def clear(self) -> None:
+        for a in list(self):
+            self.discard(a)
+
+    def update(self, *s: Iterable[AnyAddress]) -> None:
+        for addresses in s:
+            for a in addresses:
+                self.add(a)
+
+    def difference_update(self, *s: Iterable[object]) -> None:
+        for addresses in s:
+            for a in list(addresses):
+                self.discard(a)
+
+    def intersection_update(self, *s: Iterable[Any]) -> None:
+        keep = set(self).intersection(*s)
+        for a in [a for a in self if a not in keep]:
+            self.discard(a)
+
+    def symmetric_difference_update(self, s: Iterable[AnyAddress]) -> None:
+        for a in set(s):
+            if a in self:
+                self.discard(a)
+            else:
+                self.add(a)
+
+    def __ior__(self, value: AbstractSet[AnyAddress]) -> Self:  # type: ignore[override,misc]
+        self.update(value)
+        return self
+
+    def __isub__(self, value: AbstractSet[object]) -> Self:
+        self.difference_update(value)
+        return self
+
+    def __iand__(self, value: AbstractSet[object]) -> Self:
+        self.intersection_update(value)
+        return self
+
+    def __ixor__(self, value: AbstractSet[AnyAddress]) -> Self:  # type: ignore[override,misc]
+        self.symmetric_difference_update(value)
+        return self
+
+
+class ConnectionList(EntityList[Connection]):
+    """List of host connections, which tells the system about changes"""
+    def added(self, entities: Iterable[Connection]) -> None:
+        cs = list(entities)
+        super().added(cs)
+        assert isinstance(self.owner, Host)
+        if isinstance(self.owner.parent, IoTSystem):
+            for c in cs:
+                self.owner.parent.connection_registry.add(c)
+
+    def removed(self) -> None:
+        super().removed()
+        assert isinstance(self.owner, Host)
+        if isinstance(self.owner.parent, IoTSystem):
+            self.owner.parent.connection_registry.invalidate()
+
+
 class Addressable(NetworkNode):
     """Addressable entity"""
     def __init__(self, name: str, parent: NetworkNode) -> None:
         super().__init__(name)
         self.parent = parent
-        self.addresses: Set[AnyAddress] = set()
+        self._addresses = AddressSet(self)
         self.any_host = False  # can be one or many hosts
 
+    @property
+    def addresses(self) -> Set[AnyAddress]:
+        """Addresses of the entity"""
+        return self._addresses
+
+    @addresses.setter
+    def addresses(self, value: Iterable[AnyAddress]) -> None:
+        new = set(value)
+        self._addresses.difference_update(self._addresses - new)
+        self._addresses.update(new)
+
+    def address_changed(self, address: AnyAddress, added: bool) -> None:
+        """Address added or removed"""
+
     def get_tag(self) -> Optional[AnyAddress]:
         """Get tag address, if any"""
         raise NotImplementedError()
@@ -364,7 +469,11 @@ class Host(Addressable):
         self.parent = parent
         self.networks = [] # follow parent
         self.ignore_name_requests: Set[DNSName] = set()
-        self.connections: List[Connection] = []  # connections terminating here
+        self.connections: List[Connection] = ConnectionList(self)  # connections terminating here
+
+    def address_changed(self, address: AnyAddress, added: bool) -> None:
+        if isinstance(self.parent, IoTSystem):
+            self.parent.index_address(self, address, added)
 
     def is_concrete(self) -> bool:
         """Is a concrete host, not any host, multicast or client side entity"""
@@ -377,33 +486,24 @@ class Host(Addressable):
 
     def get_connections(self, relevant_only: bool=True) -> List[Connection]:
         """Get relevant connections"""
-        cs = []
-        for c in self.connections:
-            if not relevant_only or c.is_relevant(ignore_ends=True):
-                cs.append(c)
-        cs.extend(super().get_connections(relevant_only))
-        return cs
+        # NOTE: Only hosts have connections, no need to check the children
+        if not relevant_only:
+            return list(self.connections)
+        return [c for c in self.connections if c.is_relevant(ignore_ends=True)]
 
     def find_connection(self, target: 'Addressable') -> Optional[Connection]:
         """Find connection to target"""
-        for c in self.connections:
-            if c.target == target:
-                return c
-        return None
+        return self.get_system().connection_registry.find(self, target)
 
     def get_parent_host(self) -> Self:
         return self
 
-    def get_verdict(self, cache: Dict[Entity, Verdict]) -> Verdict:
-        if self in cache:
-            return cache[self]
-        v = [super().get_verdict(cache)]
+    def aggregate_verdict(self, cache: Dict[Entity, Verdict]) -> Verdict:
+        v = [super().aggregate_verdict(cache)]
         for c in self.connections:
             if c.is_relevant():
                 v.append(c.get_verdict(cache))
-        rv = Verdict.aggregate(*v)
-        cache[self] = rv
-        return rv
+        return Verdict.aggregate(*v)
 
     def get_tag(self) -> Optional[EntityTag]:
         return Addresses.get_tag(self.addresses)
@@ -489,6 +589,94 @@ class Service(Addressable):
         return f"{self.status_string()} {self.parent.long_name()} {self.name}"
 
 
+class ConnectionRegistry:
+    """Connections of the system by source host and by target, with a cached list of all connections"""
+    def __init__(self, system: 'IoTSystem') -> None:
+        self.system = system
+        self.version = 0  # changed on every update
+        self.by_source: Dict[Host, Dict[Connection, None]] = {}
+        self.by_target: Dict[Addressable, Dict[Connection, None]] = {}
+        self.valid = True  # false when indices must be rebuilt
+        self.all_connections: List[Connection] = []
+        self.all_version: Tuple[int, int] = -1, 0  # version and host count for the cached list
+
+    def add(self, connection: Connection) -> None:
+        """Connection added to a host"""
+        self.version += 1
+        if self.valid:
+            self.by_source.setdefault(connection.source.get_parent_host(), {})[connection] = None
+            self.by_target.setdefault(connection.target, {})[connection] = None
+
+    def retarget(self, connection: Connection, target: 'Addressable') -> None:
+        """Change connection target"""
+        cs = self.by_target.get(connection.target)
+        if cs is not None:
+            cs.pop(connection, None)
+        connection.target = target
+        connection.invalidate_verdict()  # relevance may change
+        self.add(connection)
+
+    def invalidate(self) -> None:
+        """Connections removed, rebuild indices when next required"""
+        self.version += 1
+        self.valid = False
+
+    def _check_indices(self) -> None:
+        if self.valid:
+            return
+        self.by_source.clear()
+        self.by_target.clear()
+        self.valid = True
+        for h in self.system.get_hosts():
+            for c in h.connections:
+                self.add(c)
+
+    def find(self, source: Host, target: 'Addressable') -> Optional[Connection]:
+        """Find connection from source host to target"""
+        self._check_indices()
+        for c in self.by_target.get(target, ()):
+            if c in self.by_source.get(source, ()):
+                return c
+        return None
+
+    def get_by_source(self, source: Host) -> List[Connection]:
+        """Get connections from source host"""
+        self._check_indices()
+        return list(self.by_source.get(source, ()))
+
+    def get_by_target(self, target: 'Addressable') -> List[Connection]:
+        """Get connections to target"""
+        self._check_indices()
+        return list(self.by_target.get(target, ()))
+
+    def get_connections(self, relevant_only: bool=True) -> List[Connection]:
+        """Get connections of all hosts, filter out dupes"""
+        version = self.version, len(self.system.children)
+        if self.all_version != version:
+            self.all_connections = NetworkNode.get_connections(self.system, relevant_only=False)
+            self.all_version = version
+        if not relevant_only:
+            return list(self.all_connections)
+        return [c for c in self.all_connections if c.is_relevant(ignore_ends=True)]
+
+
+class HostList(EntityList[Addressable]):
+    """List of system hosts, which keeps the hosts by address index in sync"""
+    def added(self, entities: Iterable[Addressable]) -> None:
+        hs = list(entities)
+        super().added(hs)
+        assert isinstance(self.owner, IoTSystem)
+        for h in hs:
+            if isinstance(h, Host):
+                for a in h.addresses:
+                    self.owner.index_address(h, a, added=True)
+
+    def removed(self) -> None:
+        super().removed()
+        assert isinstance(self.owner, IoTSystem)
+        self.owner.reindex_addresses()
+
+
 class IoTSystem(NetworkNode):
     """An IoT system"""
     def __init__(self, name: str="IoT system") -> None:
@@ -506,6 +694,11 @@ class IoTSystem(NetworkNode):
 
         # observed connections and replies
         self.connections: Dict[Tuple[AnyAddress, AnyAddress], Connection] = {}
+        # hosts by address, including DNS names and tags
+        self.hosts_by_address: Dict[AnyAddress, Dict[Host, None]] = {}
+        self.children = HostList(self)
+        # connections by source host and by target
+        self.connection_registry = ConnectionRegistry(self)
 
         # Tag used to identify uploaded security statements
         self.upload_tag: Optional[str] = None
@@ -525,12 +718,12 @@ class IoTSystem(NetworkNode):
             if c.status != Status.PLACEHOLDER:
                 yield c
 
+    def get_connections(self, relevant_only: bool=True) -> List[Connection]:
+        return self.connection_registry.get_connections(relevant_only)
+
     def is_external(self, address: AnyAddress) -> bool:
         """Is an external network address?"""
-        for nw in self.networks:
-            if nw.is_local(address):
-                return False
-        return True
+        return not self.get_network_classifier().get_local_networks(address)
 
     def learn_named_address(self, name: Union[DNSName, EntityTag],
                             address: Optional[AnyAddress]) -> Tuple[Optional[Host], bool]:
@@ -557,13 +750,11 @@ class IoTSystem(NetworkNode):
                     return endpoint, False  # Did not add name to host (why?)
 
         # find relevant hosts
-        named = None
+        named_hosts = self.get_hosts_by_address(name)
+        named = named_hosts[-1] if named_hosts else None
         by_ip: List[Host] = []
-        for h in self.get_hosts():
-            if name in h.addresses:
-                named = h
-            elif address and address in h.addresses:
-                by_ip.append(h)
+        if address:
+            by_ip = [h for h in self.get_hosts_by_address(address) if name not in h.addresses]
         assert len(by_ip) < 2, f"Multiple hosts with address {address}"
         add = by_ip[0] if by_ip else None
 
@@ -601,7 +792,9 @@ class IoTSystem(NetworkNode):
 
         if len(named.addresses) == 1:
             # named host has no IP addresses, remove it and use the other
-            self.children.remove(named)
+            self.children.remove(named)  # also removed from the address index
+            if named.connections:
+                self.connection_registry.invalidate()
             add.addresses.add(name)
             return add, True
 
@@ -622,11 +815,39 @@ class IoTSystem(NetworkNode):
                 host.name = self.free_child_name(nn)
         self.call_listeners(lambda ln: ln.address_change(host))
 
-        for h in self.get_hosts():
-            if h != host and ip_address in h.addresses:
+        for h in self.get_hosts_by_address(ip_address):
+            if h != host:
                 h.addresses.discard(ip_address)
                 self.call_listeners(lambda ln: ln.address_change(h))  # pylint: disable=cell-var-from-loop
 
+    def index_address(self, host: Host, address: AnyAddress, added: bool) -> None:
+        """Update hosts by address index"""
+        hosts = self.hosts_by_address.get(address)
+        if added:
+            if hosts is None:
+                hosts = self.hosts_by_address[address] = {}
+            hosts[host] = None
+        elif hosts is not None:
+            hosts.pop(host, None)
+            if not hosts:
+                del self.hosts_by_address[address]
+
+    def reindex_addresses(self) -> None:
+        """Rebuild hosts by address index, e.g. after hosts are removed"""
+        self.hosts_by_address.clear()
+        for h in self.get_hosts():
+            for a in h.addresses:
+                self.index_address(h, a, added=True)
+
+    def get_hosts_by_address(self, address: Optional[AnyAddress]) -> List[Host]:
+        """Get hosts with the address, in the order of hosts"""
+        hosts = self.hosts_by_address.get(address) if address else None
+        if not hosts:
+            return []
+        if len(hosts) == 1:
+            return list(hosts)
+        return [h for h in self.get_hosts() if h in hosts]
+
     def get_system(self) -> Self:
         return self
 
@@ -659,17 +880,13 @@ class IoTSystem(NetworkNode):
 
         h_add = address.get_host()
         network = at_network or self.get_default_network()
-        e: Optional[Addressable]
-        for e in self.children:
+        for e in self.get_hosts_by_address(h_add):
             if e.networks and network not in e.networks:
                 continue  # not in the right network
-            if h_add in e.addresses:
-                if isinstance(address, EndpointAddress):
-                    e = e.find_endpoint(address) or e
-                break
-        else:
-            e = None
-        return e
+            if isinstance(address, EndpointAddress):
+                return e.find_endpoint(address) or e
+            return e
+        return None
 
     def find_entity(self, address: AnyAddress) -> Optional[Entity]:
         if not isinstance(address, AddressSequence):
@@ -684,9 +901,17 @@ class IoTSystem(NetworkNode):
             target = self.find_endpoint(address.tail().segments[0].address)
             if not source or not target:
                 return None
-            if isinstance(source, Addressable):
-                for connection in source.get_parent_host().get_connections():
-                    if connection.target == target:
+            if isinstance(source, Addressable) and isinstance(target, Addressable):
+                host = source.get_parent_host()
+                connections = [c for c in self.connection_registry.get_by_target(target)
+                               if host in (c.source.get_parent_host(), c.target.get_parent_host())]
+                for connection in connections:
+                    if connection.is_relevant(ignore_ends=True):
+                        return connection
+                # Unlike before traffic volumes, also not relevant connections are found, as traffic
+                # property events are serialized for external connections, too. Placeholders are never found.
+                for connection in connections:
+                    if connection.status != Status.PLACEHOLDER:
                         return connection
         else:
             if (endpoint := self.find_endpoint(segment.address)):
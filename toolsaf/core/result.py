@@ -169,6 +169,13 @@ class Report:
             }
         return properties
 
+    def _print_partial_notes(self, writer: TextIO) -> None:
+        """Print notes about partially used data, e.g. sampled captures"""
+        for key in sorted(self.system.properties):
+            value = self.system.properties[key]
+            if key.segments[:2] == Properties.PARTIAL.segments and isinstance(value, PropertyVerdictValue):
+                writer.write(f"{self.yellow}{'Partial results:':<20}{value.explanation}{self.reset}\n")
+
     def _crop_text(self, text: str, lead: str, indent: int) -> str:
         """Crop text that would be longer than the terminal's width"""
         if self.show_all or self.no_truncate:
@@ -330,7 +337,12 @@ class Report:
 
         hosts = [host for host in self.system.get_hosts() if host.is_relevant()]
         for host in hosts:
-            host.get_verdict(cache)
+            # verdicts are maintained by entities, collect all which make up the host verdict
+            for entity in host.iterate(relevant_only=False):
+                entity.get_verdict(cache)
+            for connection in host.connections:
+                if connection.is_relevant():
+                    connection.get_verdict(cache)
 
         connections = self.system.get_connections(relevant_only=relevant_only)
         for connection in connections:
@@ -340,6 +352,7 @@ class Report:
         system_verdict = self.get_system_verdict(cache)
         self.print_title(f"{self.bold}{'Verdict:':<20}System:{self.reset}", writer, "=", "-")
         self._print_text(self.system.long_name(), system_verdict.value, "", writer, use_bold=True)
+        self._print_partial_notes(writer)
         system_properties = self._get_properties(self.system)
         if system_properties:
             self._print_host_structure(0, system_properties, writer, lead="│  ")
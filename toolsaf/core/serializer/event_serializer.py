@@ -11,7 +11,7 @@ from toolsaf.common.address import (
 from toolsaf.common.property import PropertyKey, PropertyVerdictValue, PropertySetValue
 from toolsaf.common.traffic import (
     Event, Evidence, EvidenceSource, Flow, EthernetFlow,
-    IPFlow, BLEAdvertisementFlow, HostScan, ServiceScan
+    IPFlow, BLEAdvertisementFlow, HostScan, ServiceScan, TrafficVolume
 )
 from toolsaf.common.verdict import Verdict
 from toolsaf.core.event_interface import PropertyAddressEvent, PropertyEvent
@@ -98,6 +98,13 @@ class EventSerializer:
         elif isinstance(value, PropertySetValue):
             val["sub_keys"] = [k.get_name() for k in value.sub_keys]
             val["explanation"] = value.explanation
+        elif isinstance(value, TrafficVolume):
+            val["traffic"] = {
+                "packets": value.packets,
+                "bytes": value.bytes,
+                "first": value.first.isoformat(),
+                "last": value.last.isoformat(),
+            }
         return key.get_name(), val
 
     def _serialize_evidence_source(self, source: EvidenceSource, source_id: str) -> Dict[str, Any]:
@@ -237,19 +244,31 @@ class EventSerializer:
         return data
 
 
+class TrafficVolumeDTO(BaseDTO):
+    """DTO for traffic volume"""
+    packets: int
+    bytes: int
+    first: datetime.datetime
+    last: datetime.datetime
+
+
 class PropEventValueDTO(BaseDTO):
     """DTO for propery event value"""
     verdict: Optional[Verdict] = None
     sub_keys: Optional[List[PropertyKey]] = None
+    traffic: Optional[TrafficVolumeDTO] = None
     explanation: DescriptionType = ""
 
-    def to_model(self) -> PropertyVerdictValue | PropertySetValue:
-        """Create a PropertyVerdictValue or PropertySetValue from this DTO"""
+    def to_model(self) -> PropertyVerdictValue | PropertySetValue | TrafficVolume:
+        """Create a PropertyVerdictValue, PropertySetValue, or TrafficVolume from this DTO"""
         if self.verdict is not None:
             return PropertyVerdictValue(self.verdict, self.explanation)
         if self.sub_keys is not None:
             return PropertySetValue(set(self.sub_keys), self.explanation)
-        raise ValueError("PropEventValueDTO must have either verdict or sub_keys")
+        if self.traffic is not None:
+            t = self.traffic
+            return TrafficVolume(t.packets, t.bytes, t.first, t.last)
+        raise ValueError("PropEventValueDTO must have verdict, sub_keys, or traffic")
 
 
 class AddressMapEntryDTO(BaseDTO):
@@ -0,0 +1,69 @@
+"""Table of seen sessions for detecting new flow directions"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Hashable, Optional
+
+from toolsaf.common.traffic import Flow
+from toolsaf.core.model import Connection
+
+
+class SessionTable:
+    """Seen sessions, i.e. connection flows in request or reply direction.
+    By default, a session is a distinct flow and sessions are never removed."""
+    def __init__(self, limit: int = 0, timeout: Optional[timedelta] = None, ephemeral_ports: int = 0) -> None:
+        self.limit = limit                      # maximum number of sessions, 0 for no limit
+        self.timeout = timeout                  # sessions idle for timeout are removed
+        self.ephemeral_ports = ephemeral_ports  # client ports from this on are normalized, 0 for none
+        self.sessions: OrderedDict[Hashable, Optional[datetime]] = OrderedDict()  # by last use
+        self.evicted = 0  # sessions removed due limit or timeout
+
+    def session_key(self, connection: Connection, flow: Flow, reply: bool) -> Hashable:
+        """Get session key for flow"""
+        if not self.ephemeral_ports:
+            return flow
+        source_port, target_port = flow.port(False), flow.port(True)
+        if reply:
+            target_port = 0 if target_port >= self.ephemeral_ports else target_port
+        else:
+            source_port = 0 if source_port >= self.ephemeral_ports else source_port
+        return connection, reply, flow.protocol, flow.network, flow.stack(False), source_port, \
+            flow.stack(True), target_port
+
+    def is_new(self, connection: Connection, flow: Flow, reply: bool) -> bool:
+        """Check if flow starts a new session, and add or refresh the session"""
+        key = self.session_key(connection, flow, reply)
+        timestamp = flow.timestamp
+        if key in self.sessions:
+            if not (self.limit or self.timeout):
+                return False  # nothing to refresh
+            last = self.sessions[key]
+            if not (self.timeout and last and timestamp and timestamp - last > self.timeout):
+                self.sessions[key] = timestamp or last
+                self.sessions.move_to_end(key)
+                return False
+            del self.sessions[key]  # expired
+            self.evicted += 1
+        self.sessions[key] = timestamp
+        self.expire(timestamp)
+        return True
+
+    def expire(self, timestamp: Optional[datetime]) -> None:
+        """Remove sessions over the limit and sessions idle for timeout"""
+        while self.limit and len(self.sessions) > self.limit:
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+        if not (self.timeout and timestamp):
+            return
+        while self.sessions:
+            last = next(iter(self.sessions.values()))
+            if not last or timestamp - last <= self.timeout:
+                break
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __repr__(self) -> str:
+        return f"{len(self.sessions)} sessions, {self.evicted} evicted"